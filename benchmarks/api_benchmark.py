@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency benchmark for commandify's request paths, run against a
+local stub Gemini server (benchmarks/stub_gemini.py) so results don't depend
+on the network or on API quota.
+
+Scenarios:
+  translate.miss / translate.stream   get_linux_command with a model call
+  translate.hit                       get_linux_command served from the cache
+  suggest.exact / suggest.prefix      get_command_suggestions table and prefix branches (cache cleared)
+  suggest.fallback                    get_command_suggestions model branch
+  suggest.hit                         get_command_suggestions served from the cache
+  startup.quick                       `main.py <prompt>` in a subprocess until it exits (cached answer)
+
+Prints one JSON document (per-scenario p50/p95/p99 in ms and the error rate).
+The report also includes requests per model (descriptions go to the light
+model), how many requests were hedged and the metered tokens per code path.
+--output appends it as a JSON line. --baseline compares the p50s with an
+earlier result and exits 1 if any scenario is slower by more than --tolerance.
+
+    python3 benchmarks/api_benchmark.py --iterations 50 --latency 80
+    python3 benchmarks/api_benchmark.py --error-rate 0.1 --output api.jsonl
+    python3 benchmarks/api_benchmark.py --baseline last-release.json
+    python3 benchmarks/api_benchmark.py --slow-rate 0.05 --slow-ms 2000 --hedge 0   # tail without hedging
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_gemini import StubGeminiServer  # noqa: E402
+
+SCENARIOS = ['translate.miss', 'translate.stream', 'translate.hit', 'suggest.exact', 'suggest.prefix',
+             'suggest.fallback', 'suggest.hit', 'startup.quick']
+
+
+def measure(func, iterations):
+    """Calls func(i) iterations times; returns (durations in ms, error count)."""
+    durations, errors = [], 0
+    for i in range(iterations):
+        start = time.perf_counter()
+        try:
+            ok = func(i)
+        except Exception:
+            ok = False
+        durations.append((time.perf_counter() - start) * 1000)
+        errors += not ok
+    return durations, errors
+
+
+def run_scenarios(selected, iterations, env):
+    # Imported only after the environment points at the stub server and a scratch cache
+    import gemini_api
+    from tracing import summarize
+    from local_index import get_index
+    from command_index import get_command_index
+
+    warmup_start = time.perf_counter()
+    get_index(wait=True)
+    get_command_index()
+    warmup_ms = (time.perf_counter() - warmup_start) * 1000
+    # Unique prompts carry a token with digits, so the similarity cache can't match them to each other
+    run_id = int(time.time() * 1000)
+
+    def uncached(func):
+        def call(i):
+            gemini_api.get_cache().clear()
+            return func(i)
+        return call
+
+    scenarios = {
+        'translate.miss': lambda i: bool(gemini_api.get_linux_command(f"benchmark translate-miss-{run_id}-{i}")),
+        'translate.stream': lambda i: bool(gemini_api.get_linux_command(f"benchmark translate-stream-{run_id}-{i}", on_chunk=lambda partial: None)),
+        'translate.hit': lambda i: bool(gemini_api.get_linux_command("benchmark cached prompt")),
+        'suggest.exact': uncached(lambda i: bool(gemini_api.get_command_suggestions('ls'))),
+        'suggest.prefix': uncached(lambda i: bool(gemini_api.get_command_suggestions('gi'))),
+        'suggest.fallback': lambda i: bool(gemini_api.get_command_suggestions(f"benchmark suggest-fallback-{run_id}-{i}")),
+        'suggest.hit': lambda i: bool(gemini_api.get_command_suggestions("benchmark cached suggestions")),
+        'startup.quick': lambda i: quick_mode(env),
+    }
+    # Hit scenarios (and quick mode, which reuses the cached translation) get one untimed call first
+    primers = {
+        'translate.hit': scenarios['translate.hit'],
+        'suggest.hit': scenarios['suggest.hit'],
+        'startup.quick': scenarios['translate.hit'],
+    }
+    results = {}
+    for name in selected:
+        if name in primers:
+            primers[name](0)
+        durations, errors = measure(scenarios[name], iterations)
+        stats = summarize({name: durations})[name]
+        stats['errors'] = errors
+        stats['error_rate'] = round(errors / iterations, 4) if iterations else 0.0
+        results[name] = stats
+    hedging = {tier: backend.stats() for tier, backend in gemini_api._BACKENDS.items() if hasattr(backend, 'stats')}
+    import metering
+    usage = {key.replace('\t', ' '): counts for key, counts in metering.load_totals().get('series', {}).items()}
+    return results, round(warmup_ms, 3), hedging, usage
+
+
+def quick_mode(env):
+    """Runs `main.py "benchmark cached prompt"` and cancels at the first prompt."""
+    result = subprocess.run([sys.executable, os.path.join(SRC, 'main.py'), 'benchmark cached prompt'],
+                            env=env, input='c\n', text=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+
+def compare(results, baseline, tolerance):
+    """Returns [(scenario, baseline p50, current p50)] for scenarios slower than baseline * (1 + tolerance)."""
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before and stats['p50'] > before['p50'] * (1 + tolerance):
+            regressions.append((name, before['p50'], stats['p50']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20, help='calls per scenario (default: 20)')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='run only these scenarios (repeatable)')
+    parser.add_argument('--latency', type=float, default=50.0, help='stub server latency in ms (default: 50)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform +/- jitter in ms')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='fraction of requests that take --slow-ms longer')
+    parser.add_argument('--slow-ms', type=float, default=0.0, help='extra latency of slow requests in ms')
+    parser.add_argument('--hedge', default='1', help='COMMANDIFY_HEDGE for the run (default: 1, 0 disables hedging)')
+    parser.add_argument('--hedge-budget', help='COMMANDIFY_HEDGE_BUDGET in seconds (default: rolling p95)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status for injected errors (default: 503)')
+    parser.add_argument('--payloads', help='JSON file mapping prompt substrings to response texts')
+    parser.add_argument('--rpm', default='0', help='COMMANDIFY_RPM for the run (default: 0, limiter off)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for jitter and errors')
+    parser.add_argument('--output', help='append the result as a JSON line to this file')
+    parser.add_argument('--baseline', help='earlier result (JSON or the last line of a JSONL file) to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p50 slowdown vs the baseline (default: 0.2)')
+    args = parser.parse_args()
+
+    payloads = {}
+    if args.payloads:
+        with open(args.payloads) as f:
+            payloads = json.load(f)
+    selected = args.scenario or SCENARIOS
+
+    server = StubGeminiServer(latency_ms=args.latency, jitter_ms=args.jitter, error_rate=args.error_rate,
+                              error_status=args.error_status, payloads=payloads, seed=args.seed,
+                              slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+    with tempfile.TemporaryDirectory() as home, server:
+        with open(os.path.join(home, '.gemini_api_key'), 'w') as f:
+            f.write('benchmark-key')
+        env = dict(os.environ, HOME=home, COMMANDIFY_CACHE_DIR=os.path.join(home, 'cache'),
+                   COMMANDIFY_GEMINI_URL=server.url, COMMANDIFY_BACKEND='gemini', COMMANDIFY_RPM=args.rpm,
+                   COMMANDIFY_DAEMON='0', COMMANDIFY_PREFETCH='0', COMMANDIFY_TRACE='0', COMMANDIFY_HEDGE=args.hedge)
+        if args.hedge_budget:
+            env['COMMANDIFY_HEDGE_BUDGET'] = args.hedge_budget
+        os.environ.update(env)
+        results, warmup_ms, hedging, usage = run_scenarios(selected, args.iterations, env)
+        requests_served, errors_injected, models = server.requests, server.errors, dict(server.models)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'config': {'iterations': args.iterations, 'latency_ms': args.latency, 'jitter_ms': args.jitter,
+                   'error_rate': args.error_rate, 'error_status': args.error_status, 'rpm': args.rpm,
+                   'slow_rate': args.slow_rate, 'slow_ms': args.slow_ms, 'hedge': args.hedge,
+                   'hedge_budget': args.hedge_budget},
+        'warmup_ms': warmup_ms,
+        'stub_requests': requests_served,
+        'stub_errors_injected': errors_injected,
+        'stub_requests_per_model': models,
+        'hedging': hedging,
+        'usage': usage,
+        'scenarios': results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(report) + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines = [line for line in f.read().splitlines() if line.strip()]
+        try:
+            baseline = json.loads('\n'.join(lines))
+        except ValueError:
+            baseline = json.loads(lines[-1])
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after in regressions:
+            sys.stderr.write(f"REGRESSION {name}: p50 {before:.1f} ms -> {after:.1f} ms\n")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
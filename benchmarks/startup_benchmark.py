@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Cold/warm startup benchmark for commandify.
+
+Runs `main.py --startup-profile --json` (or a built binary) repeatedly and reports
+time-to-first-prompt. The first run starts cold: bytecode caches and the on-disk
+suggestion cache are removed. Later runs are warm. Use --output to append the summary
+as one JSON line, so results can be tracked across releases.
+
+    python3 benchmarks/startup_benchmark.py --runs 10
+    python3 benchmarks/startup_benchmark.py --binary dist/commandify/commandify --output startup.jsonl
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+
+
+def run_once(command, env):
+    start = time.perf_counter()
+    result = subprocess.run(command, env=env, check=True, text=True, stdout=subprocess.PIPE)
+    wall = (time.perf_counter() - start) * 1000
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['wall_ms'] = round(wall, 3)
+    return report
+
+
+def summarize(samples, key):
+    values = sorted(sample[key] for sample in samples)
+    return {
+        'min': round(values[0], 3),
+        'median': round(statistics.median(values), 3),
+        'max': round(values[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='number of warm runs (default: 10)')
+    parser.add_argument('--binary', help='benchmark a built binary instead of src/main.py')
+    parser.add_argument('--output', help='append the summary as a JSON line to this file')
+    args = parser.parse_args()
+
+    command = [args.binary] if args.binary else [sys.executable, os.path.join(SRC, 'main.py')]
+    command += ['--startup-profile', '--json']
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, COMMANDIFY_CACHE_DIR=cache_dir)
+        # Cold run: no bytecode cache, no suggestion cache
+        shutil.rmtree(os.path.join(SRC, '__pycache__'), ignore_errors=True)
+        cold = run_once(command, env)
+        warm = [run_once(command, env) for _ in range(args.runs)]
+
+    summary = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'command': ' '.join(command),
+        'python': sys.version.split()[0],
+        'cold': {'time_to_first_prompt_ms': cold['time_to_first_prompt_ms'], 'wall_ms': cold['wall_ms']},
+        'warm': {
+            'runs': args.runs,
+            'time_to_first_prompt_ms': summarize(warm, 'time_to_first_prompt_ms'),
+            'wall_ms': summarize(warm, 'wall_ms'),
+        },
+    }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+
+
+if __name__ == '__main__':
+    main()
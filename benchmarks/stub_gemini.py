@@ -0,0 +1,170 @@
+"""
+Local stand-in for the Gemini generateContent API, used by the benchmarks.
+
+Serves `POST /<model>:generateContent` and `POST /<model>:streamGenerateContent?alt=sse`
+with configurable latency, jitter, slow-request tail, error rate and payloads. Point commandify at
+it with COMMANDIFY_GEMINI_URL=<server.url>.
+
+    with StubGeminiServer(latency_ms=80, error_rate=0.05) as server:
+        os.environ['COMMANDIFY_GEMINI_URL'] = server.url
+        ...
+
+Answers are chosen from the prompt: translation prompts get a command,
+suggestion prompts a JSON list, description prompts a short sentence or a
+JSON map. `payloads` ({prompt substring: response text}) overrides them.
+"""
+import collections
+import http.server
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+
+DEFAULT_SUGGESTIONS = [
+    {'cmd': 'ls -la', 'desc': 'List all files with details'},
+    {'cmd': 'ls -lh', 'desc': 'List files with human-readable sizes'},
+    {'cmd': 'ls -lt', 'desc': 'List files sorted by modification time'},
+    {'cmd': 'ls -R', 'desc': 'List files recursively'},
+    {'cmd': 'find . -maxdepth 1', 'desc': 'List entries in the current directory'},
+]
+
+
+def default_response(prompt):
+    if prompt.startswith('Convert the following English instruction'):
+        return 'ls -la'
+    if 'Suggest 5 alternative' in prompt:
+        return json.dumps(DEFAULT_SUGGESTIONS)
+    if prompt.startswith('For each of the following Linux commands'):
+        names = re.findall(r'^- (.+)$', prompt, re.MULTILINE)
+        return json.dumps({name: f"Runs {name}" for name in names})
+    if prompt.startswith('What does the Linux command'):
+        return 'Runs the command'
+    return 'echo stub'
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class StubGeminiServer:
+    """Threaded HTTP/1.1 (keep-alive) Gemini stand-in on 127.0.0.1."""
+
+    def __init__(self, latency_ms=50.0, jitter_ms=0.0, error_rate=0.0, error_status=503,
+                 payloads=None, stream_chunks=3, seed=None, slow_rate=0.0, slow_ms=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # A fraction of requests (slow_rate) take slow_ms longer: the tail that hedging targets
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.payloads = payloads or {}
+        self.stream_chunks = max(1, stream_chunks)
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.models = collections.Counter()  # requests per model name in the URL
+        self._lock = threading.Lock()
+        self._server = None
+
+    def respond(self, prompt):
+        for needle, text in self.payloads.items():
+            if needle in prompt:
+                return text
+        return default_response(prompt)
+
+    def _delay(self, model):
+        with self._lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            if self.slow_rate and self.random.random() < self.slow_rate:
+                jitter += self.slow_ms
+            fail = self.random.random() < self.error_rate
+            self.requests += 1
+            self.errors += fail
+            self.models[model] += 1
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000)
+        return fail
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type='application/json', headers=()):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                try:
+                    self.end_headers()
+                    self.wfile.write(data)
+                except ConnectionError:
+                    self.close_connection = True  # the client gave up (its deadline passed)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                try:
+                    prompt = json.loads(body)['contents'][0]['parts'][0]['text']
+                except (ValueError, KeyError, IndexError, TypeError):
+                    self._send(400, json.dumps({'error': {'code': 400, 'message': 'bad request'}}))
+                    return
+                if stub._delay(self.path.rsplit('/', 1)[-1].split(':', 1)[0]):
+                    headers = [('Retry-After', '0')] if stub.error_status == 429 else []
+                    self._send(stub.error_status, json.dumps({'error': {'code': stub.error_status}}), headers=headers)
+                    return
+                text = stub.respond(prompt)
+                # Rough token counts (~4 characters per token), reported like Gemini's usageMetadata
+                usage = {'promptTokenCount': len(prompt) // 4 + 1, 'candidatesTokenCount': len(text) // 4 + 1}
+                usage['totalTokenCount'] = usage['promptTokenCount'] + usage['candidatesTokenCount']
+                if ':streamGenerateContent' not in self.path:
+                    self._send(200, json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}],
+                                                'usageMetadata': usage}))
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                size = max(1, -(-len(text) // stub.stream_chunks))
+                try:
+                    for start in range(0, len(text), size):
+                        event = {'candidates': [{'content': {'parts': [{'text': text[start:start + size]}]}}],
+                                 'usageMetadata': usage}
+                        data = f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8')
+                        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                        self.wfile.flush()
+                    self.wfile.write(b'0\r\n\r\n')
+                except ConnectionError:
+                    self.close_connection = True  # the client dropped the stream (e.g. a hedged duplicate lost)
+
+        return Handler
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
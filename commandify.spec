@@ -0,0 +1,41 @@
+# -*- mode: python ; coding: utf-8 -*-
+# PyInstaller build for commandify:  pyinstaller commandify.spec
+#
+# Builds a one-folder bundle (dist/commandify/) instead of a onefile binary, so
+# nothing is unpacked into /tmp/_MEI* on every launch. Ship the whole folder
+# (e.g. as commandify-linux-x64.tar.gz) and point the alias at dist/commandify/commandify.
+
+a = Analysis(
+    ['src/main.py'],
+    pathex=['src'],
+    binaries=[],
+    datas=[],
+    hiddenimports=[],
+    hookspath=[],
+    runtime_hooks=[],
+    # Not used at runtime; listed in requirements.txt only for other tooling
+    excludes=['tkinter', 'google', 'google.auth', 'PyInstaller'],
+    noarchive=False,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='commandify',
+    debug=False,
+    strip=False,
+    upx=False,
+    console=True,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    name='commandify',
+)
@@ -0,0 +1,319 @@
+import json
+import os
+import time
+
+import metering
+import rate_limit
+import tracing
+
+# Model backends used by gemini_api. Every backend exposes the same two calls:
+#   generate(prompt, timeout=None, schema=None, deadline=None) -> str              full response text
+#   stream(prompt, timeout=None, schema=None, deadline=None)   -> iterator of str  text chunks as they arrive
+# and raises BackendError when the request fails. schema is an optional JSON
+# Schema; backends that support structured output constrain the answer to it.
+# deadline is a time.monotonic() value by which the caller needs the answer;
+# retries and backoff never run past it (nor past CALL_BUDGET per call).
+
+LOCAL_SERVER_URL = os.environ.get('COMMANDIFY_LOCAL_URL', 'http://127.0.0.1:8080/v1')
+LOCAL_SERVER_MODEL = os.environ.get('COMMANDIFY_LOCAL_MODEL', 'local')
+LOCAL_SERVER_LIGHT_MODEL = os.environ.get('COMMANDIFY_LOCAL_LIGHT_MODEL', LOCAL_SERVER_MODEL)
+GEMINI_BASE_URL = os.environ.get('COMMANDIFY_GEMINI_URL', 'https://generativelanguage.googleapis.com/v1beta/models')
+# Model tiers: 'strong' for translations, suggestions, plans and fixes,
+# 'light' for short command descriptions
+GEMINI_MODEL = os.environ.get('COMMANDIFY_MODEL', 'gemini-2.0-flash')
+GEMINI_LIGHT_MODEL = os.environ.get('COMMANDIFY_LIGHT_MODEL', 'gemini-2.0-flash-lite')
+TIERS = ('strong', 'light')
+REQUEST_TIMEOUT = float(os.environ.get('COMMANDIFY_TIMEOUT', '20'))  # seconds, per HTTP attempt
+CALL_BUDGET = float(os.environ.get('COMMANDIFY_CALL_BUDGET', '30'))  # seconds, per call including retries
+
+
+class BackendError(Exception):
+    """A model request failed (transport error or non-200 status)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class BackendResponseError(BackendError):
+    """The model answered, but the response body could not be understood."""
+
+
+class Backend:
+    """Base class for model backends."""
+
+    name = 'model'
+    model = None  # model identifier; rolling latency is tracked per model
+    requires_api_key = False
+
+    def generate(self, prompt, timeout=None, schema=None, deadline=None):
+        raise NotImplementedError
+
+    def stream(self, prompt, timeout=None, schema=None, deadline=None):
+        # Backends without native streaming return the whole answer as one chunk
+        yield self.generate(prompt, timeout=timeout, schema=schema, deadline=deadline)
+
+
+class HTTPBackend(Backend):
+    """Shared pooled keep-alive requests.Session for HTTP-based backends."""
+
+    def __init__(self, pool_size=8):
+        # requests is imported here so cache hits never pay for loading it
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._requests = requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def _post(self, url, data, timeout=None, stream=False, deadline=None):
+        """POSTs data (see _send); a request that finally fails is counted as a model error."""
+        try:
+            return self._send(url, data, timeout, stream, deadline)
+        except BackendError:
+            metering.get_meter().record_error(self.model)
+            raise
+
+    def _send(self, url, data, timeout=None, stream=False, deadline=None):
+        """
+        POSTs data through the shared rate limiter. Connection errors, 429 and
+        5xx responses are retried with jittered exponential backoff (or the
+        server's Retry-After); other failures raise BackendError at once.
+        Every attempt, wait and backoff fits before deadline (at most
+        CALL_BUDGET seconds from now); a timed-out attempt is only retried if
+        the retry still gets the full per-attempt timeout.
+        """
+        timeout = timeout or REQUEST_TIMEOUT
+        deadline = min(deadline or float('inf'), time.monotonic() + CALL_BUDGET)
+        limiter = rate_limit.get_rate_limiter()
+        for attempt in range(rate_limit.MAX_RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise BackendError("request deadline passed before it could be sent")
+            if limiter and not limiter.acquire(min(timeout, remaining)):
+                raise BackendError("client rate limit reached; try again shortly", status=429)
+            retry_after = None
+            timed_out = False
+            attempt_timeout = min(timeout, max(0.1, deadline - time.monotonic()))
+            try:
+                # Includes connect/TLS on a cold connection and server time up to the response headers
+                with tracing.span('http.post', attempt=attempt, stream=stream) as sp:
+                    response = self.session.post(url, json=data, timeout=attempt_timeout, stream=stream)
+                    sp.set(status=response.status_code)
+            except self._requests.RequestException as e:
+                error = BackendError(str(e))
+                error.__cause__ = e
+                timed_out = isinstance(e, self._requests.Timeout)
+            else:
+                if response.status_code == 200:
+                    if limiter:
+                        limiter.reward()
+                    return response
+                error = BackendError(f"{response.status_code} {response.text}", status=response.status_code)
+                if response.status_code not in rate_limit.RETRY_STATUSES:
+                    raise error
+                if response.status_code == 429 and limiter:
+                    limiter.penalize()
+                retry_after = rate_limit.retry_after_seconds(response.headers, response.text)
+                response.close()
+            if attempt == rate_limit.MAX_RETRIES:
+                raise error
+            delay = rate_limit.backoff_delay(attempt, retry_after)
+            remaining = deadline - time.monotonic() - delay
+            if remaining <= 0 or (timed_out and remaining < timeout):
+                raise error  # no time left for a useful retry
+            time.sleep(delay)
+
+    @staticmethod
+    def _iter_sse(response):
+        """Yields the decoded JSON payload of every server-sent event in response."""
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            payload = line[len('data:'):].strip()
+            if payload == '[DONE]':
+                return
+            try:
+                yield json.loads(payload)
+            except ValueError as e:
+                raise BackendResponseError(f"invalid stream event: {e}") from e
+
+
+class GeminiBackend(HTTPBackend):
+    """
+    Google Gemini generateContent API.
+
+    Endpoints and headers are built once; the API key header is refreshed only
+    when key_provider() returns a different key.
+    """
+
+    name = 'Gemini'
+    requires_api_key = True
+    BASE_URL = GEMINI_BASE_URL.rstrip('/')
+
+    def __init__(self, key_provider, model=GEMINI_MODEL, pool_size=8):
+        super().__init__(pool_size)
+        self.key_provider = key_provider
+        self.model = model
+        self.endpoint = f"{self.BASE_URL}/{model}:generateContent"
+        self.stream_endpoint = f"{self.BASE_URL}/{model}:streamGenerateContent?alt=sse"
+        self._api_key = None
+
+    @staticmethod
+    def _schema(schema):
+        """Converts a JSON Schema to Gemini's OpenAPI subset (upper-case type names)."""
+        converted = {}
+        for key, value in schema.items():
+            if key == 'type':
+                value = value.upper()
+            elif key == 'items':
+                value = GeminiBackend._schema(value)
+            elif key == 'properties':
+                value = {name: GeminiBackend._schema(prop) for name, prop in value.items()}
+            converted[key] = value
+        return converted
+
+    def _request(self, prompt, timeout, stream, schema=None, deadline=None):
+        api_key = self.key_provider()
+        if api_key != self._api_key:
+            self.session.headers["x-goog-api-key"] = api_key or ""
+            self._api_key = api_key
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        if schema is not None:
+            data["generationConfig"] = {"responseMimeType": "application/json", "responseSchema": self._schema(schema)}
+        return self._post(self.stream_endpoint if stream else self.endpoint, data, timeout, stream, deadline)
+
+    def _record_usage(self, usage):
+        """Meters a response's usageMetadata (thinking tokens count as response tokens)."""
+        usage = usage or {}
+        metering.get_meter().record_usage(
+            self.model, usage.get('promptTokenCount', 0),
+            usage.get('candidatesTokenCount', 0) + usage.get('thoughtsTokenCount', 0))
+
+    def generate(self, prompt, timeout=None, schema=None, deadline=None):
+        response = self._request(prompt, timeout, stream=False, schema=schema, deadline=deadline)
+        try:
+            body = response.json()
+            text = body['candidates'][0]['content']['parts'][0]['text']
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            metering.get_meter().record_error(self.model)
+            raise BackendResponseError(f"unexpected response: {e}") from e
+        self._record_usage(body.get('usageMetadata'))
+        return text
+
+    def stream(self, prompt, timeout=None, schema=None, deadline=None):
+        response = self._request(prompt, timeout, stream=True, schema=schema, deadline=deadline)
+        usage, failed = None, False
+        try:
+            for chunk in self._iter_sse(response):
+                # Counts are cumulative; the last event carries the totals
+                usage = chunk.get('usageMetadata') or usage
+                for candidate in chunk.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+        except BackendResponseError:
+            failed = True
+            metering.get_meter().record_error(self.model)
+            raise
+        finally:
+            # Also runs when the consumer stops early (e.g. a hedged duplicate that lost):
+            # closing the response returns its connection to the pool or drops it
+            response.close()
+            if not failed:
+                self._record_usage(usage)
+
+
+class LocalServerBackend(HTTPBackend):
+    """
+    OpenAI-compatible chat completions server on the local machine or LAN
+    (llama.cpp server, Ollama, vLLM, LM Studio, ...). No API key required.
+    """
+
+    name = 'Local model'
+
+    def __init__(self, base_url=LOCAL_SERVER_URL, model=LOCAL_SERVER_MODEL, pool_size=8):
+        super().__init__(pool_size)
+        self.model = model
+        self.endpoint = f"{base_url.rstrip('/')}/chat/completions"
+
+    def _data(self, prompt, stream, schema=None):
+        data = {"model": self.model, "messages": [{"role": "user", "content": prompt}], "stream": stream}
+        if schema is not None:
+            data["response_format"] = {"type": "json_schema", "json_schema": {"name": "response", "schema": schema}}
+        return data
+
+    def _record_usage(self, usage):
+        usage = usage or {}
+        metering.get_meter().record_usage(self.model, usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+
+    def generate(self, prompt, timeout=None, schema=None, deadline=None):
+        response = self._post(self.endpoint, self._data(prompt, False, schema), timeout, deadline=deadline)
+        try:
+            body = response.json()
+            text = body['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            metering.get_meter().record_error(self.model)
+            raise BackendResponseError(f"unexpected response: {e}") from e
+        self._record_usage(body.get('usage'))
+        return text
+
+    def stream(self, prompt, timeout=None, schema=None, deadline=None):
+        response = self._post(self.endpoint, self._data(prompt, True, schema), timeout, stream=True, deadline=deadline)
+        usage, failed = None, False
+        try:
+            for chunk in self._iter_sse(response):
+                usage = chunk.get('usage') or usage  # only servers that report usage in streams
+                for choice in chunk.get('choices', [])[:1]:
+                    text = (choice.get('delta') or {}).get('content')
+                    if text:
+                        yield text
+        except BackendResponseError:
+            failed = True
+            metering.get_meter().record_error(self.model)
+            raise
+        finally:
+            response.close()
+            if not failed:
+                self._record_usage(usage)
+
+
+class StubBackend(Backend):
+    """
+    In-process backend for tests and benchmarks. responder(prompt) returns the
+    answer text, or raises BackendError to simulate a failure.
+    """
+
+    name = 'Stub'
+    model = 'stub'
+
+    def __init__(self, responder=None):
+        self.responder = responder or (lambda prompt: "echo stub")
+        self.prompts = []
+
+    def generate(self, prompt, timeout=None, schema=None, deadline=None):
+        self.prompts.append(prompt)
+        try:
+            text = self.responder(prompt)
+        except BackendError:
+            metering.get_meter().record_error(self.model)
+            raise
+        # Rough estimate (~4 characters per token) so budgets and metrics can be exercised offline
+        metering.get_meter().record_usage(self.model, len(prompt) // 4, len(text) // 4)
+        return text
+
+
+def create_backend(kind, key_provider, pool_size=8, tier='strong'):
+    """Creates the backend named kind ('gemini', 'local' or 'stub') for a model tier ('strong' or 'light')."""
+    if tier not in TIERS:
+        raise ValueError(f"Unknown model tier '{tier}' (expected strong or light)")
+    light = tier == 'light'
+    if kind == 'local':
+        return LocalServerBackend(model=LOCAL_SERVER_LIGHT_MODEL if light else LOCAL_SERVER_MODEL, pool_size=pool_size)
+    if kind == 'stub':
+        return StubBackend()
+    if kind != 'gemini':
+        raise ValueError(f"Unknown backend '{kind}' (expected gemini, local or stub)")
+    return GeminiBackend(key_provider, model=GEMINI_LIGHT_MODEL if light else GEMINI_MODEL, pool_size=pool_size)
@@ -0,0 +1,119 @@
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from gemini_api import get_linux_command, get_command_suggestions, DESCRIBE_CONCURRENCY
+from tracing import percentile
+
+# Non-interactive bulk translation: reads English instructions (plain lines or
+# JSONL with a "text" field and optional "id"), translates them concurrently
+# and writes one JSON result per line. Nothing is ever prompted or executed.
+
+
+def read_items(lines):
+    """Returns [(id, text)] from plain-text or JSONL lines; blank lines and # comments are skipped."""
+    items = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and (record.get('text') or record.get('prompt')):
+                items.append((record.get('id', number), record.get('text') or record.get('prompt')))
+                continue
+        items.append((number, line))
+    return items
+
+
+def translate_one(text, with_suggestions):
+    start = time.perf_counter()
+    result = {'command': get_linux_command(text)}
+    if with_suggestions:
+        result['suggestions'] = [{'cmd': cmd, 'desc': desc}
+                                 for cmd, desc in get_command_suggestions(text + " (give me more alternatives and options)")]
+    result['latency_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return result
+
+
+def run_batch(lines, output=sys.stdout, jobs=DESCRIBE_CONCURRENCY, order='input', with_suggestions=False):
+    """
+    Translates every item in lines with at most jobs requests in flight, writing
+    JSONL results to output in input order (order='input') or as they complete
+    (order='completion'). Identical inputs are translated once. Returns a summary dict.
+    """
+    items = read_items(lines)
+    start = time.perf_counter()
+    groups = {}  # normalized text -> [item positions]
+    for position, (_, text) in enumerate(items):
+        groups.setdefault(' '.join(text.lower().split()), []).append(position)
+
+    results = [None] * len(items)
+    next_to_write = 0
+    latencies = []
+    errors = 0
+
+    def write(position):
+        item_id, text = items[position]
+        record = {'id': item_id, 'input': text}
+        record.update(results[position])
+        output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        output.flush()
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = {pool.submit(translate_one, items[positions[0]][1], with_suggestions): positions
+                   for positions in groups.values()}
+        for future in as_completed(futures):
+            positions = futures[future]
+            try:
+                result = future.result()
+                latencies.append(result['latency_ms'])
+            except Exception as e:
+                result = {'error': str(e)}
+                errors += 1
+            for i, position in enumerate(positions):
+                results[position] = dict(result, duplicate=True) if i else result
+                if order == 'completion':
+                    write(position)
+            if order == 'input':
+                while next_to_write < len(items) and results[next_to_write] is not None:
+                    write(next_to_write)
+                    next_to_write += 1
+
+    elapsed = time.perf_counter() - start
+    return {
+        'items': len(items),
+        'unique': len(groups),
+        'errors': errors,
+        'wall_seconds': round(elapsed, 3),
+        'items_per_second': round(len(items) / elapsed, 3) if elapsed > 0 else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'max': max(latencies) if latencies else None,
+        },
+    }
+
+
+def main(args):
+    """Entry point for `main.py --batch [FILE|-] [--jobs N] [--order input|completion] [--suggestions]`."""
+    import argparse
+    parser = argparse.ArgumentParser(prog='commandify --batch', description='Translate English instructions in bulk (JSONL output).')
+    parser.add_argument('file', nargs='?', default='-', help="input file, or '-' for stdin (default)")
+    parser.add_argument('--jobs', type=int, default=DESCRIBE_CONCURRENCY, help='maximum concurrent requests')
+    parser.add_argument('--order', choices=['input', 'completion'], default='input', help='output order')
+    parser.add_argument('--suggestions', action='store_true', help='also include alternative commands')
+    options = parser.parse_args(args)
+
+    if options.file == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(options.file, 'r') as f:
+            lines = f.readlines()
+    summary = run_batch(lines, sys.stdout, options.jobs, options.order, options.suggestions)
+    sys.stderr.write(json.dumps({'summary': summary}) + '\n')
+    return 1 if summary['errors'] else 0
@@ -0,0 +1,157 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def get_cache_dir():
+    """Returns the directory used for commandify's on-disk caches (created on demand)."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    cache_dir = os.environ.get('COMMANDIFY_CACHE_DIR') or os.path.join(base, 'commandify')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+class PersistentCache:
+    """
+    SQLite-backed LRU cache shared between runs (and between terminals).
+
+    Entries expire after `expiry` seconds. The recency order is mirrored in an
+    OrderedDict so eviction is O(1); the cache is bounded both by entry count
+    and by the total size in bytes of the stored JSON values.
+    If the database can't be opened the cache silently falls back to memory only.
+    """
+
+    def __init__(self, path, max_entries=100, max_bytes=5 * 1024 * 1024, expiry=24 * 60 * 60):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()  # key -> (size, created)
+        self._memory = {}  # used only when the database is unavailable
+        self._bytes = 0
+        self._db = None
+        try:
+            self._db = sqlite3.connect(path, timeout=2, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+            self._db.execute("DELETE FROM entries WHERE created < ?", (time.time() - expiry,))
+            self._db.commit()
+            for key, size, created in self._db.execute(
+                    "SELECT key, size, created FROM entries ORDER BY accessed"):
+                self._lru[key] = (size, created)
+                self._bytes += size
+        except sqlite3.Error:
+            self._db = None
+
+    def get(self, key):
+        """Returns the cached value for key, or None if it is missing or expired."""
+        with self._lock:
+            now = time.time()
+            if self._db is None:
+                item = self._memory.get(key)
+                if item is None:
+                    return None
+                if now - item[1] >= self.expiry:
+                    self._remove(key)
+                    return None
+                self._lru.move_to_end(key)
+                return item[0]
+            try:
+                row = self._db.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self._lru.pop(key, None)
+                    return None
+                value, created = row
+                if now - created >= self.expiry:
+                    self._remove(key)
+                    self._db.commit()
+                    return None
+                self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            except sqlite3.Error:
+                return None
+            if key not in self._lru:
+                # Written by another process since we loaded the index
+                size = len(value.encode('utf-8'))
+                self._lru[key] = (size, created)
+                self._bytes += size
+            self._lru.move_to_end(key)
+            return json.loads(value)
+
+    def set(self, key, value):
+        """Stores a JSON-serializable value, evicting least recently used entries as needed."""
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            now = time.time()
+            if key in self._lru:
+                self._remove(key)
+            while self._lru and (len(self._lru) >= self.max_entries or self._bytes + size > self.max_bytes):
+                oldest_key = next(iter(self._lru))
+                self._remove(oldest_key)
+            self._lru[key] = (size, now)
+            self._bytes += size
+            if self._db is None:
+                self._memory[key] = (value, now)
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, encoded, size, now, now),
+                )
+                self._db.commit()
+            except sqlite3.Error:
+                pass
+
+    def _remove(self, key):
+        size, _ = self._lru.pop(key, (0, 0))
+        self._bytes -= size
+        self._memory.pop(key, None)
+        if self._db is not None:
+            try:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            except sqlite3.Error:
+                pass
+
+    def items(self, prefix=''):
+        """Returns [(key, value)] for unexpired keys starting with prefix, without touching recency."""
+        with self._lock:
+            cutoff = time.time() - self.expiry
+            if self._db is None:
+                return [(key, item[0]) for key, item in self._memory.items()
+                        if key.startswith(prefix) and item[1] >= cutoff]
+            try:
+                rows = self._db.execute(
+                    "SELECT key, value FROM entries WHERE key >= ? AND key < ? AND created >= ?",
+                    (prefix, prefix + '\uffff', cutoff),
+                ).fetchall()
+            except sqlite3.Error:
+                return []
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._memory.clear()
+            self._bytes = 0
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM entries")
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def __len__(self):
+        return len(self._lru)
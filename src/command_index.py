@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+from bisect import bisect_left
+
+from linux_commands_data import LINUX_COMMANDS
+from cache_store import get_cache_dir
+
+# Prefix index over LINUX_COMMANDS plus every executable found on $PATH.
+# The $PATH scan is persisted per directory and a directory is only rescanned
+# when its mtime changes (installing or removing a program updates it).
+
+
+class CommandIndex:
+    """Sorted array of command names with bisect-based prefix lookups."""
+
+    def __init__(self, names):
+        self.names = sorted(set(names))
+
+    def complete(self, prefix, limit=None):
+        """Returns the names starting with prefix in sorted order (at most limit of them)."""
+        start = bisect_left(self.names, prefix)
+        end = bisect_left(self.names, prefix + '\U0010ffff', start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.names[start:end]
+
+    def __contains__(self, name):
+        i = bisect_left(self.names, name)
+        return i < len(self.names) and self.names[i] == name
+
+    def __len__(self):
+        return len(self.names)
+
+
+def scan_directory(directory):
+    """Returns the names of executable files in directory."""
+    names = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_file() and os.access(entry.path, os.X_OK):
+                        names.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        return []
+    return names
+
+
+def load_path_executables(cache_path, path_dirs=None):
+    """
+    Returns the executables on $PATH, reusing the persisted scan for every
+    directory whose mtime hasn't changed and rescanning only the others.
+    """
+    if path_dirs is None:
+        path_dirs = [d for d in os.environ.get('PATH', '').split(os.pathsep) if d]
+    try:
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = {}
+
+    dirs = {}
+    changed = False
+    for directory in dict.fromkeys(path_dirs):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            continue
+        entry = cached.get(directory)
+        if entry is None or entry.get('mtime') != mtime:
+            entry = {'mtime': mtime, 'names': scan_directory(directory)}
+            changed = True
+        dirs[directory] = entry
+    if changed or set(dirs) != set(cached):
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(dirs, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+
+    names = set()
+    for entry in dirs.values():
+        names.update(entry['names'])
+    return names
+
+
+_INDEX = None
+_EXECUTABLES = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_path_executables():
+    """Returns the names of the executables on $PATH (a frozenset), scanning on first use."""
+    global _EXECUTABLES
+    with _INDEX_LOCK:
+        if _EXECUTABLES is None:
+            try:
+                _EXECUTABLES = frozenset(load_path_executables(os.path.join(get_cache_dir(), 'path_index.json')))
+            except OSError:
+                _EXECUTABLES = frozenset()
+        return _EXECUTABLES
+
+
+def get_command_index():
+    """Returns the shared prefix index, building it on first use."""
+    global _INDEX
+    executables = get_path_executables()
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = CommandIndex(set(LINUX_COMMANDS) | executables)
+    return _INDEX
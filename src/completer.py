@@ -0,0 +1,180 @@
+import os
+import threading
+
+from prompt_toolkit.completion import Completer, Completion
+
+from linux_commands_data import LINUX_COMMANDS
+
+# Live completion for the English prompt (prompt_toolkit). Everything shown
+# while typing comes from local data: the command table, the $PATH index,
+# the execution history and previously translated prompts. Descriptions are
+# looked up in the background after a short pause in typing. Command names
+# (the table and every $PATH prefix match) only get local descriptions
+# (description index, whatis); the model is asked only about the arguments
+# of a command the user already picked, and only for the first few that have
+# no local description. The menu shows "loading" until they arrive and is
+# redrawn then. Typing never waits on the disk or the network, and a newer
+# keystroke cancels model lookups that are still in flight.
+
+COMPLETION_ENABLED = os.environ.get('COMMANDIFY_COMPLETION', '1') != '0'
+DEBOUNCE = 0.3  # seconds without typing before descriptions are requested
+MAX_COMPLETIONS = 20
+MAX_MODEL_LOOKUPS = 3  # names per pause sent to the model (shares the rate limit with translations)
+
+
+class LatestOnlyWorker:
+    """
+    Single background thread that runs only the most recent job. Submitting a
+    job replaces any job still waiting (debounced or queued); a job already
+    running finishes, but is_current() tells it that it has become stale.
+    """
+
+    def __init__(self, delay=DEBOUNCE):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._pending = None
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+
+    def submit(self, job):
+        """Schedules job(generation) to run after delay seconds unless another job is submitted first."""
+        with self._lock:
+            self._generation += 1
+            self._pending = (self._generation, job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='completion-worker', daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def is_current(self, generation):
+        return generation == self._generation
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._pending is None:
+                    self._wakeup.wait()
+                # Debounce: keep waiting while newer jobs keep arriving
+                while True:
+                    generation = self._pending[0]
+                    self._wakeup.wait(self.delay)
+                    if self._pending is None or self._pending[0] == generation:
+                        break
+                if self._pending is None:
+                    continue
+                generation, job = self._pending
+                self._pending = None
+            try:
+                job(generation)
+            except Exception:
+                pass  # a failed lookup just leaves "loading" rows with their fallback text
+
+
+class CommandifyCompleter(Completer):
+    """
+    Completes a single word as a command name (table + $PATH), "<command> "
+    with that command's common arguments, and anything else as an English
+    prompt from history and previously translated prompts.
+
+    local_describe(names) and describe(names, cancelled=...) return
+    {name: description}; both are called from the background worker, describe
+    only for names without a local description. cancelled() turns True when a
+    newer keystroke made the lookup stale. on_refresh() is called (from that
+    thread) when new descriptions arrived so the UI can redraw.
+    """
+
+    def __init__(self, command_index, local_describe, describe=None, prompt_sources=(), on_refresh=None):
+        self.command_index = command_index
+        self.local_describe = local_describe
+        self.describe = describe
+        self.prompt_sources = prompt_sources
+        self.on_refresh = on_refresh
+        self.descriptions = {}  # name -> description ('' when none could be found)
+        self._loading = set()  # names the worker is looking up
+        self._prompts = None
+        self._prompts_lock = threading.Lock()
+        self._worker = LatestOnlyWorker()
+        threading.Thread(target=self._load_prompts, name='completion-prompts', daemon=True).start()
+
+    def _load_prompts(self):
+        prompts = {}
+        for source in self.prompt_sources:
+            try:
+                for prompt, command in source():
+                    prompts.setdefault(prompt.strip(), command)
+            except Exception:
+                continue
+        with self._prompts_lock:
+            self._prompts = list(prompts.items())
+
+    def _meta(self, name):
+        # Evaluated each time the menu is drawn, so descriptions that arrive later show up
+        def meta():
+            desc = self.descriptions.get(name)
+            if desc is None:
+                return [('class:loading', 'loading…')] if name in self._loading else ''
+            return desc
+        return meta
+
+    def _describe_later(self, names, use_model=True):
+        """Schedules a background lookup of the names without a description yet."""
+        missing = [name for name in names if name not in self.descriptions]
+        if not missing:
+            return
+        self._loading = set(missing)
+
+        def job(generation):
+            def stale():
+                return not self._worker.is_current(generation)
+
+            found = self.local_describe(missing)
+            for name in missing:
+                if found.get(name):
+                    self.descriptions[name] = found[name]
+            unknown = [name for name in missing if name not in self.descriptions]
+            if unknown and use_model and self.describe is not None and not stale():
+                results = self.describe(unknown[:MAX_MODEL_LOOKUPS], cancelled=stale)
+                for name in unknown[:MAX_MODEL_LOOKUPS]:
+                    if results.get(name) or not stale():
+                        self.descriptions.setdefault(name, results.get(name) or '')
+            if not stale():
+                self._loading = set()
+                if self.on_refresh:
+                    self.on_refresh()
+        self._worker.submit(job)
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor
+        stripped = text.lstrip()
+        if not stripped:
+            return
+        words = stripped.split()
+        if len(words) == 1 and not text.endswith(' '):
+            # A command name: common commands first, then the rest of $PATH
+            names = sorted(cmd for cmd in LINUX_COMMANDS if cmd.startswith(words[0]))
+            names += [cmd for cmd in self.command_index.complete(words[0], MAX_COMPLETIONS) if cmd not in LINUX_COMMANDS]
+            names = names[:MAX_COMPLETIONS]
+            self._describe_later(names, use_model=False)  # never spend model requests on $PATH matches
+            for name in names:
+                yield Completion(name, -len(words[0]), display_meta=self._meta(name))
+        elif words[0] in LINUX_COMMANDS and (len(words) == 1 or (len(words) == 2 and not text.endswith(' '))):
+            # "<command> <argument>"
+            partial = words[1] if len(words) == 2 else ''
+            args = [arg for arg in LINUX_COMMANDS[words[0]] if arg.startswith(partial)][:MAX_COMPLETIONS]
+            names = [f"{words[0]} {arg}" for arg in args]
+            self._describe_later(names)
+            for arg, name in zip(args, names):
+                yield Completion(arg, -len(partial), display_meta=self._meta(name))
+
+        # English prompts seen before (history first, then the translation cache)
+        with self._prompts_lock:
+            prompts = self._prompts or []
+        needle = stripped.lower()
+        shown = 0
+        for prompt, command in prompts:
+            if shown >= MAX_COMPLETIONS:
+                break
+            if prompt.lower().startswith(needle) and prompt.lower() != needle:
+                shown += 1
+                yield Completion(prompt, -len(text), display_meta=f"→ {command}")
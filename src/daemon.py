@@ -0,0 +1,238 @@
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+
+# Optional long-lived daemon that keeps the model connection pool, caches and
+# indexes warm, and answers translation/suggestion requests over a Unix socket.
+#
+# Protocol: one JSON object per line.
+#   request:  {"op": "translate" | "similar" | "history" | "suggest" | "ping" | "shutdown", "text": "...", "stream": bool}
+#   replies:  zero or more {"chunk": ...} lines when streaming, then {"result": ...} or {"error": "..."}
+#
+# This module only imports the standard library at the top so the client side
+# stays cheap; the server imports gemini_api when it starts.
+
+IDLE_TIMEOUT = float(os.environ.get('COMMANDIFY_DAEMON_IDLE', '1800'))
+SPAWN_WAIT = 3.0
+
+
+def socket_path():
+    """Returns the per-user socket path (in $XDG_RUNTIME_DIR when available)."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, 'commandify.sock')
+    from cache_store import get_cache_dir
+    return os.path.join(get_cache_dir(), 'daemon.sock')
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> [event, result, error]
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+        if not leader:
+            call[0].wait()
+        else:
+            try:
+                call[1] = func()
+            except Exception as e:
+                call[2] = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call[0].set()
+        if call[2] is not None:
+            raise call[2]
+        return call[1], leader
+
+
+# --- Client -----------------------------------------------------------------
+
+class RemoteError(Exception):
+    """The daemon handled the request but it failed (e.g. the model API returned an error)."""
+
+
+def _connect(path, timeout):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def spawn_daemon(command):
+    """Starts the daemon in the background (detached from this terminal)."""
+    subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True, close_fds=True)
+
+
+def request(op, text='', on_chunk=None, spawn_command=None, timeout=60):
+    """
+    Sends a request to the daemon and returns its result, or None if the daemon
+    is unavailable (the caller then does the work in-process). Raises
+    RemoteError if the daemon reports that the request itself failed, or
+    accepted it but gave no answer within timeout (repeating it in-process
+    would only double the wait). If spawn_command is given, a daemon that
+    isn't running is started with it first.
+    """
+    path = socket_path()
+    try:
+        sock = _connect(path, timeout)
+    except OSError:
+        if not spawn_command:
+            return None
+        spawn_daemon(spawn_command)
+        deadline = time.monotonic() + SPAWN_WAIT
+        while True:
+            time.sleep(0.05)
+            try:
+                sock = _connect(path, timeout)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    return None
+    try:
+        with sock, sock.makefile('rwb') as stream:
+            message = {'op': op, 'text': text, 'stream': on_chunk is not None}
+            stream.write(json.dumps(message).encode('utf-8') + b'\n')
+            stream.flush()
+            for line in stream:
+                reply = json.loads(line)
+                if 'chunk' in reply:
+                    if on_chunk:
+                        on_chunk(reply['chunk'])
+                elif 'result' in reply:
+                    return reply['result']
+                elif reply.get('failed'):
+                    raise RemoteError(reply.get('error', 'request failed'))
+                else:
+                    return None
+    except socket.timeout as e:
+        raise RemoteError(f"the daemon did not answer within {timeout:.0f}s") from e
+    except (OSError, ValueError):
+        return None
+    return None
+
+
+# --- Server -----------------------------------------------------------------
+
+def serve(path=None, idle_timeout=IDLE_TIMEOUT):
+    """Runs the daemon in the foreground until it is idle for idle_timeout seconds or told to shut down."""
+    import socketserver
+    import gemini_api
+    import metering
+    from command_index import get_command_index
+    from history import HISTORY_ENABLED, get_history
+    from local_index import get_index
+
+    path = path or socket_path()
+    try:
+        _connect(path, 1).close()
+        return  # Another daemon is already serving this socket
+    except OSError:
+        pass
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+    # Warm everything up front so the first request is as fast as later ones
+    gemini_api.get_cache()
+    gemini_api.get_similarity_index()
+    gemini_api.get_backend()
+    gemini_api.get_backend('light')
+    get_command_index()
+    get_index()
+    if HISTORY_ENABLED:
+        get_history()
+
+    flights = SingleFlight()
+    state = {'last_request': time.monotonic()}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def send(self, message):
+            self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                return
+            state['last_request'] = time.monotonic()
+            try:
+                message = json.loads(line)
+                op, text = message.get('op'), message.get('text', '')
+                on_chunk = (lambda partial: self.send({'chunk': partial})) if message.get('stream') else None
+                if op == 'ping':
+                    self.send({'result': 'pong'})
+                elif op == 'shutdown':
+                    self.send({'result': 'bye'})
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                elif op == 'translate':
+                    # Only the leader of a coalesced group streams; the others get the final result
+                    result, _ = flights.do(('translate', text.strip().lower()),
+                                           lambda: gemini_api.get_linux_command(text, on_chunk=on_chunk))
+                    self.send({'result': result})
+                elif op == 'similar':
+                    # [] rather than null when nothing matches, so the client doesn't fall back in-process
+                    self.send({'result': gemini_api.find_similar_translation(text) or []})
+                elif op == 'history':
+                    # {} rather than null when nothing matches, so the client doesn't open the database itself
+                    self.send({'result': (get_history().lookup(text) if HISTORY_ENABLED else None) or {}})
+                elif op == 'suggest':
+                    result, _ = flights.do(('suggest', text.strip().lower()),
+                                           lambda: gemini_api.get_command_suggestions(text))
+                    self.send({'result': [list(s) for s in result]})
+                else:
+                    self.send({'error': f"unknown op {op!r}"})
+            except gemini_api.BackendError as e:
+                # Retries already happened here; tell the client not to repeat the request in-process
+                self.send({'error': str(e), 'failed': True})
+            except (OSError, ValueError) as e:
+                try:
+                    self.send({'error': str(e)})
+                except OSError:
+                    pass
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    old_umask = os.umask(0o077)  # socket is only accessible to this user
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(old_umask)
+
+    def watch_idle():
+        while True:
+            time.sleep(min(idle_timeout, 30))
+            if time.monotonic() - state['last_request'] > idle_timeout:
+                server.shutdown()
+                return
+
+    threading.Thread(target=watch_idle, daemon=True).start()
+    # Usage is flushed periodically so --usage and the budget see what the daemon spent
+    metering.get_meter().start_flusher()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        metering.get_meter().flush()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
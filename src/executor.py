@@ -0,0 +1,182 @@
+import codecs
+import os
+import selectors
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+# Streaming command execution used by terminal_mode_with_prompt.
+#
+# Output is forwarded as soon as it is produced. Only a bounded tail of each
+# stream is kept in memory (enough for error analysis), and output that grows
+# past SPOOL_THRESHOLD is moved to a temp file instead of being held in memory.
+# Full-screen programs (top, vim, ...) run on a pseudo-terminal.
+
+TAIL_BYTES = 64 * 1024
+SPOOL_THRESHOLD = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+INTERACTIVE_COMMANDS = {
+    'top', 'htop', 'btop', 'atop', 'iotop', 'vim', 'vi', 'nvim', 'nano', 'emacs', 'less', 'more',
+    'man', 'ssh', 'watch', 'tmux', 'screen', 'mysql', 'psql', 'sqlite3', 'python', 'python3',
+    'ftp', 'sftp', 'telnet', 'passwd', 'visudo', 'crontab',
+}
+
+
+class TailBuffer:
+    """Keeps only the last max_bytes bytes written to it."""
+
+    def __init__(self, max_bytes=TAIL_BYTES):
+        self.max_bytes = max_bytes
+        self._data = bytearray()
+
+    def write(self, data):
+        self._data += data
+        if len(self._data) > self.max_bytes:
+            del self._data[:len(self._data) - self.max_bytes]
+
+    def text(self):
+        return self._data.decode('utf-8', errors='replace')
+
+
+class OutputSpool:
+    """Holds output in memory until it passes threshold bytes, then moves it to a temp file."""
+
+    def __init__(self, threshold=SPOOL_THRESHOLD):
+        self.threshold = threshold
+        self.path = None
+        self._buffer = bytearray()
+        self._file = None
+
+    def write(self, data):
+        if self._file is None:
+            self._buffer += data
+            if len(self._buffer) <= self.threshold:
+                return
+            self._file = tempfile.NamedTemporaryFile(prefix='commandify-output-', suffix='.log', delete=False)
+            self.path = self._file.name
+            data = bytes(self._buffer)
+            self._buffer = bytearray()
+        self._file.write(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._buffer = bytearray()
+
+
+class ExecutionResult:
+    """Outcome of run_command: exit code, bounded output tails and the spool file, if any."""
+
+    def __init__(self, returncode, stdout_tail='', stderr_tail='', spool_path=None, duration=0.0):
+        self.returncode = returncode
+        self.stdout_tail = stdout_tail
+        self.stderr_tail = stderr_tail
+        self.spool_path = spool_path
+        self.duration = duration
+
+    @property
+    def success(self):
+        return self.returncode == 0
+
+    @property
+    def error_output(self):
+        return self.stderr_tail or self.stdout_tail
+
+
+def needs_pty(cmd):
+    """Returns True if any stage of cmd starts a full-screen or interactive program."""
+    try:
+        tokens = shlex.split(cmd)
+    except ValueError:
+        tokens = cmd.split()
+    expect_command = True
+    for token in tokens:
+        if token in ('|', '&&', '||', ';'):
+            expect_command = True
+            continue
+        if expect_command:
+            if token in ('sudo', 'env', 'nohup', 'time') or '=' in token:
+                continue
+            if os.path.basename(token) in INTERACTIVE_COMMANDS:
+                return True
+            expect_command = False
+    return False
+
+
+def run_command(cmd, on_stdout=None, on_stderr=None, pty_mode=None, stdin=None):
+    """
+    Runs cmd through the shell and returns an ExecutionResult.
+
+    on_stdout/on_stderr receive decoded text as soon as it is produced. With
+    pty_mode (by default chosen by needs_pty) the command runs on a
+    pseudo-terminal attached to the user's terminal instead. stdin is passed
+    to the piped subprocess (e.g. subprocess.DEVNULL for unattended runs).
+    """
+    if pty_mode is None:
+        pty_mode = needs_pty(cmd)
+    if pty_mode and sys.stdin.isatty() and sys.stdout.isatty():
+        return _run_pty(cmd)
+    return _run_piped(cmd, on_stdout, on_stderr, stdin)
+
+
+def _run_piped(cmd, on_stdout, on_stderr, stdin=None):
+    start = time.monotonic()
+    proc = subprocess.Popen(cmd, shell=True, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    tails = {'stdout': TailBuffer(), 'stderr': TailBuffer()}
+    spool = OutputSpool()
+    selector = selectors.DefaultSelector()
+    selector.register(proc.stdout, selectors.EVENT_READ,
+                      ('stdout', codecs.getincrementaldecoder('utf-8')(errors='replace'), on_stdout))
+    selector.register(proc.stderr, selectors.EVENT_READ,
+                      ('stderr', codecs.getincrementaldecoder('utf-8')(errors='replace'), on_stderr))
+    try:
+        while selector.get_map():
+            for key, _ in selector.select():
+                name, decoder, callback = key.data
+                data = os.read(key.fileobj.fileno(), READ_SIZE)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    text = decoder.decode(b'', final=True)
+                else:
+                    tails[name].write(data)
+                    spool.write(data)
+                    text = decoder.decode(data)
+                if text and callback:
+                    callback(text)
+        returncode = proc.wait()
+    except KeyboardInterrupt:
+        # The child got the same SIGINT; make sure it is gone before returning
+        proc.terminate()
+        returncode = proc.wait()
+    finally:
+        selector.close()
+        proc.stdout.close()
+        proc.stderr.close()
+        spool.close()
+    return ExecutionResult(returncode, tails['stdout'].text(), tails['stderr'].text(),
+                           spool.path, time.monotonic() - start)
+
+
+def _run_pty(cmd):
+    import pty
+    start = time.monotonic()
+    tail = TailBuffer()
+
+    def read(fd):
+        data = os.read(fd, 1024)
+        tail.write(data)
+        return data
+
+    try:
+        status = pty.spawn(['/bin/sh', '-c', cmd], read)
+    except KeyboardInterrupt:
+        status = 130 << 8
+    if os.WIFEXITED(status):
+        returncode = os.WEXITSTATUS(status)
+    else:
+        returncode = -os.WTERMSIG(status)
+    # A terminal merges both streams, so the tail holds stdout and stderr together
+    return ExecutionResult(returncode, stderr_tail=tail.text(), duration=time.monotonic() - start)
@@ -1,195 +1,703 @@
-import requests
 import os
-import shutil
-from linux_commands_data import LINUX_COMMANDS, LINUX_COMMANDS_NEED_FILE
+import json
+import contextvars
 import time
+from linux_commands_data import LINUX_COMMANDS, LINUX_COMMANDS_NEED_FILE
+from cache_store import PersistentCache, get_cache_dir
+from backends import BackendError, BackendResponseError, TIERS, create_backend
+import metering
+import tracing
 
-# إضافة التخزين المؤقت للاقتراحات
-SUGGESTIONS_CACHE = {}
+# التخزين المؤقت الدائم للترجمات والاقتراحات (يبقى بين التشغيلات)
+SUGGESTIONS_CACHE = None
 MAX_CACHE_SIZE = 100
+MAX_CACHE_BYTES = 5 * 1024 * 1024  # الحد الأقصى لحجم التخزين المؤقت بالبايت
 CACHE_EXPIRY = 24 * 60 * 60  # مدة صلاحية التخزين المؤقت بالثواني (24 ساعة)
 
+# عدد طلبات الشرح المتزامنة والمهلة الكلية لها بالثواني
+DESCRIBE_CONCURRENCY = int(os.environ.get('COMMANDIFY_CONCURRENCY', '4'))
+DESCRIBE_DEADLINE = float(os.environ.get('COMMANDIFY_DEADLINE', '8'))
+
+# المهلة الكلية لترجمة واحدة بالثواني (تشمل إعادة المحاولات والطلب الاحتياطي المكرر)
+TRANSLATE_DEADLINE = float(os.environ.get('COMMANDIFY_TRANSLATE_DEADLINE', '25'))
+
+# الحد الأقصى لعدد الأوامر المقترحة عند البحث بالبادئة
+MAX_PREFIX_SUGGESTIONS = 15
+
+# أقصى حجم (بالحروف) لآخر مخرجات الخطأ المرسلة مع طلب الإصلاح
+FIX_TAIL_CHARS = int(os.environ.get('COMMANDIFY_FIX_TAIL', '2000'))
+
+def get_cache():
+    """
+    فتح التخزين المؤقت عند أول استخدام فقط
+    """
+    global SUGGESTIONS_CACHE
+    if SUGGESTIONS_CACHE is None:
+        try:
+            path = os.path.join(get_cache_dir(), 'cache.db')
+        except OSError:
+            path = ':memory:'
+        SUGGESTIONS_CACHE = PersistentCache(path, MAX_CACHE_SIZE, MAX_CACHE_BYTES, CACHE_EXPIRY)
+    return SUGGESTIONS_CACHE
+
+_SIMILARITY_INDEX = None
+
+def get_similarity_index():
+    """
+    فهرس الطلبات المتشابهة، يُفتح عند أول استخدام فقط
+    """
+    global _SIMILARITY_INDEX
+    if _SIMILARITY_INDEX is None:
+        from similarity_cache import SimilarityIndex
+        try:
+            path = os.path.join(get_cache_dir(), 'similarity.db')
+        except OSError:
+            path = ':memory:'
+        _SIMILARITY_INDEX = SimilarityIndex(path, expiry=CACHE_EXPIRY)
+    return _SIMILARITY_INDEX
+
+_LOOKUP_STATS = None
+
+def record_lookup(kind, outcome):
+    """
+    عدّاد نتائج البحث في الذاكرة المؤقتة ('exact' أو 'similar' أو 'miss')؛ في الذاكرة فقط
+    حتى لا ينتظر الاستخدام من الذاكرة المؤقتة SQLite (يُكتب في الخلفية وعند الخروج)
+    """
+    get_lookup_stats().record(kind, outcome)
+
+def get_lookup_stats():
+    """
+    عدّادات نتائج البحث، تُنشأ عند أول استخدام بدون فتح فهرس الطلبات المتشابهة
+    """
+    global _LOOKUP_STATS
+    if _LOOKUP_STATS is None:
+        from similarity_cache import LookupStats
+        try:
+            path = os.path.join(get_cache_dir(), 'similarity.db')
+        except OSError:
+            path = ':memory:'
+        _LOOKUP_STATS = LookupStats(path)
+    return _LOOKUP_STATS
+
+# المفتاح يُقرأ من القرص مرة واحدة ويُعاد تحميله فقط إذا تغير الملف
+_API_KEY_CACHE = {'mtime': None, 'key': None}
+
 def get_api_key():
     key_path = os.path.expanduser('~/.gemini_api_key')
-    if os.path.exists(key_path):
-        with open(key_path, 'r') as f:
-            return f.read().strip()
-    else:
+    try:
+        mtime = os.stat(key_path).st_mtime_ns
+    except OSError:
         return None
+    if mtime != _API_KEY_CACHE['mtime']:
+        with tracing.span('api_key.read'), open(key_path, 'r') as f:
+            _API_KEY_CACHE['key'] = f.read().strip()
+        _API_KEY_CACHE['mtime'] = mtime
+    return _API_KEY_CACHE['key']
 
 def save_api_key(key):
     key_path = os.path.expanduser('~/.gemini_api_key')
     with open(key_path, 'w') as f:
         f.write(key.strip())
+    _API_KEY_CACHE['mtime'] = None
+
+# الواجهة الخلفية للنموذج: gemini (افتراضي) أو local (خادم متوافق مع OpenAI) أو stub (للاختبارات)
+BACKEND_KIND = os.environ.get('COMMANDIFY_BACKEND', 'gemini')
+# واجهة لكل فئة نموذج: strong للترجمة والاقتراحات، light للشروحات القصيرة
+_BACKENDS = {}
+
+def get_backend(tier='strong'):
+    """
+    إنشاء الواجهة الخلفية المشتركة لفئة النموذج عند أول استخدام فقط
+    (مع إرسال طلب احتياطي مكرر إذا تجاوز الطلب ميزانية زمن الاستجابة)
+    """
+    backend = _BACKENDS.get(tier)
+    if backend is None:
+        from routing import hedged, latency_path
+        try:
+            path = latency_path()
+        except OSError:
+            path = None
+        backend = hedged(create_backend(BACKEND_KIND, get_api_key, pool_size=DESCRIBE_CONCURRENCY + 2, tier=tier), path=path)
+        backend = _BACKENDS.setdefault(tier, backend)
+    return backend
+
+def set_backend(backend, tier=None):
+    """
+    استبدال الواجهة الخلفية (مثلاً StubBackend في الاختبارات)، لكل الفئات إذا لم تُحدد فئة
+    """
+    for name in ([tier] if tier else TIERS):
+        _BACKENDS[name] = backend
 
-def get_linux_command(user_text):
+def backend_ready():
     """
-    Sends the user_text to Google Gemini API and returns the suggested Linux command as a string.
+    هل يمكن إرسال طلبات؟ (Gemini يحتاج مفتاح API، الخادم المحلي لا يحتاج)
     """
-    api_key = get_api_key()
-    if not api_key:
-        return "API key not found. Please set it from the main app."
-    endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
+    # لا ننشئ الواجهة الخلفية هنا حتى لا نحمّل requests بلا داعٍ
+    backend = _BACKENDS.get('strong')
+    requires_api_key = backend.requires_api_key if backend is not None else BACKEND_KIND == 'gemini'
+    return not requires_api_key or bool(get_api_key())
+
+def model_allowed():
+    """
+    هل يُسمح بطلب النموذج الآن؟ (مفتاح API موجود ولم تُستنفد ميزانية التوكنات اليومية)
+    """
+    return backend_ready() and not metering.get_meter().budget_exceeded()
+
+def require_model():
+    """
+    يرفع BackendError برسالة للمستخدم إذا لم يكن طلب النموذج ممكناً
+    """
+    if not backend_ready():
+        raise BackendError("API key not found. Please set it from the main app.")
+    meter = metering.get_meter()
+    if meter.budget_exceeded():
+        raise BackendError(meter.budget_message())
+
+@metering.metered('translate')
+def get_linux_command(user_text, on_chunk=None):
+    """
+    Sends the user_text to the model backend (Google Gemini by default) and returns the suggested Linux command as a string.
+    If on_chunk is given the response is streamed, and on_chunk receives the text received so far
+    after every chunk. Raises BackendError (with a user-facing message) when no command could be
+    obtained, so error text is never mistaken for a command.
+    """
+    cache_key = f"translate:{user_text.strip().lower()}"
+    with tracing.span('cache.lookup', kind='translate') as sp:
+        cached = get_cache().get(cache_key)
+        sp.set(hit=cached is not None)
+    if cached is not None:
+        record_lookup('translate', 'exact')
+        metering.get_meter().record_cache_hit('exact')
+        return cached
+    # الطلبات المشابهة لا تُستخدم هنا أبداً: الواجهة تعرضها على المستخدم ليؤكدها (find_similar_translation)
+    record_lookup('translate', 'miss')
+
+    require_model()
+    backend = get_backend()
+    deadline = time.monotonic() + TRANSLATE_DEADLINE
     prompt = f"Convert the following English instruction to a single Linux bash command. Only return the command, nothing else. Instruction: {user_text}"
-    data = {
-        "contents": [{"parts": [{"text": prompt}]}]
-    }
-    response = requests.post(endpoint, headers=headers, json=data)
-    if response.status_code == 200:
+    try:
+        if on_chunk is None:
+            with tracing.span('model.generate', kind='translate'):
+                command = backend.generate(prompt, deadline=deadline).strip()
+        else:
+            command = ''
+            with tracing.span('model.stream', kind='translate') as sp:
+                for chunk in backend.stream(prompt, deadline=deadline):
+                    if not command:
+                        sp.mark('first_chunk_ms')
+                    command += chunk
+                    on_chunk(command)
+            command = command.strip()
+    except BackendResponseError as e:
+        raise BackendResponseError(f"Error parsing {backend.name} response: {e}", e.status) from e
+    except BackendError as e:
+        raise BackendError(f"{backend.name} API error: {e}", e.status) from e
+    if command:
+        get_cache().set(cache_key, command)
+        get_similarity_index().add('translate', user_text, command)
+    return command
+
+def find_similar_translation(user_text):
+    """
+    Returns (earlier prompt, command, score) for a previously translated prompt that asks
+    for the same thing in other words, or None. Never used without the user's confirmation:
+    callers show the earlier prompt and call accept_similar_translation if it is accepted.
+    """
+    if get_cache().get(f"translate:{user_text.strip().lower()}") is not None:
+        return None  # get_linux_command answers it from the cache anyway
+    with tracing.span('similarity.lookup', kind='translate'):
+        command, score, prompt = get_similarity_index().lookup('translate', user_text)
+    return (prompt, command, score) if command is not None else None
+
+def accept_similar_translation(user_text, command):
+    """
+    يسجل أن المستخدم قبل ترجمة طلب مشابه، ويحفظها لهذا الطلب بالضبط
+    """
+    record_lookup('translate', 'similar')
+    metering.get_meter().record_cache_hit('similar', code_path='translate')
+    get_cache().set(f"translate:{user_text.strip().lower()}", command)
+
+# إصلاحات هذه الجلسة: (الأمر، بصمة الخطأ) -> الأمر المصحح
+_FIX_CACHE = {}
+
+def error_tail(error_text, limit=FIX_TAIL_CHARS):
+    """
+    Returns at most limit characters from the end of error_text, starting at a line boundary.
+    """
+    text = (error_text or '').strip()
+    if len(text) <= limit:
+        return text
+    tail = text[-limit:]
+    newline = tail.find('\n')
+    return tail[newline + 1:] if 0 <= newline < len(tail) - 1 else tail
+
+def error_signature(returncode, error_text):
+    """
+    Identifies a failure independently of volatile details: the exit code plus the last
+    few error lines with numbers (PIDs, sizes, line numbers, times) masked out.
+    """
+    import hashlib
+    import re
+    lines = [line.strip().lower() for line in (error_text or '').splitlines() if line.strip()][-5:]
+    normalized = re.sub(r'\d+', '#', '\n'.join(lines))
+    return f"{returncode}:{hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]}"
+
+@metering.metered('fix')
+def fix_command(command, returncode, error_text, user_text=''):
+    """
+    Asks the model to correct a command that failed, sending only the exit code and a
+    bounded tail of its error output. The same failure (command + error signature) is
+    answered from a per-session cache. Raises BackendError if no fix could be obtained.
+    """
+    key = (command, error_signature(returncode, error_text))
+    if key in _FIX_CACHE:
+        metering.get_meter().record_cache_hit('exact')
+        return _FIX_CACHE[key]
+    require_model()
+    backend = get_backend()
+    prompt = (
+        "This Linux bash command failed.\n"
+        + (f"Task: {user_text}\n" if user_text else "")
+        + f"Command: {command}\n"
+        f"Exit code: {returncode}\n"
+        f"Last lines of its error output:\n{error_tail(error_text) or '(none)'}\n"
+        "Return ONLY the corrected single Linux bash command that accomplishes the task, nothing else."
+    )
+    try:
+        with tracing.span('model.generate', kind='fix'):
+            fixed = backend.generate(prompt).strip()
+    except BackendResponseError as e:
+        raise BackendResponseError(f"Error parsing {backend.name} response: {e}", e.status) from e
+    except BackendError as e:
+        raise BackendError(f"{backend.name} API error: {e}", e.status) from e
+    if not fixed:
+        raise BackendResponseError(f"{backend.name} returned an empty command")
+    _FIX_CACHE[key] = fixed
+    return fixed
+
+def describe_command(name, deadline=None):
+    """
+    Asks the model for a short description of a single command (or command + argument).
+    Returns None if the request fails or deadline (time.monotonic()) passes.
+    """
+    prompt = (
+        f"What does the Linux command '{name}' do? Answer in less than 10 words. Only return the description, nothing else."
+    )
+    try:
+        return get_backend('light').generate(prompt, timeout=4, deadline=deadline).strip() or None
+    except BackendError:
+        return None
+
+def describe_commands_batch(names, deadline=None):
+    """
+    Asks the model for short descriptions of several commands in a single request.
+    Returns a dict {name: description}; entries the model skipped are simply missing,
+    and so is everything if deadline (time.monotonic()) passes first.
+    """
+    timeout = 6 if deadline is None else min(6, deadline - time.monotonic())
+    if not names or timeout <= 0:
+        return {}
+    prompt = (
+        "For each of the following Linux commands, say what it does in less than 10 words.\n"
+        + "\n".join(f"- {name}" for name in names)
+        + "\nReturn ONLY a JSON object mapping each command exactly as written to its description: "
+        "{\"<command>\": \"<description>\", ...}. No explanations, just the JSON."
+    )
+    try:
+        text = get_backend('light').generate(prompt, timeout=timeout, deadline=deadline)
+        # التقط كائن JSON من الرد حتى لو كان داخل نص أو كتلة كود
+        descriptions = extract_json(text, '{')
+    except (BackendError, ValueError):
+        return {}
+    if not isinstance(descriptions, dict):
+        return {}
+    return {name: str(descriptions[name]).strip() for name in names if descriptions.get(name)}
+
+def get_descriptions(names, on_update=None, cancelled=None):
+    """
+    Returns {name: description or None} for all names. Local man/whatis descriptions
+    are used first; the rest come from one batched request, then entries missing from
+    the batch are fetched concurrently (at most DESCRIBE_CONCURRENCY at a time).
+    Everything, the batch and its retries included, ends by DESCRIBE_DEADLINE;
+    commands still missing then get their whatis summary, other names stay None.
+    on_update, if given, is called with a snapshot of the dict each time it changes.
+    cancelled, if given, is polled; once it returns True no further requests are sent
+    and what arrived so far is returned.
+    """
+    from local_index import lookup_descriptions, whatis_descriptions
+    descriptions = {name: None for name in names}
+    # الشروحات المحلية أولاً، بدون أي طلب شبكة
+    with tracing.span('descriptions.local', count=len(names)):
+        found = lookup_descriptions(names)
+        descriptions.update(found)
+    if found:
+        metering.get_meter().record_cache_hit('local', count=len(found))
+    cancelled = cancelled or (lambda: False)
+    missing = [name for name in names if descriptions[name] is None]
+    if not missing or not model_allowed() or cancelled():
+        return descriptions
+    deadline = time.monotonic() + DESCRIBE_DEADLINE
+    with tracing.span('descriptions.batch', count=len(missing)):
+        descriptions.update(describe_commands_batch(missing, deadline))
+    if on_update:
+        on_update(dict(descriptions))
+
+    missing = [name for name in names if descriptions[name] is None]
+    if not missing or cancelled():
+        return descriptions
+    if time.monotonic() < deadline:
+        _describe_concurrently(missing, descriptions, deadline, on_update, cancelled)
+    missing = [name for name in names if descriptions[name] is None]
+    if missing:
+        # انتهت المهلة: ملخص whatis المحلي أفضل من النص الافتراضي
+        with tracing.span('descriptions.whatis', count=len(missing)):
+            found = whatis_descriptions(missing)
+        descriptions.update(found)
+        if found:
+            metering.get_meter().record_cache_hit('local', count=len(found))
+            if on_update:
+                on_update(dict(descriptions))
+    return descriptions
+
+def _describe_concurrently(missing, descriptions, deadline, on_update, cancelled):
+    """
+    طلب شرح لكل أمر على حدة بالتوازي حتى المهلة أو الإلغاء (يحدّث descriptions في مكانه)
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    pool = ThreadPoolExecutor(max_workers=min(DESCRIBE_CONCURRENCY, len(missing)))
+    # كل طلب يعمل في نسخة من سياق المستدعي حتى يُحسب على نفس مسار metering
+    futures = {pool.submit(contextvars.copy_context().run, describe_command, name, deadline): name for name in missing}
+    pending = set(futures)
+    with tracing.span('descriptions.fanout', count=len(missing)):
         try:
-            command = response.json()['candidates'][0]['content']['parts'][0]['text'].strip()
-            return command
-        except Exception as e:
-            return f"Error parsing Gemini response: {e}"
-    else:
-        return f"Gemini API error: {response.status_code} {response.text}"
+            # ما لم يصل قبل المهلة يبقى None ويأخذ النص الافتراضي
+            while pending and not cancelled():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=min(remaining, 0.1), return_when=FIRST_COMPLETED)
+                for future in done:
+                    descriptions[futures[future]] = future.result()
+                if done and on_update:
+                    on_update(dict(descriptions))
+        finally:
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
 
-def get_command_suggestions(user_text):
+@metering.metered('suggest.fallback')
+def get_command_suggestions(user_text, on_update=None, cancelled=None):
+    """
+    Returns a list of (command, description) suggestions for user_text.
+    on_update, if given, receives the partial list every time a description arrives,
+    so callers can render rows progressively.
+    cancelled, if given, is polled like get_descriptions does; once it returns True no
+    further requests are sent, a streamed answer is abandoned and nothing is cached.
+    """
     user_text = user_text.strip()
 
     # التحقق من التخزين المؤقت أولاً
-    cache_key = user_text.lower()
-    current_time = time.time()
-    if cache_key in SUGGESTIONS_CACHE:
-        cache_item = SUGGESTIONS_CACHE[cache_key]
-        # التحقق من صلاحية التخزين المؤقت
-        if current_time - cache_item['timestamp'] < CACHE_EXPIRY:
-            return cache_item['suggestions']
+    cache_key = f"suggest:{user_text.lower()}"
+    with tracing.span('cache.lookup', kind='suggest') as sp:
+        cached = get_cache().get(cache_key)
+        sp.set(hit=cached is not None)
+    if cached is not None:
+        record_lookup('suggest', 'exact')
+        metering.get_meter().record_cache_hit('exact', code_path='suggest')
+        return [tuple(s) for s in cached]
 
     # إذا كان المستخدم لم يكتب إلا بادئة (حرف أو أكثر)
     if user_text in LINUX_COMMANDS:
         args = LINUX_COMMANDS[user_text]
-        suggestions = []
-        api_key = get_api_key()
-        # أضف شرح للأمر نفسه أولاً
-        if api_key:
-            endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-            headers = {"Content-Type": "application/json"}
-            prompt = (
-                f"What does the Linux command '{user_text}' do? Answer in less than 10 words. Only return the description, nothing else."
-            )
-            data = {"contents": [{"parts": [{"text": prompt}]}]}
-            try:
-                response = requests.post(endpoint, headers=headers, json=data, timeout=4)
-                if response.status_code == 200:
-                    desc = response.json()['candidates'][0]['content']['parts'][0]['text'].strip()
-                else:
-                    desc = f"{user_text} command"
-            except Exception:
-                desc = f"{user_text} command"
-        else:
-            desc = f"{user_text} command"
         extra = LINUX_COMMANDS_NEED_FILE.get(user_text, '')
-        if extra:
-            desc = f"{desc} (needs {extra})"
-        suggestions.append((user_text, desc))
-        # ثم أضف الأرجومنتات مع شرح مختصر
-        for arg in args:
-            if api_key:
-                prompt = (
-                    f"What does the Linux command '{user_text} {arg}' do? Answer in less than 10 words. Only return the description, nothing else."
-                )
-                data = {"contents": [{"parts": [{"text": prompt}]}]}
-                try:
-                    response = requests.post(endpoint, headers=headers, json=data, timeout=4)
-                    if response.status_code == 200:
-                        desc = response.json()['candidates'][0]['content']['parts'][0]['text'].strip()
-                    else:
-                        desc = f"{user_text} argument {arg}"
-                except Exception:
-                    desc = f"{user_text} argument {arg}"
-            else:
-                desc = f"{user_text} argument {arg}"
-            extra = LINUX_COMMANDS_NEED_FILE.get(user_text, '')
-            if extra:
-                suggestions.append((f"{user_text} {arg} {extra}", f"{desc} (needs {extra})"))
-            else:
-                suggestions.append((f"{user_text} {arg}", desc))
-
-        # تخزين النتائج في الذاكرة المؤقتة
-        save_to_cache(cache_key, suggestions)
-
-        return suggestions
 
-    matches = [cmd for cmd in LINUX_COMMANDS if cmd.startswith(user_text)]
-    if matches:
-        suggestions = []
-        api_key = get_api_key()
-        for cmd in matches:
-            if api_key:
-                endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-                headers = {"Content-Type": "application/json"}
-                prompt = (
-                    f"What does the Linux command '{cmd}' do? Answer in less than 10 words. Only return the description, nothing else."
-                )
-                data = {"contents": [{"parts": [{"text": prompt}]}]}
-                try:
-                    response = requests.post(endpoint, headers=headers, json=data, timeout=4)
-                    if response.status_code == 200:
-                        desc = response.json()['candidates'][0]['content']['parts'][0]['text'].strip()
-                    else:
-                        desc = f"{cmd} command"
-                except Exception:
-                    desc = f"{cmd} command"
-            else:
-                desc = f"{cmd} command"
-            extra = LINUX_COMMANDS_NEED_FILE.get(cmd, '')
+        def build(descriptions):
+            suggestions = []
+            # أضف شرح للأمر نفسه أولاً
+            desc = descriptions[user_text] or f"{user_text} command"
             if extra:
                 desc = f"{desc} (needs {extra})"
-            suggestions.append((cmd, desc))
+            suggestions.append((user_text, desc))
+            # ثم أضف الأرجومنتات مع شرح مختصر
+            for arg in args:
+                desc = descriptions[f"{user_text} {arg}"] or f"{user_text} argument {arg}"
+                if extra:
+                    suggestions.append((f"{user_text} {arg} {extra}", f"{desc} (needs {extra})"))
+                else:
+                    suggestions.append((f"{user_text} {arg}", desc))
+            return suggestions
+
+        names = [user_text] + [f"{user_text} {arg}" for arg in args]
+        code_path = 'describe.exact'
+    else:
+        # البحث بالبادئة في فهرس الأوامر (الجدول + كل البرامج الموجودة في PATH)
+        from command_index import get_command_index
+        with tracing.span('command_index.complete'):
+            matches = get_command_index().complete(user_text)
+        # أوامر الجدول أولاً ثم باقي البرامج
+        matches = sorted(matches, key=lambda cmd: cmd not in LINUX_COMMANDS)[:MAX_PREFIX_SUGGESTIONS]
 
-        # تخزين النتائج في الذاكرة المؤقتة
-        save_to_cache(cache_key, suggestions)
+        def build(descriptions):
+            suggestions = []
+            for cmd in matches:
+                desc = descriptions[cmd] or f"{cmd} command"
+                extra = LINUX_COMMANDS_NEED_FILE.get(cmd, '')
+                if extra:
+                    desc = f"{desc} (needs {extra})"
+                suggestions.append((cmd, desc))
+            return suggestions
 
+        names = matches
+        code_path = 'describe.prefix'
+
+    if names:
+        if on_update:
+            on_update(build({name: None for name in names}))
+        with metering.path(code_path):
+            descriptions = get_descriptions(names, on_update=(lambda d: on_update(build(d))) if on_update else None,
+                                            cancelled=cancelled)
+        suggestions = build(descriptions)
+        # تخزين النتائج في الذاكرة المؤقتة (فقط إذا وصلت كل الشروحات)
+        if all(descriptions.values()):
+            save_to_cache(cache_key, suggestions)
         return suggestions
 
-    # fallback: Gemini API
-    api_key = get_api_key()
-    if not api_key:
+    # fallback: model backend
+    with tracing.span('similarity.lookup', kind='suggest'):
+        similar, _, _ = get_similarity_index().lookup('suggest', user_text)
+    if similar is not None:
+        record_lookup('suggest', 'similar')
+        metering.get_meter().record_cache_hit('similar')
+        return [tuple(s) for s in json.loads(similar)]
+    record_lookup('suggest', 'miss')
+    cancelled = cancelled or (lambda: False)
+    if not model_allowed() or cancelled():
         return []
-    endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
     prompt = (
         f"Instruction: {user_text}\n"
         "Suggest 5 alternative or more accurate Linux commands for this task, each with a short description. "
         "Return ONLY a JSON list of objects: [{\"cmd\": \"...\", \"desc\": \"...\"}, ...]. No explanations, just the JSON."
     )
-    data = {"contents": [{"parts": [{"text": prompt}]}]}
-    response = requests.post(endpoint, headers=headers, json=data)
-    if response.status_code == 200:
-        import json, re
-        text = response.json()['candidates'][0]['content']['parts'][0]['text']
-        # حاول التقاط قائمة JSON من الرد حتى لو كانت داخل نص
+    backend = get_backend()
+    parser = JSONListParser()
+    try:
+        if on_update is None:
+            with tracing.span('model.generate', kind='suggest'):
+                text = backend.generate(prompt, schema=SUGGESTIONS_SCHEMA)
+        else:
+            # اعرض كل اقتراح بمجرد اكتمال الكائن الخاص به في البث
+            text = ''
+            with tracing.span('model.stream', kind='suggest') as sp:
+                chunks = backend.stream(prompt, schema=SUGGESTIONS_SCHEMA)
+                try:
+                    for chunk in chunks:
+                        if cancelled():
+                            sp.set(cancelled=True)
+                            return []
+                        if not text:
+                            sp.mark('first_chunk_ms')
+                        text += chunk
+                        if parser.feed(chunk):
+                            on_update(suggestion_tuples(parser.objects))
+                finally:
+                    chunks.close()  # يغلق اتصال البث إذا توقفنا قبل نهايته
+    except BackendError:
+        return []
+    with tracing.span('suggest.parse', size=len(text)) as sp:
         try:
-            # التقط أول قائمة تبدأ بـ [ وتنتهي بـ ]
-            match = re.search(r'(\[.*?\])', text, re.DOTALL)
-            if match:
-                json_text = match.group(1)
-            else:
-                json_text = text
-            suggestions = json.loads(json_text)
-            result = [(s.get('cmd', str(s)), s.get('desc', '')) for s in suggestions]
-            save_to_cache(cache_key, result)
-            return result
-        except Exception as e:
-            # إذا فشل التحويل، أظهر الرد الخام للمستخدم (للتصحيح)
-            print(f"[Gemini RAW Response]:\n{text}\n[Parsing error: {e}]")
+            result = validate_suggestions(extract_json(text, '['))
+        except ValueError as e:
+            # أنقذ الكائنات المكتملة بدون أي طلب إضافي
+            if not parser.objects:
+                parser.feed(text)
+            result = suggestion_tuples(parser.objects)
+            sp.set(invalid=str(e), salvaged=len(result))
+            error = e
+        else:
+            error = None
+    if error is not None and not result and not cancelled():
+        # طلب إصلاح واحد فقط، يرسل الرد المعطوب مع سبب الخطأ
+        result = repair_suggestions(backend, text, error)
+    if result:
+        save_to_cache(cache_key, result)
+        get_similarity_index().add('suggest', user_text, json.dumps([list(r) for r in result]))
+    return result
+
+# مخطط JSON لقائمة الاقتراحات (للواجهات التي تدعم المخرجات المنظمة)
+SUGGESTIONS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"cmd": {"type": "string"}, "desc": {"type": "string"}},
+        "required": ["cmd", "desc"],
+    },
+}
+
+def extract_json(text, opener):
+    """
+    Decodes the first complete JSON value that starts with opener ('[' or '{') in text,
+    skipping any prose or code fences around it. Brackets inside strings (e.g. "[ -f x ]")
+    are handled by the JSON decoder. Raises ValueError if there is none.
+    """
+    decoder = json.JSONDecoder()
+    start = text.find(opener)
+    while start != -1:
+        try:
+            return decoder.raw_decode(text, start)[0]
+        except ValueError:
+            start = text.find(opener, start + 1)
+    raise ValueError(f"no JSON {'list' if opener == '[' else 'object'} in response")
+
+def suggestion_tuples(objects):
+    """
+    (cmd, desc) tuples for the objects that have a non-empty "cmd" string; others are skipped.
+    """
+    return [
+        (obj['cmd'].strip(), str(obj.get('desc') or '').strip())
+        for obj in objects
+        if isinstance(obj, dict) and isinstance(obj.get('cmd'), str) and obj['cmd'].strip()
+    ]
+
+def validate_suggestions(value):
+    """
+    Checks that value is a list of {"cmd", "desc"} objects and returns it as tuples.
+    Raises ValueError naming the first problem.
+    """
+    if not isinstance(value, list):
+        raise ValueError(f"expected a JSON list, got {type(value).__name__}")
+    result = suggestion_tuples(value)
+    if len(result) != len(value):
+        bad = next(i for i, obj in enumerate(value)
+                   if not (isinstance(obj, dict) and isinstance(obj.get('cmd'), str) and obj['cmd'].strip()))
+        raise ValueError(f"item {bad} has no \"cmd\" string")
+    return result
+
+def repair_suggestions(backend, text, error):
+    """
+    Sends the invalid response back once with the parse error and returns the repaired
+    suggestions, or [] if that fails too.
+    """
+    prompt = (
+        f"This response should be a JSON list of objects with string fields \"cmd\" and \"desc\", "
+        f"but it is invalid ({error}). Return ONLY the corrected JSON list, keeping the same commands.\n\n"
+        f"{text[:4000]}"
+    )
+    with tracing.span('suggest.repair'):
+        try:
+            return validate_suggestions(extract_json(backend.generate(prompt, schema=SUGGESTIONS_SCHEMA), '['))
+        except (BackendError, ValueError):
             return []
-    else:
-        return []
+
+class JSONListParser:
+    """
+    Incremental parser for a JSON list of objects that arrives in chunks, e.g.
+    '[{"cmd": "ls"}, {"cmd": "l' yields {"cmd": "ls"} as soon as it is complete.
+    Every character is scanned once, however many chunks there are.
+    """
+
+    def __init__(self):
+        self.objects = []
+        self._text = ''
+        self._pos = 0
+        self._started = False
+        self._closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._obj_start = None
+
+    def feed(self, chunk):
+        """Adds chunk and returns the objects it completed."""
+        self._text += chunk
+        text = self._text
+        i = self._pos
+        if not self._started:
+            start = text.find('[', i)
+            if start == -1:
+                self._pos = len(text)
+                return []
+            self._started = True
+            i = start + 1
+        completed = []
+        while i < len(text) and not self._closed:
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        completed.append(json.loads(text[self._obj_start:i + 1]))
+                    except ValueError:
+                        pass
+            elif ch == ']' and self._depth == 0:
+                self._closed = True
+            i += 1
+        self._pos = i
+        self.objects.extend(completed)
+        return completed
 
 def save_to_cache(key, suggestions):
     """
     تخزين الاقتراحات في الذاكرة المؤقتة مع وقت الإضافة
     """
-    # إذا وصل حجم التخزين المؤقت للحد الأقصى، حذف أقدم عنصر
-    if len(SUGGESTIONS_CACHE) >= MAX_CACHE_SIZE:
-        oldest_key = min(SUGGESTIONS_CACHE.keys(), key=lambda k: SUGGESTIONS_CACHE[k]['timestamp'])
-        SUGGESTIONS_CACHE.pop(oldest_key)
+    # الحذف حسب الأقدم استخداماً (LRU) يتم داخل PersistentCache
+    get_cache().set(key, [list(s) for s in suggestions])
 
-    # إضافة الاقتراحات الجديدة مع الوقت الحالي
-    SUGGESTIONS_CACHE[key] = {
-        'suggestions': suggestions,
-        'timestamp': time.time()
-    }
+@metering.metered('plan')
+def get_command_plan(user_text):
+    """
+    Asks the model to break user_text into a small plan of shell steps with
+    dependencies and returns the validated planner.PlanSteps in dependency order.
+    An invalid plan is sent back once with the error for repair. Raises
+    BackendError if no valid plan could be obtained.
+    """
+    from planner import PLAN_SCHEMA, parse_plan
+    cache_key = f"plan:{user_text.strip().lower()}"
+    cached = get_cache().get(cache_key)
+    if cached is not None:
+        metering.get_meter().record_cache_hit('exact')
+        return parse_plan({'steps': cached})
+    require_model()
+    backend = get_backend()
+    prompt = (
+        f"Instruction: {user_text}\n"
+        "Break this task into Linux bash commands, one step per command. Give each step a short id, "
+        "the command, a short description and the ids of the steps that must finish before it ('after'). "
+        "Steps that don't depend on each other must not list each other so they can run in parallel. "
+        "Return ONLY JSON: {\"steps\": [{\"id\": \"...\", \"cmd\": \"...\", \"desc\": \"...\", \"after\": []}, ...]}."
+    )
+    try:
+        with tracing.span('model.generate', kind='plan'):
+            text = backend.generate(prompt, schema=PLAN_SCHEMA)
+        try:
+            steps = parse_plan(extract_json(text, '{'))
+        except ValueError as e:
+            # طلب إصلاح واحد فقط مع سبب الخطأ
+            repair = (
+                f"This plan is invalid ({e}). Return ONLY the corrected JSON plan in the same format, "
+                f"keeping the same commands.\n\n{text[:4000]}"
+            )
+            with tracing.span('plan.repair'):
+                text = backend.generate(repair, schema=PLAN_SCHEMA)
+            steps = parse_plan(extract_json(text, '{'))
+    except BackendResponseError as e:
+        raise BackendResponseError(f"Error parsing {backend.name} response: {e}", e.status) from e
+    except BackendError as e:
+        raise BackendError(f"{backend.name} API error: {e}", e.status) from e
+    except ValueError as e:
+        raise BackendResponseError(f"{backend.name} returned an invalid plan: {e}") from e
+    get_cache().set(cache_key, [step.to_dict() for step in steps])
+    return steps
@@ -0,0 +1,163 @@
+import atexit
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from cache_store import get_cache_dir
+
+# Execution history: which English prompt led to which (final) command, and
+# whether it worked. Rows are queued in memory and written by a background
+# thread in one transaction per batch, so recording never delays the prompt
+# loop. Prompts are indexed twice: by their normalized text (exact recall)
+# and in an FTS5 table (full-text search over hundreds of thousands of rows).
+
+HISTORY_ENABLED = os.environ.get('COMMANDIFY_HISTORY', '1') != '0'
+FLUSH_INTERVAL = 1.0  # seconds between background writes
+FLUSH_BATCH = 100  # queued rows that trigger an immediate write
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def prompt_key(prompt):
+    """Normalized form used for exact lookups: lowercase words, single spaces."""
+    return ' '.join(_WORD_RE.findall(prompt.lower()))
+
+
+class HistoryStore:
+    """SQLite-backed execution history with batched background writes."""
+
+    def __init__(self, path):
+        self._queue = []
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer = None
+        self.fts = False
+        try:
+            self._db = sqlite3.connect(path, timeout=2, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "id INTEGER PRIMARY KEY, prompt TEXT NOT NULL, prompt_key TEXT NOT NULL, command TEXT NOT NULL, "
+                "exit_status INTEGER NOT NULL, duration REAL NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS history_prompt_key ON history (prompt_key, created)")
+            try:
+                self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(prompt, command)")
+                self.fts = True
+            except sqlite3.OperationalError:
+                pass  # SQLite built without FTS5: exact lookups still work
+            self._db.commit()
+        except sqlite3.Error:
+            self._db = None
+
+    # --- Writes ---------------------------------------------------------------
+
+    def record(self, prompt, command, exit_status, duration):
+        """Queues one execution; it is written by the background thread."""
+        if self._db is None or not prompt or not command:
+            return
+        with self._lock:
+            self._queue.append((prompt, prompt_key(prompt), command, exit_status, duration, time.time()))
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='history-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+            if len(self._queue) >= FLUSH_BATCH:
+                self._wakeup.set()
+
+    def _write_loop(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Writes all queued rows in a single transaction."""
+        with self._lock:
+            rows, self._queue = self._queue, []
+        if not rows or self._db is None:
+            return
+        with self._db_lock:
+            try:
+                with self._db:
+                    for row in rows:
+                        cursor = self._db.execute(
+                            "INSERT INTO history (prompt, prompt_key, command, exit_status, duration, created) "
+                            "VALUES (?, ?, ?, ?, ?, ?)", row)
+                        if self.fts:
+                            self._db.execute("INSERT INTO history_fts (rowid, prompt, command) VALUES (?, ?, ?)",
+                                             (cursor.lastrowid, row[0], row[2]))
+            except sqlite3.Error:
+                pass
+
+    # --- Reads ----------------------------------------------------------------
+
+    def _query(self, sql, params):
+        if self._db is None:
+            return []
+        with self._db_lock:
+            try:
+                return self._db.execute(sql, params).fetchall()
+            except sqlite3.Error:
+                return []
+
+    def lookup(self, prompt):
+        """
+        Returns the most recent successful execution for prompt as a dict (command,
+        exit_status, duration, created, runs), or None. Failed runs are never offered again.
+        """
+        key = prompt_key(prompt)
+        if not key:
+            return None
+        rows = self._query(
+            "SELECT command, exit_status, duration, created FROM history WHERE prompt_key = ? "
+            "AND exit_status = 0 ORDER BY created DESC LIMIT 1", (key,))
+        if not rows:
+            return None
+        command, exit_status, duration, created = rows[0]
+        runs = self._query("SELECT COUNT(*) FROM history WHERE prompt_key = ? AND command = ?", (key, command))
+        return {'command': command, 'exit_status': exit_status, 'duration': duration, 'created': created,
+                'runs': runs[0][0] if runs else 1}
+
+    def recent_prompts(self, limit=500):
+        """Returns [(prompt, command)] for the most recent distinct prompts, newest first."""
+        return self._query(
+            "SELECT prompt, command FROM history WHERE id IN "
+            "(SELECT MAX(id) FROM history GROUP BY prompt_key) ORDER BY id DESC LIMIT ?", (limit,))
+
+    def search(self, text, limit=20):
+        """Full-text search over prompts and commands; returns recent-first row dicts."""
+        words = _WORD_RE.findall(text.lower())
+        if self.fts and words:
+            match = ' '.join(f'"{word}"*' for word in words)
+            rows = self._query(
+                "SELECT h.prompt, h.command, h.exit_status, h.duration, h.created FROM history_fts f "
+                "JOIN history h ON h.id = f.rowid WHERE history_fts MATCH ? ORDER BY h.created DESC LIMIT ?",
+                (match, limit))
+        else:
+            pattern = f"%{text.lower()}%"
+            rows = self._query(
+                "SELECT prompt, command, exit_status, duration, created FROM history "
+                "WHERE prompt_key LIKE ? OR command LIKE ? ORDER BY created DESC LIMIT ?",
+                (pattern, pattern, limit))
+        return [dict(zip(('prompt', 'command', 'exit_status', 'duration', 'created'), row)) for row in rows]
+
+
+_HISTORY = None
+_HISTORY_LOCK = threading.Lock()
+
+
+def get_history():
+    """Returns the shared history store, opening it on first use."""
+    global _HISTORY
+    with _HISTORY_LOCK:
+        if _HISTORY is None:
+            try:
+                path = os.path.join(get_cache_dir(), 'history.db')
+            except OSError:
+                path = ':memory:'
+            _HISTORY = HistoryStore(path)
+    return _HISTORY
@@ -0,0 +1,306 @@
+import mmap
+import os
+import re
+import struct
+import subprocess
+import threading
+import zlib
+
+from linux_commands_data import LINUX_COMMANDS, LINUX_COMMANDS_NEED_FILE
+from cache_store import get_cache_dir
+
+# Offline descriptions for LINUX_COMMANDS, built from the system's whatis/man pages.
+#
+# File layout (little endian), designed to be used straight from an mmap:
+#   magic (8 bytes) | signature (uint64) | count (uint32)
+#   count x (key_offset uint32, value_offset uint32), sorted by key
+#   NUL-terminated UTF-8 strings referenced by the offsets above
+INDEX_MAGIC = b'CMDIDX01'
+HEADER = struct.Struct('<8sQI')
+ENTRY = struct.Struct('<II')
+
+# Paths whose modification time changes when the man database is updated
+MAN_DB_PATHS = ['/var/cache/man/index.db', '/var/cache/man', '/usr/share/man/man1', '/usr/share/man/man8']
+
+# Commands whose --help is safe to run when they have no man page
+HELP_SAFE = {cmd for cmd, args in LINUX_COMMANDS.items() if '--help' in args}
+
+MAX_DESC_LENGTH = 70
+
+_BACKSPACE_RE = re.compile(r'.\x08')
+_WHATIS_RE = re.compile(r'^\S+\s*\([^)]*\)\s+-+\s+(.+)$')
+_FINAL_PERIOD_RE = re.compile(r'(?<=\w)\.$')  # "Lists files." but not "..." or "cd .."
+
+
+def index_signature():
+    """Returns a number that changes whenever the man database or LINUX_COMMANDS changes."""
+    signature = zlib.crc32(repr(sorted(LINUX_COMMANDS.items())).encode('utf-8'))
+    for path in MAN_DB_PATHS:
+        try:
+            signature = zlib.crc32(str(os.stat(path).st_mtime_ns).encode('ascii'), signature)
+        except OSError:
+            continue
+    return signature
+
+
+def _run(args, timeout=3):
+    env = dict(os.environ, MANWIDTH='200', MANPAGER='cat', PAGER='cat', LC_ALL='C')
+    try:
+        result = subprocess.run(args, env=env, text=True, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, timeout=timeout)
+    except (OSError, subprocess.SubprocessError):
+        return ''
+    return _BACKSPACE_RE.sub('', result.stdout or '')
+
+
+def _shorten(text):
+    text = ' '.join(text.split())
+    text = _FINAL_PERIOD_RE.sub('', text.split('. ')[0])
+    if len(text) > MAX_DESC_LENGTH:
+        text = text[:MAX_DESC_LENGTH - 3].rstrip() + '...'
+    return text
+
+
+def whatis_description(cmd):
+    """Returns the one-line whatis summary for cmd, or None."""
+    for line in _run(['whatis', cmd]).splitlines():
+        match = _WHATIS_RE.match(line.strip())
+        if match:
+            return _shorten(match.group(1))
+    return None
+
+
+def whatis_descriptions(names, timeout=1):
+    """Returns {name: whatis summary} for the single-word names, with one whatis call."""
+    commands = [name for name in names if name and ' ' not in name and not name.startswith('-')]
+    if not commands:
+        return {}
+    found = {}
+    for line in _run(['whatis'] + commands, timeout=timeout).splitlines():
+        match = _WHATIS_RE.match(line.strip())
+        name = line.split(None, 1)[0] if line.strip() else ''
+        if match and name in commands and name not in found:
+            found[name] = _shorten(match.group(1))
+    return found
+
+
+def parse_option_descriptions(text):
+    """
+    Extracts {option: description} from man or --help output. Handles both
+    "  -a, --all    do not ignore ..." and an option line followed by an indented description.
+    """
+    options = {}
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        indent = len(line) - len(line.lstrip())
+        if not stripped.startswith('-') or indent > 12:
+            continue
+        parts = re.split(r'\s{2,}', stripped, maxsplit=1)
+        spec = parts[0]
+        desc = parts[1] if len(parts) > 1 else ''
+        if not desc:
+            for following in lines[i + 1:i + 3]:
+                if following.strip():
+                    if len(following) - len(following.lstrip()) > indent:
+                        desc = following.strip()
+                    break
+        if not desc:
+            continue
+        for name in re.findall(r'(?:^|[\s,])(--?[\w][\w-]*)', spec):
+            options.setdefault(name, _shorten(desc))
+    return options
+
+
+def parse_subcommand_description(text, word):
+    """Finds a description for a subcommand (e.g. 'apt update') in man output."""
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        indent = len(line) - len(line.lstrip())
+        if indent > 12 or not re.match(rf'^{re.escape(word)}(\s|\(|$)', stripped):
+            continue
+        rest = re.split(r'\s{2,}', stripped, maxsplit=1)
+        if len(rest) > 1:
+            return _shorten(rest[1])
+        for following in lines[i + 1:i + 3]:
+            if following.strip() and len(following) - len(following.lstrip()) > indent:
+                return _shorten(following.strip())
+    return None
+
+
+def describe_arg(cmd, arg, options, text):
+    if arg in options:
+        return options[arg]
+    # Combined short flags such as -lh or -rf
+    if re.match(r'^-[A-Za-z]{2,}$', arg):
+        parts = [options.get(f'-{letter}') for letter in arg[1:]]
+        if all(parts):
+            return _shorten('; '.join(parts))
+        return None
+    if re.match(r'^[a-z][\w-]*$', arg):
+        return parse_subcommand_description(text, arg)
+    return None
+
+
+def collect_descriptions(cmd):
+    """Returns {name: description} for cmd and each of its LINUX_COMMANDS arguments."""
+    result = {}
+    desc = whatis_description(cmd)
+    text = _run(['man', cmd])
+    if not text.strip() and cmd in HELP_SAFE:
+        text = _run([cmd, '--help'])
+    if desc:
+        result[cmd] = desc
+    options = parse_option_descriptions(text) if text else {}
+    for arg in LINUX_COMMANDS.get(cmd, []):
+        arg_desc = describe_arg(cmd, arg, options, text)
+        if arg_desc:
+            result[f"{cmd} {arg}"] = arg_desc
+    return result
+
+
+def build_index(path, signature=None, workers=8):
+    """Builds the description index for every LINUX_COMMANDS entry and writes it to path."""
+    commands = iter(sorted(set(LINUX_COMMANDS) | set(LINUX_COMMANDS_NEED_FILE)))
+    entries = {}
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                cmd = next(commands, None)
+            if cmd is None:
+                return
+            descriptions = collect_descriptions(cmd)
+            with lock:
+                entries.update(descriptions)
+
+    # Plain daemon threads: ThreadPoolExecutor workers are joined at interpreter exit,
+    # which would make a command wait for a background rebuild before exiting
+    threads = [threading.Thread(target=work, name='index-build', daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    write_index(path, entries, index_signature() if signature is None else signature)
+    return entries
+
+
+def write_index(path, entries, signature):
+    keys = sorted(entries)
+    table = bytearray()
+    blob = bytearray()
+    blob_start = HEADER.size + ENTRY.size * len(keys)
+    for key in keys:
+        key_offset = blob_start + len(blob)
+        blob += key.encode('utf-8') + b'\0'
+        value_offset = blob_start + len(blob)
+        blob += entries[key].encode('utf-8') + b'\0'
+        table += ENTRY.pack(key_offset, value_offset)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(INDEX_MAGIC, signature, len(keys)))
+        f.write(table)
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+
+class DescriptionIndex:
+    """Read-only, memory-mapped view of an index file with binary-search lookups."""
+
+    def __init__(self, path):
+        self._map = None
+        self.count = 0
+        self.signature = None
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < HEADER.size:
+                    return
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        magic, self.signature, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC:
+            self._map, self.count, self.signature = None, 0, None
+
+    def _string(self, offset):
+        end = self._map.find(b'\0', offset)
+        return self._map[offset:end].decode('utf-8')
+
+    def get(self, name):
+        """Returns the description for name, or None."""
+        if not self.count:
+            return None
+        target = name.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            key_offset, value_offset = ENTRY.unpack_from(self._map, HEADER.size + mid * ENTRY.size)
+            key = self._map[key_offset:self._map.find(b'\0', key_offset)]
+            if key == target:
+                return self._string(value_offset)
+            if key < target:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+_REBUILD = None  # thread rebuilding a missing or outdated index, if one was started
+
+
+def _rebuild(path, signature):
+    global _INDEX
+    try:
+        build_index(path, signature)
+    except OSError:
+        return
+    index = DescriptionIndex(path)
+    with _INDEX_LOCK:
+        _INDEX = index
+
+
+def get_index(wait=False):
+    """
+    Returns the description index. If it is missing or the man database changed
+    since it was built, it is rebuilt in a background thread and the current
+    (possibly empty) index is served meanwhile; wait=True waits for the rebuild.
+    """
+    global _INDEX, _REBUILD
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            try:
+                path = os.path.join(get_cache_dir(), 'descriptions.idx')
+            except OSError:
+                _INDEX = DescriptionIndex(os.devnull)
+                return _INDEX
+            signature = index_signature()
+            _INDEX = DescriptionIndex(path)
+            if _INDEX.signature != signature:
+                _REBUILD = threading.Thread(target=_rebuild, args=(path, signature), daemon=True)
+                _REBUILD.start()
+        rebuild = _REBUILD
+    if wait and rebuild is not None:
+        rebuild.join()
+    return _INDEX
+
+
+def lookup_descriptions(names):
+    """Returns {name: description} for the names that have a local description."""
+    index = get_index()
+    found = {}
+    for name in names:
+        desc = index.get(name)
+        if desc:
+            found[name] = desc
+    return found
+
+
+def describe_locally(names):
+    """lookup_descriptions, plus the whatis summary of commands the index doesn't cover."""
+    found = lookup_descriptions(names)
+    found.update(whatis_descriptions([name for name in names if name not in found]))
+    return found
@@ -1,19 +1,17 @@
 #!/usr/bin/env python3
-import subprocess
 import sys
 import time
 import os
-from gemini_api import get_linux_command
-from gemini_api import get_command_suggestions, LINUX_COMMANDS, LINUX_COMMANDS_NEED_FILE, get_api_key, save_api_key # Added imports
-from prompt_toolkit.styles import Style
-from rich.console import Console
-from rich.prompt import Prompt
-from rich.panel import Panel
-from rich.text import Text
-from rich.align import Align # Added import
+_MODULE_START = time.time()  # Used by --startup-profile
+from executor import run_command
+import tracing
+from history import HISTORY_ENABLED, get_history
+# Heavier modules (gemini_api, rich, prompt_toolkit, requests) are
+# imported where they are used so quick mode starts as fast as possible; with the
+# daemon enabled, gemini_api is only imported if the daemon can't be reached.
 
 # Define colors and styles to enhance the user interface
-STYLE = Style.from_dict({
+STYLE_RULES = {
     # Autocomplete menu styles
     'completion-menu.completion': 'bg:#2c3e50 #ecf0f1',
     'completion-menu.completion.current': 'bg:#3498db #ffffff bold',
@@ -30,9 +28,87 @@ STYLE = Style.from_dict({
     'loading': '#e67e22 italic',
     # New style for dark yellow color
     'custom-prompt': 'ansiyellow bold',
-})
+}
+STYLE = None
 
-console = Console()
+def get_style():
+    """Builds the prompt_toolkit style on first use (importing prompt_toolkit is slow)."""
+    global STYLE
+    if STYLE is None:
+        from prompt_toolkit.styles import Style
+        STYLE = Style.from_dict(STYLE_RULES)
+    return STYLE
+
+CONSOLE = None
+
+def get_console():
+    """Builds the rich Console on first use (importing rich is slow)."""
+    global CONSOLE
+    if CONSOLE is None:
+        from rich.console import Console
+        CONSOLE = Console()
+    return CONSOLE
+
+class LazyConsole:
+    """Forwards attribute access to get_console(); pass get_console() where rich needs the Console itself."""
+
+    def __getattr__(self, name):
+        return getattr(get_console(), name)
+
+console = LazyConsole()
+
+def _process_start_time():
+    """Returns the wall-clock time the current process started (Linux only), or None."""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def startup_profile(as_json=False):
+    """
+    Measures the startup path up to the first prompt without touching the network
+    and prints a per-phase report (or JSON with --json).
+    """
+    import json
+    from gemini_api import get_api_key, get_cache
+    phases = []
+    process_start = _process_start_time()
+    if process_start is not None:
+        phases.append(('interpreter startup', _MODULE_START - process_start))
+    phases.append(('module imports', time.time() - _MODULE_START))
+
+    def measure(label, func):
+        start = time.perf_counter()
+        func()
+        phases.append((label, time.perf_counter() - start))
+
+    measure('read API key', get_api_key)
+    measure('open cache', get_cache)
+    measure('load rich console', get_console)
+    to_first_prompt = time.time() - (process_start if process_start is not None else _MODULE_START)
+    # Imported lazily, so they only cost time on the paths that need them
+    measure('deferred: requests (cache miss)', lambda: __import__('requests'))
+    measure('deferred: prompt_toolkit', get_style)
+
+    if as_json:
+        print(json.dumps({
+            'phases': {label: round(seconds * 1000, 3) for label, seconds in phases},
+            'time_to_first_prompt_ms': round(to_first_prompt * 1000, 3),
+            'frozen': bool(getattr(sys, 'frozen', False)),
+        }))
+        return
+    from rich.table import Table
+    table = Table(title="Startup profile", expand=False)
+    table.add_column("Phase", style="cyan")
+    table.add_column("ms", justify="right", style="yellow")
+    for label, seconds in phases:
+        table.add_row(label, f"{seconds * 1000:.1f}")
+    table.add_row("[bold]time to first prompt[/bold]", f"[bold]{to_first_prompt * 1000:.1f}[/bold]")
+    console.print(table)
 
 def get_current_alias(rc_file):
     """Tries to find the current alias for this application in the rc_file."""
@@ -179,11 +255,467 @@ def update_rc_file(rc_file, new_alias_name, new_alias_command):
         console.print(f"[red]Error writing to {rc_file}: {e}[/red]")
         return False # Indicate failure
 
+def print_cache_stats():
+    """Prints exact/similar cache hits, misses and hit rate per request kind."""
+    from rich.table import Table
+    from gemini_api import get_lookup_stats
+    table = Table(title="Cache statistics", expand=False)
+    for column in ("Kind", "Exact hits", "Similar hits", "Misses", "Hit rate"):
+        table.add_column(column, justify="right" if column != "Kind" else "left")
+    for kind, counts in sorted(get_lookup_stats().stats().items()):
+        exact, similar, misses = counts.get('exact', 0), counts.get('similar', 0), counts.get('miss', 0)
+        total = exact + similar + misses
+        rate = f"{(exact + similar) / total:.0%}" if total else "-"
+        table.add_row(kind, str(exact), str(similar), str(misses), rate)
+    console.print(table)
+    print_model_latency()
+
+def print_model_latency():
+    """Prints the rolling per-model latency windows that the hedge budget is derived from."""
+    from rich.table import Table
+    from routing import latency_path, read_windows
+    from tracing import summarize
+    windows = {key: [seconds * 1000 for seconds in samples]
+               for key, samples in read_windows(latency_path()).items() if samples}
+    if not windows:
+        return
+    table = Table(title="Model latency (rolling, ms)", expand=False)
+    for column in ("Model", "Samples", "p50", "p95", "p99", "Max"):
+        table.add_column(column, justify="right" if column != "Model" else "left")
+    for model, stats in sorted(summarize(windows).items()):
+        table.add_row(model, str(stats['count']), f"{stats['p50']:.0f}", f"{stats['p95']:.0f}",
+                      f"{stats['p99']:.0f}", f"{stats['max']:.0f}")
+    console.print(table)
+
+def print_usage(as_json=False):
+    """Prints model calls, tokens, errors and estimated cost per code path and model, and today's budget."""
+    import json
+    import metering
+    from rich.table import Table
+    data = metering.load_totals()
+    meter = metering.get_meter()
+    if as_json:
+        print(json.dumps(dict(data, user=meter.user, budget=meter.budget(), tokens_today=meter.tokens_today()), indent=2))
+        return
+    table = Table(title="Model usage", expand=False)
+    for column in ("Path", "Model", "Calls", "Prompt tokens", "Response tokens", "Errors", "Cost (USD)"):
+        table.add_column(column, justify="left" if column in ("Path", "Model") else "right", no_wrap=column == "Path")
+    totals = dict.fromkeys(metering.COUNTERS, 0)
+    for key, counts in sorted(data.get('series', {}).items()):
+        code_path, model = key.split('\t', 1)
+        for name in metering.COUNTERS:
+            totals[name] += counts.get(name, 0)
+        table.add_row(code_path, model, *(f"{counts.get(name, 0):,}" for name in metering.COUNTERS[:-1]),
+                      f"{counts.get('cost_usd', 0):.4f}")
+    table.add_row("[bold]total[/bold]", "", *(f"{totals[name]:,}" for name in metering.COUNTERS[:-1]),
+                  f"{totals['cost_usd']:.4f}")
+    console.print(table)
+    hits = data.get('cache_hits', {})
+    if hits:
+        table = Table(title="Answered without the model", expand=False)
+        for column in ("Path", "Source", "Hits"):
+            table.add_column(column, justify="right" if column == "Hits" else "left")
+        for key, count in sorted(hits.items()):
+            code_path, source = key.split('\t', 1)
+            table.add_row(code_path, source, f"{count:,}")
+        console.print(table)
+    budget = meter.budget()
+    used = meter.tokens_today()
+    console.print(f"Tokens used today by {meter.user}: [bold]{used:,}[/bold]"
+                  + (f" of {budget:,} ({used / budget:.0%})" if budget else " (no daily budget)"))
+
+def print_trace_table(title, summary):
+    """Prints per-span call counts and latency percentiles (ms)."""
+    from rich.table import Table
+    table = Table(title=title, expand=False)
+    table.add_column("Span", style="cyan")
+    for column in ("Calls", "Total", "p50", "p95", "p99", "Max"):
+        table.add_column(column, justify="right", style="yellow" if column != "Calls" else None)
+    for name, stats in summary.items():
+        table.add_row(name, str(stats['count']), *(f"{stats[key]:.1f}" for key in ('total', 'p50', 'p95', 'p99', 'max')))
+    console.print(table)
+
+def finish_profile(show_table):
+    """Writes this run's trace file at exit and, under --profile, prints the summary table."""
+    try:
+        path = tracing.write_trace(metadata={'argv': sys.argv[1:], 'frozen': bool(getattr(sys, 'frozen', False)), 'daemon': USE_DAEMON})
+    except OSError:
+        path = None
+    if show_table:
+        print_trace_table("Profile (ms)", tracing.summary())
+        if path:
+            console.print(f"[dim]Chrome trace written to {path}[/dim]")
+
+def trace_report(args):
+    """`--trace-report [DIR|FILE...] [--json]`: p50/p95/p99 per span across collected trace files."""
+    import glob
+    import json
+    as_json = '--json' in args
+    targets = [arg for arg in args if arg != '--json'] or [tracing.trace_dir()]
+    paths = []
+    for target in targets:
+        paths.extend(sorted(glob.glob(os.path.join(target, '*.json'))) if os.path.isdir(target) else [target])
+    summary = tracing.aggregate(paths)
+    if as_json:
+        print(json.dumps({'files': len(paths), 'spans': summary}))
+    else:
+        print_trace_table(f"Trace report ({len(paths)} files, ms)", summary)
+
+# Use the warm background daemon (started on demand) when COMMANDIFY_DAEMON=1
+USE_DAEMON = os.environ.get('COMMANDIFY_DAEMON') == '1'
+
+def daemon_command():
+    """Command line that starts the background daemon."""
+    if getattr(sys, 'frozen', False):
+        return [sys.executable, '--daemon']
+    return [sys.executable, os.path.abspath(__file__), '--daemon']
+
+def translate(user_input, on_chunk=None):
+    """get_linux_command, served by the daemon when enabled (falls back to in-process)."""
+    with tracing.span('translate', daemon=USE_DAEMON):
+        return _translate(user_input, on_chunk)
+
+def _translate(user_input, on_chunk):
+    if USE_DAEMON:
+        import daemon
+        result = daemon.request('translate', user_input, on_chunk=on_chunk, spawn_command=daemon_command())
+        if result is not None:
+            return result
+    from gemini_api import get_linux_command
+    return get_linux_command(user_input, on_chunk=on_chunk)
+
+def translate_errors():
+    """
+    Exceptions translate() raises when no command could be obtained. Only evaluated
+    while an exception is being handled, so neither module is imported up front.
+    """
+    import daemon
+    from backends import BackendError
+    return (BackendError, daemon.RemoteError)
+
+def suggest(user_text, on_update=None, cancelled=None):
+    """get_command_suggestions, served by the daemon when enabled (falls back to in-process)."""
+    with tracing.span('suggest', daemon=USE_DAEMON):
+        return _suggest(user_text, on_update, cancelled)
+
+def _suggest(user_text, on_update, cancelled=None):
+    if cancelled and cancelled():
+        return []
+    if USE_DAEMON:
+        import daemon
+        try:
+            result = daemon.request('suggest', user_text, spawn_command=daemon_command())
+        except daemon.RemoteError:
+            return []  # as get_command_suggestions does when the model fails
+        if result is not None:
+            return [tuple(s) for s in result]
+    from gemini_api import get_command_suggestions
+    return get_command_suggestions(user_text, on_update=on_update, cancelled=cancelled)
+
+# Speculatively fetch alternatives after showing a suggestion (COMMANDIFY_PREFETCH=0 disables it).
+# Costs one extra model request per suggestion the user reads for longer than PREFETCH_DELAY
+# (less if the alternatives are cached), metered as prefetch:suggest.fallback in --usage;
+# answering within PREFETCH_DELAY cancels it before anything is sent.
+PREFETCH_ENABLED = os.environ.get('COMMANDIFY_PREFETCH', '1') != '0'
+PREFETCH_DELAY = 0.5  # seconds
+ALTERNATIVES_SUFFIX = " (give me more alternatives and options)"
+
+class Prefetch:
+    """
+    Runs func(*args, cancelled=...) in a background daemon thread after delay seconds, so
+    its result is ready when the user asks. cancel() within the delay means func never runs;
+    after that func polls cancelled() and sends no further requests. One already in flight
+    finishes in the background but never blocks the user or exiting.
+    """
+
+    def __init__(self, func, *args, delay=PREFETCH_DELAY):
+        import threading
+        self._cancel = threading.Event()
+        self._result = None
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(func, args, delay), name='prefetch', daemon=True).start()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def _run(self, func, args, delay):
+        try:
+            if self._cancel.wait(delay):
+                return
+            import metering  # kept apart from the user's own requests in traces and --usage
+            with metering.speculative('prefetch'), tracing.span('prefetch'):
+                self._result = func(*args, cancelled=self._cancel.is_set)
+        except Exception:
+            self._result = None
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        self._done.wait(timeout)
+        return None if self.cancelled else self._result
+
+    def cancel(self):
+        self._cancel.set()
+
+def start_prefetch(user_input):
+    """Starts fetching alternatives for user_input."""
+    return Prefetch(_suggest, user_input + ALTERNATIVES_SUFFIX, None)
+
+# Remember prompt -> command -> outcome and offer it next time (COMMANDIFY_HISTORY=0 disables it)
+def format_age(seconds):
+    """Human-readable 'how long ago' for a number of seconds."""
+    for unit, size in (('day', 86400), ('hour', 3600), ('minute', 60)):
+        if seconds >= size:
+            count = int(seconds // size)
+            return f"{count} {unit}{'s' if count != 1 else ''} ago"
+    return "just now"
+
+def print_history(query):
+    """`--history [QUERY]`: recent executions whose prompt or command matches query."""
+    from rich.markup import escape
+    from rich.table import Table
+    rows = get_history().search(query)
+    table = Table(title="History", expand=False)
+    for column in ("When", "Prompt", "Command", "Exit", "Seconds"):
+        table.add_column(column, justify="right" if column in ("Exit", "Seconds") else "left")
+    for row in rows:
+        exit_style = "green" if row['exit_status'] == 0 else "red"
+        table.add_row(format_age(time.time() - row['created']), escape(row['prompt']), f"[yellow]{escape(row['command'])}[/yellow]",
+                      f"[{exit_style}]{row['exit_status']}[/{exit_style}]", f"{row['duration']:.2f}")
+    console.print(table)
+
+def lookup_history(user_input):
+    """history lookup, served by the daemon when enabled (so quick mode doesn't open the database first)."""
+    if USE_DAEMON:
+        import daemon
+        try:
+            past = daemon.request('history', user_input, spawn_command=daemon_command())
+        except daemon.RemoteError:
+            past = {}
+        if past is not None:
+            return past or None
+    return get_history().lookup(user_input)
+
+def offer_history(user_input):
+    """If user_input succeeded before, offers the command that ran; returns it if accepted."""
+    from rich.markup import escape
+    from rich.panel import Panel
+    from rich.prompt import Prompt
+    past = lookup_history(user_input)
+    if not past or past['exit_status'] != 0:
+        return None
+    runs = f", {past['runs']} runs" if past['runs'] > 1 else ""
+    console.print(Panel(
+        f"[bold green]You ran this for the same request {format_age(time.time() - past['created'])}[/bold green] ([green]succeeded[/green]{runs}):\n"
+        f"[yellow]{escape(past['command'])}[/yellow]", expand=False))
+    choice = Prompt.ask("[bold blue](u)se it  (n)ew suggestion[/bold blue]", default='u').strip().lower()
+    if choice == 'n':
+        return None
+    import metering
+    metering.get_meter().record_cache_hit('history', code_path='translate')
+    return past['command']
+
+def offer_similar(user_input):
+    """
+    If a differently worded request with the same key terms was translated before, shows
+    that request and its command and returns the command only if the user accepts it.
+    """
+    from rich.markup import escape
+    from rich.panel import Panel
+    from rich.prompt import Prompt
+    match = None
+    if USE_DAEMON:
+        import daemon
+        try:
+            match = daemon.request('similar', user_input, spawn_command=daemon_command())
+        except daemon.RemoteError:
+            match = []
+    if match is None:
+        from gemini_api import find_similar_translation
+        match = find_similar_translation(user_input)
+    if not match:
+        return None
+    prompt, command, score = match
+    console.print(Panel(
+        f"[bold green]A similar request was answered before[/bold green] ({score:.0%} similar):\n"
+        f"[cyan]\"{escape(prompt)}\"[/cyan]\n[yellow]{escape(command)}[/yellow]", expand=False))
+    choice = Prompt.ask("[bold blue](u)se it  (n)ew suggestion[/bold blue]", default='n').strip().lower()
+    if choice != 'u':
+        return None
+    from gemini_api import accept_similar_translation
+    accept_similar_translation(user_input, command)
+    return command
+
+# Completion while typing the English instruction (COMMANDIFY_COMPLETION=0 disables it)
+PROMPT_SESSION = None
+
+def get_prompt_session():
+    """Builds the prompt_toolkit session and its completer on first use."""
+    global PROMPT_SESSION
+    if PROMPT_SESSION is None:
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.application.current import get_app_or_none
+        from command_index import get_command_index
+        from local_index import describe_locally
+        from completer import CommandifyCompleter
+        import metering
+        from gemini_api import backend_ready, get_cache, get_descriptions
+
+        def refresh():
+            app = get_app_or_none()
+            if app is not None:
+                app.invalidate()
+
+        def cached_prompts():
+            return [(key.split(':', 1)[1], value) for key, value in get_cache().items('translate:')]
+
+        sources = ([get_history().recent_prompts] if HISTORY_ENABLED else []) + [cached_prompts]
+        completer = CommandifyCompleter(get_command_index(), describe_locally,
+                                        describe=metering.metered('describe.completion')(get_descriptions) if backend_ready() else None,
+                                        prompt_sources=sources, on_refresh=refresh)
+        PROMPT_SESSION = PromptSession(style=get_style(), completer=completer, complete_while_typing=True)
+    return PROMPT_SESSION
+
+def ask_instruction(message):
+    """Asks for an English instruction, with live completion when attached to a terminal."""
+    from completer import COMPLETION_ENABLED
+    if not (COMPLETION_ENABLED and sys.stdin.isatty() and sys.stdout.isatty()):
+        from rich.prompt import Prompt
+        return Prompt.ask(f"[bold cyan]{message}[/bold cyan]")
+    return get_prompt_session().prompt([('ansicyan bold', f"{message}: ")])
+
+# Propose a corrected command as soon as an execution fails (otherwise press f)
+AUTOFIX_ENABLED = os.environ.get('COMMANDIFY_AUTOFIX') == '1'
+
+def format_suggestions(suggestions):
+    """Formats (command, description) pairs as numbered rows for a suggestions panel."""
+    return '\n'.join(f"[cyan]{i+1}.[/cyan] [yellow]{cmd}[/yellow] — {desc}" for i, (cmd, desc) in enumerate(suggestions))
+
+def plan_mode(user_text, workers=None):
+    """
+    Asks the model for a multi-step plan, shows it, and on confirmation runs
+    independent steps in parallel. Returns True if every step succeeded.
+    """
+    from rich.markup import escape
+    from rich.table import Table
+    from rich.prompt import Prompt
+    from gemini_api import BackendError, get_command_plan
+    from planner import PLAN_WORKERS, run_plan
+    workers = workers or PLAN_WORKERS
+
+    with console.status("[yellow]Planning steps with Gemini...[/yellow]"):
+        try:
+            steps = get_command_plan(user_text)
+        except BackendError as e:
+            console.print(f"[red]{escape(str(e))}[/red]")
+            return False
+    table = Table(title="Plan", expand=False)
+    for column in ("Step", "Command", "After", "Description"):
+        table.add_column(column)
+    for step in steps:
+        table.add_row(escape(step.id), f"[yellow]{escape(step.cmd)}[/yellow]", escape(', '.join(step.after)) or '-', escape(step.desc))
+    console.print(table)
+    from preflight import analyze
+    for step in steps:
+        # Steps run without a terminal, so a step that needs root can't ask for a sudo password
+        print_findings(analyze(step.cmd), prefix=f"[cyan]{escape(step.id)}:[/cyan] ", show_privileged=True)
+    if Prompt.ask(f"[bold blue]Run this plan ({workers} in parallel)? (y/n)[/bold blue]").strip().lower() != 'y':
+        console.print("[yellow]Plan cancelled.[/yellow]")
+        return False
+
+    def on_output(step, text, is_stderr):
+        color = "red" if is_stderr else "white"
+        for line in text.splitlines():
+            console.print(f"[cyan]\\[{escape(step.id)}][/cyan] [{color}]{escape(line)}[/{color}]", highlight=False)
+
+    def on_status(step):
+        if step.status == 'running':
+            console.print(f"[cyan]▶ {escape(step.id)}[/cyan] [yellow]{escape(step.cmd)}[/yellow]")
+        elif step.status == 'ok':
+            console.print(f"[green]✓ {escape(step.id)}[/green] ({step.result.duration:.1f}s)")
+        elif step.status == 'failed':
+            reason = f"exit {step.result.returncode}" if step.result else escape(step.error or 'not run')
+            console.print(f"[red]✗ {escape(step.id)} failed ({reason})[/red]")
+        elif step.status == 'skipped':
+            console.print(f"[yellow]- {escape(step.id)} skipped (a dependency failed)[/yellow]")
+
+    with tracing.span('plan.run', steps=len(steps), workers=workers) as sp:
+        result = run_plan(steps, workers, on_output, on_status)
+        sp.set(success=result.success)
+    summary = Table(title="Plan result", expand=False)
+    for column in ("Step", "Status", "Exit", "Seconds"):
+        summary.add_column(column, justify="right" if column in ("Exit", "Seconds") else "left")
+    colors = {'ok': 'green', 'failed': 'red', 'skipped': 'yellow'}
+    for step in result.steps:
+        summary.add_row(
+            escape(step.id), f"[{colors.get(step.status, 'white')}]{step.status}[/]",
+            str(step.result.returncode) if step.result else '-',
+            f"{step.result.duration:.2f}" if step.result else '-',
+        )
+    console.print(summary)
+    speedup = f" — {result.speedup:.1f}x faster" if result.speedup else ""
+    console.print(f"[bold]Wall time {result.wall_time:.2f}s vs {result.serial_time:.2f}s run serially{speedup}[/bold]")
+    for step in result.steps:
+        if step.result and step.result.spool_path:
+            console.print(f"[yellow]Full output of {escape(step.id)} saved to {step.result.spool_path}[/yellow]")
+    return result.success
+
+def plan_main(args):
+    """Entry point for `main.py --plan [--workers N] <instruction>`."""
+    import argparse
+    parser = argparse.ArgumentParser(prog='commandify --plan', description='Break an instruction into steps and run independent ones in parallel.')
+    parser.add_argument('instruction', nargs='+', help='what to do, in English')
+    parser.add_argument('--workers', type=int, help='maximum steps running at once (default: COMMANDIFY_PLAN_WORKERS)')
+    options = parser.parse_intermixed_args(args)  # --workers may come anywhere
+    if options.workers is not None and options.workers < 1:
+        parser.error('--workers must be at least 1')
+    return 0 if plan_mode(' '.join(options.instruction), options.workers) else 1
+
+# Local checks before a command runs: missing tools, destructive effects, root privileges
+def print_findings(analysis, prefix='', show_privileged=False):
+    """Prints the missing-tool, destructive and syntax findings (and optionally privileged ones) of a pre-flight analysis."""
+    from rich.markup import escape
+    from command_index import get_path_executables
+    from preflight import suggest_binary
+    for finding in analysis.findings:
+        if finding.kind == 'missing':
+            close = suggest_binary(finding.stage.binary, get_path_executables())
+            hint = f" (did you mean {', '.join(close)}?)" if close else ""
+            console.print(f"{prefix}[red]✗ {escape(finding.message)}{escape(hint)}[/red]")
+        elif finding.kind == 'destructive':
+            console.print(f"{prefix}[bold red]⚠ {escape(finding.message)}[/bold red]")
+        elif finding.kind == 'syntax':
+            console.print(f"{prefix}[red]✗ {escape(finding.message)}[/red]")
+        elif show_privileged and analysis.needs_sudo:
+            console.print(f"{prefix}[yellow]needs root: {escape(finding.message)}[/yellow]")
+
+def preflight_check(cmd):
+    """
+    Analyzes cmd before it runs and reports what it found. Returns (run, analysis);
+    run is False if the command has a missing tool, a destructive effect or a
+    syntax error and the user chose not to run it anyway.
+    """
+    from rich.prompt import Prompt
+    from preflight import analyze
+    with tracing.span('preflight') as sp:
+        analysis = analyze(cmd)
+        sp.set(findings=len(analysis.findings))
+    if not any(finding.kind != 'privileged' for finding in analysis.findings):
+        return True, analysis
+    print_findings(analysis)
+    answer = Prompt.ask("[bold yellow]Run it anyway?[/bold yellow] (y/n)", default='n').strip().lower()
+    return answer == 'y', analysis
+
 def terminal_mode_with_prompt(user_prompt=None, show_tip=False):
     # (Keep the existing terminal_mode_with_prompt function content as is)
     # ... (original function code) ...
-    # Define privileged commands list at the top level
-    privileged_commands = ['dmidecode', 'fdisk', 'mount', 'umount', 'apt', 'apt-get', 'dpkg', 'systemctl', 'service']
+    from rich.panel import Panel
+    from rich.prompt import Prompt
+    last_failure = {}  # command, returncode and error output of the last failed execution, for (f)ix
 
     def execute_command(cmd, is_privileged=False):
         """Helper function to execute commands with proper error handling"""
@@ -193,71 +725,136 @@ def terminal_mode_with_prompt(user_prompt=None, show_tip=False):
                 cmd = f"sudo {cmd}"
         
         try:
-            # Use Popen for potentially interactive commands, but run for simple ones
-            # For now, stick with run, assuming non-interactive commands from Gemini
-            result = subprocess.run(cmd, shell=True, check=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if result.stdout:
-                console.print(result.stdout, end='')
-            if result.stderr:
-                console.print(f"[red]{result.stderr}[/red]", end='') # Print stderr in red
-            return (True, None)  # Success with no error
-        except subprocess.CalledProcessError as e:
-            error_output = e.stderr if e.stderr else e.stdout
-            if error_output:
-                console.print(f"[red]{error_output}[/red]", end='') # Print stderr in red
-            else: # If no stderr/stdout, print the exception message itself
-                 console.print(f"[red]Error executing command: {e}[/red]")
-                 
+            # Stream output as it is produced; only a bounded tail is kept for error analysis.
+            # Interactive programs (top, vim, ...) get a pseudo-terminal.
+            from rich.markup import escape
+            with tracing.span('execute') as sp:
+                result = run_command(
+                    cmd,
+                    on_stdout=lambda text: console.out(text, end='', highlight=False),
+                    on_stderr=lambda text: console.print(f"[red]{escape(text)}[/red]", end=''), # Print stderr in red
+                )
+                sp.set(returncode=result.returncode)
+            if HISTORY_ENABLED:
+                # user_input is the English prompt currently being handled (set below)
+                get_history().record(user_input, cmd, result.returncode, result.duration)
+            if result.spool_path:
+                console.print(f"[yellow]Full output saved to {result.spool_path}[/yellow]")
+            if result.success:
+                last_failure.clear()
+                return (True, None)  # Success with no error
+            error_output = result.error_output
+            last_failure.update(cmd=cmd, returncode=result.returncode, error=error_output)
+            if not error_output: # If no stderr/stdout, print the exit status itself
+                 console.print(f"[red]Error executing command: exit status {result.returncode}[/red]")
+
             # Improved sudo prompt logic
-            if "permission denied" in str(e).lower() or (error_output and "permission denied" in error_output.lower()) and not cmd.startswith('sudo '):
+            if error_output and "permission denied" in error_output.lower() and not cmd.startswith('sudo '):
                 retry_sudo = Prompt.ask("[bold yellow]Permission denied. Retry with sudo?[/bold yellow] (y/n)").strip().lower()
                 if retry_sudo == 'y':
                     return execute_command(f"sudo {cmd}", False) # Retry with sudo, is_privileged becomes False
-            return (False, error_output or str(e))  # Return both status and error
+            return (False, error_output or f"Command exited with status {result.returncode}")  # Return both status and error
         except FileNotFoundError:
              console.print(f"[red]Error: Command not found: {cmd.split()[0]}[/red]")
+             last_failure.update(cmd=cmd, returncode=127, error=f"Command not found: {cmd.split()[0]}")
              return (False, f"Command not found: {cmd.split()[0]}")
         except Exception as general_exception:
              console.print(f"[red]An unexpected error occurred: {general_exception}[/red]")
+             last_failure.clear()  # nothing ran, so there is no exit status or output to fix
              return (False, str(general_exception))
 
+    def run_checked(cmd):
+        """Runs the pre-flight check on cmd, then executes it (offering sudo when it needs root)."""
+        run, analysis = preflight_check(cmd)
+        if not run:
+            problems = analysis.of_kind('missing') + analysis.of_kind('syntax')
+            if problems:
+                # Nothing ran, but (f)ix can still correct the command
+                last_failure.update(cmd=cmd, returncode=127 if analysis.of_kind('missing') else 2,
+                                    error='\n'.join(finding.message for finding in problems))
+            return (False, None)
+        return execute_command(cmd, analysis.needs_sudo)
+
+    def request_fix(user_input):
+        """Asks the model to correct the last failed command; returns the fix or None."""
+        from rich.markup import escape
+        from gemini_api import BackendError, fix_command
+        if not last_failure:
+            console.print("[yellow]Nothing to fix yet: run a command first.[/yellow]")
+            return None
+        with console.status("[yellow]Asking Gemini for a fix...[/yellow]"):
+            try:
+                with tracing.span('fix'):
+                    fixed = fix_command(last_failure['cmd'], last_failure['returncode'], last_failure['error'], user_input)
+            except BackendError as e:
+                console.print(f"[red]{escape(str(e))}[/red]")
+                return None
+        if fixed == last_failure['cmd']:
+            console.print("[yellow]Gemini suggested the same command again; try (m)odify or (s)uggestions.[/yellow]")
+            return None
+        return fixed
+
     # Rest of the function implementation
     try:
-        api_key = get_api_key()
-        if not api_key:
-            # This part should ideally not be reached if main() handles it first
-            console.print("[yellow]No Gemini API key found. Please run the app without arguments first to set it up.[/yellow]")
-            return
+        # With the daemon, a missing key is reported by the daemon (checking here would import gemini_api)
+        if not USE_DAEMON:
+            from gemini_api import backend_ready
+            if not backend_ready():
+                # This part should ideally not be reached if main() handles it first
+                console.print("[yellow]No Gemini API key found. Please run the app without arguments first to set it up.[/yellow]")
+                return
 
         # Get initial user input
         if user_prompt is not None:
             user_input = user_prompt.strip()
         else:
-            user_input = Prompt.ask("[bold cyan]Enter your command in English (or 'exit')[/bold cyan]").strip()
+            user_input = ask_instruction("Enter your command in English (or 'exit')").strip()
         
         if user_input.lower() == 'exit':
             console.print("[bold yellow]Goodbye![/bold yellow]")
             return
 
         while True:  # Main command execution loop
-            console.print("[yellow]Getting suggestion from Gemini...[/yellow]")
-            linux_cmd = get_linux_command(user_input)
+            # Offer what ran for the same request last time before asking the model
+            linux_cmd = offer_history(user_input) if HISTORY_ENABLED else None
+            if not linux_cmd:
+                # A differently worded request is only reused after the user confirms it
+                linux_cmd = offer_similar(user_input)
+            if not linux_cmd:
+                console.print("[yellow]Getting suggestion from Gemini...[/yellow]")
+                # Stream the command into the panel as it is generated
+                from rich.live import Live
+                from rich.markup import escape
+                try:
+                    with Live(console=get_console(), transient=True) as live:
+                        linux_cmd = translate(
+                            user_input,
+                            on_chunk=lambda partial: live.update(Panel(f"[bold green]Suggested Linux command:[/bold green]\n[yellow]{escape(partial)}[/yellow]", expand=False)),
+                        )
+                except translate_errors() as e:
+                    console.print(f"[red]{escape(str(e))}[/red]")
+                    linux_cmd = None
             if not linux_cmd:
                  console.print("[red]Failed to get command suggestion. Please try again or rephrase.[/red]")
-                 user_input = Prompt.ask("[bold cyan]Re-enter your command in English (or 'exit')[/bold cyan]").strip()
+                 user_input = ask_instruction("Re-enter your command in English (or 'exit')").strip()
                  if user_input.lower() == 'exit':
                      console.print("[bold yellow]Goodbye![/bold yellow]")
                      return
                  continue # Go back to start of loop
                  
             show_box = True
-            
+            prefetch = None
+
             while True:  # Command execution inner loop
                 if show_box:
                     console.print(Panel(f"[bold green]Suggested Linux command:[/bold green]\n[yellow]{linux_cmd}[/yellow]", expand=False))
                     show_box = False
+                    if PREFETCH_ENABLED and prefetch is None:
+                        # Fetch alternatives while the user reads the panel, so (s) is usually instant
+                        prefetch = start_prefetch(user_input)
                 
-                confirm = Prompt.ask("[bold blue](e)xecute  (m)odify  (r)eprompt  (s)uggestions  (c)ancel[/bold blue]").strip().lower()
+                actions = "(e)xecute  (m)odify  (r)eprompt  (s)uggestions  (p)lan  " + ("(f)ix  " if last_failure else "") + "(c)ancel"
+                confirm = Prompt.ask(f"[bold blue]{actions}[/bold blue]").strip().lower()
                 
                 if confirm == 'm':
                     linux_cmd = Prompt.ask("[bold cyan]Enter modified command[/bold cyan]", default=linux_cmd).strip()
@@ -265,9 +862,10 @@ def terminal_mode_with_prompt(user_prompt=None, show_tip=False):
                     continue
 
                 elif confirm == 'e':
+                    if prefetch:
+                        prefetch.cancel()
                     # Execute the command
-                    is_privileged = any(cmd in linux_cmd for cmd in privileged_commands)
-                    success, error = execute_command(linux_cmd, is_privileged)
+                    success, error = run_checked(linux_cmd)
                     # If successful, exit. If failed, stay in the inner loop to allow modification/retry.
                     if success:
                         # Decide whether to exit or ask for another command
@@ -276,22 +874,60 @@ def terminal_mode_with_prompt(user_prompt=None, show_tip=False):
                              sys.exit(0)
                         else: # If in interactive mode, break inner loop to ask for new command
                              break 
-                    # On failure, just continue the inner loop (stay with the same suggested command)
+                    # On failure, stay in the inner loop; with COMMANDIFY_AUTOFIX=1 propose a fix right away,
+                    # but only when the command actually ran and failed just now (error is None when the
+                    # user declined it or the pre-flight check stopped it, and last_failure may be stale)
+                    if AUTOFIX_ENABLED and error is not None and last_failure:
+                        fixed = request_fix(user_input)
+                        if fixed:
+                            linux_cmd = fixed
+                            show_box = True
                     continue 
 
+                elif confirm == 'f':
+                    fixed = request_fix(user_input)
+                    if fixed:
+                        linux_cmd = fixed
+                        show_box = True
+                    continue
+
+                elif confirm == 'p':
+                    # Break the instruction into steps and run independent ones in parallel
+                    if prefetch:
+                        prefetch.cancel()
+                    if plan_mode(user_input):
+                        if user_prompt is not None:
+                            sys.exit(0)
+                        break
+                    show_box = True
+                    continue
+
                 elif confirm == 'r':
-                    user_input = Prompt.ask("[bold cyan]Re-enter your command in English (or 'exit')[/bold cyan]").strip()
+                    if prefetch:
+                        prefetch.cancel()
+                    user_input = ask_instruction("Re-enter your command in English (or 'exit')").strip()
                     if user_input.lower() == 'exit':
                         console.print("[bold yellow]Goodbye![/bold yellow]")
                         return # Exit function completely
                     break  # Break inner loop to get new command suggestion based on new user_input
 
                 elif confirm == 's':
-                    console.print("[yellow]Getting alternative suggestions...[/yellow]")
-                    suggestions = get_command_suggestions(user_input + " (give me more alternatives and options)")
+                    suggestions = None
+                    if prefetch and not prefetch.cancelled:
+                        if not prefetch.done():
+                            console.print("[yellow]Getting alternative suggestions...[/yellow]")
+                        suggestions = prefetch.result()
+                    if not suggestions:
+                        # Fill in rows as descriptions arrive instead of waiting for the slowest one
+                        from rich.live import Live
+                        with Live(Panel("[yellow]Getting alternative suggestions...[/yellow]", expand=False), console=get_console(), transient=True) as live:
+                            suggestions = suggest(
+                                user_input + ALTERNATIVES_SUFFIX,
+                                on_update=lambda rows: live.update(Panel(f"[bold green]Alternative commands:[/bold green]\n{format_suggestions(rows)}", expand=False)),
+                            )
                     if suggestions:
                         while True:  # Suggestions menu loop
-                            suggestion_text = '\n'.join(f"[cyan]{i+1}.[/cyan] [yellow]{cmd}[/yellow] — {desc}" for i, (cmd, desc) in enumerate(suggestions))
+                            suggestion_text = format_suggestions(suggestions)
                             console.print(Panel(f"[bold green]Alternative commands:[/bold green]\n{suggestion_text}\n\n[bold]Choose a number or Enter to go back[/bold]", expand=False))
                             choice = Prompt.ask("[bold blue]Choose number or Enter[/bold blue]").strip()
 
@@ -308,8 +944,7 @@ def terminal_mode_with_prompt(user_prompt=None, show_tip=False):
                                     exec_choice = Prompt.ask("[bold blue](e)xecute  (m)odify  (b)ack to suggestions  (c)ancel[/bold blue]").strip().lower()
                                     
                                     if exec_choice == 'e':
-                                        is_privileged = any(priv_cmd in selected_cmd for priv_cmd in privileged_commands)
-                                        success, error = execute_command(selected_cmd, is_privileged)
+                                        success, error = run_checked(selected_cmd)
                                         if success:
                                              if user_prompt is not None:
                                                  sys.exit(0)
@@ -358,12 +993,14 @@ def terminal_mode_with_prompt(user_prompt=None, show_tip=False):
                         continue # Continue inner command loop
 
                 else:  # cancel
+                    if prefetch:
+                        prefetch.cancel()
                     console.print("[yellow]Command cancelled.[/yellow]")
                     sys.exit(0)
             # End of inner command loop (either executed successfully in interactive, or chose reprompt)
             # Ask for new command (only if not in direct mode)
             if user_prompt is None:
-                 user_input = Prompt.ask("[bold cyan]Enter your command in English (or 'exit')[/bold cyan]").strip()
+                 user_input = ask_instruction("Enter your command in English (or 'exit')").strip()
                  if user_input.lower() == 'exit':
                      console.print("[bold yellow]Goodbye![/bold yellow]")
                      return
@@ -398,17 +1035,80 @@ def terminal_mode_with_prompt(user_prompt=None, show_tip=False):
 
 def main():
     try:
+        # --profile (or COMMANDIFY_TRACE=1) records per-phase spans and writes a Chrome trace at exit
+        if '--profile' in sys.argv:
+            sys.argv.remove('--profile')
+            tracing.enable()
+            show_profile = True
+        else:
+            show_profile = False
+        if tracing.enabled():
+            import atexit
+            atexit.register(finish_profile, show_profile)
+            process_start = _process_start_time()
+            if process_start is not None:
+                tracing.record('startup.interpreter', process_start, _MODULE_START)
+            tracing.record('startup.imports', _MODULE_START, time.time())
+
+        if '--trace-report' in sys.argv:
+            trace_report(sys.argv[sys.argv.index('--trace-report') + 1:])
+            return
+
+        if '--plan' in sys.argv:
+            sys.exit(plan_main(sys.argv[sys.argv.index('--plan') + 1:]))
+
+        if '--startup-profile' in sys.argv:
+            startup_profile(as_json='--json' in sys.argv)
+            return
+
+        if '--batch' in sys.argv:
+            import batch
+            sys.exit(batch.main(sys.argv[sys.argv.index('--batch') + 1:]))
+
+        if '--daemon' in sys.argv:
+            import daemon
+            daemon.serve()
+            return
+
+        if '--daemon-stop' in sys.argv:
+            import daemon
+            try:
+                stopped = daemon.request('shutdown') is not None
+            except daemon.RemoteError:
+                stopped = False
+            console.print("[green]Daemon stopped.[/green]" if stopped else "[yellow]Daemon is not running.[/yellow]")
+            return
+
+        if '--history' in sys.argv:
+            print_history(' '.join(sys.argv[sys.argv.index('--history') + 1:]))
+            return
+
+        if '--usage' in sys.argv:
+            print_usage(as_json='--json' in sys.argv)
+            return
+
+        if '--cache-stats' in sys.argv:
+            print_cache_stats()
+            return
+
+        if '--build-index' in sys.argv:
+            from local_index import build_index, get_cache_dir
+            entries = build_index(os.path.join(get_cache_dir(), 'descriptions.idx'))
+            console.print(f"[green]Built local description index with {len(entries)} entries.[/green]")
+            return
+
         # If a prompt is passed as an argument, use it directly (Quick/Traditional mode)
         if len(sys.argv) > 1 and sys.argv[1] != '--menu':
             terminal_mode_with_prompt(' '.join(sys.argv[1:]), show_tip=False) # Don't show tip in direct mode
             return
 
         # Default mode: menu
+        from rich.panel import Panel
+        from rich.prompt import Prompt
         console.print(Panel("[bold cyan]Welcome to Commandify[/bold cyan]\n[green]Gemini Terminal AI[/green]", expand=False, border_style="cyan"))
-        api_key = get_api_key()
-
         # --- Initial Setup: API Key and Alias --- 
-        if not api_key:
+        from gemini_api import backend_ready, save_api_key
+        if not backend_ready():
             console.print("[yellow]No Gemini API key found.[/yellow]")
             while True:
                 api_key = Prompt.ask("[bold green]Please enter your Gemini API key[/bold green]").strip()
@@ -510,6 +1210,7 @@ def main():
 
                 elif choice == '4' or choice.lower() == 'help':
                     # --- Help Option --- 
+                    from rich.align import Align
                     help_panels = [
                         Panel(Align.left("""
 [bold magenta]Getting Started:[/bold magenta]
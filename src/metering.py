@@ -0,0 +1,313 @@
+import atexit
+import contextlib
+import contextvars
+import functools
+import getpass
+import json
+import os
+import threading
+import time
+
+from cache_store import get_cache_dir
+
+# Token and cost metering. Backends report the token counts from each model
+# response (Gemini usageMetadata, OpenAI-style usage); gemini_api marks which
+# code path a request belongs to with `with metering.path('translate'):`, and
+# cache hits and errors are counted the same way. Counters are aggregated in
+# memory and merged into <cache dir>/metrics.json (under a file lock, so
+# concurrent processes add up) at exit, or every FLUSH_INTERVAL seconds in the
+# daemon. COMMANDIFY_METRICS_FILE additionally exports the totals as a
+# node-exporter textfile (*.prom) or JSON.
+#
+# With a daily token budget (COMMANDIFY_DAILY_TOKENS, or per user in
+# COMMANDIFY_USER_BUDGETS="alice=200000,bob=50000") model requests stop once
+# the user's usage for the day reaches it; answers then come from local data
+# only (caches, history, offline descriptions) until the next day.
+
+METRICS_FILE = os.environ.get('COMMANDIFY_METRICS_FILE')
+DAILY_TOKENS = int(os.environ.get('COMMANDIFY_DAILY_TOKENS', '0'))  # 0: no budget
+FLUSH_INTERVAL = 60.0  # seconds between daemon flushes
+KEEP_DAYS = 31  # days of per-user daily usage kept in metrics.json
+
+# USD per million prompt/response tokens; COMMANDIFY_PRICES='{"model": [in, out]}' overrides
+PRICES = {
+    'gemini-2.0-flash': (0.10, 0.40),
+    'gemini-2.0-flash-lite': (0.075, 0.30),
+}
+PRICES.update({model: tuple(price) for model, price in json.loads(os.environ.get('COMMANDIFY_PRICES', '{}')).items()})
+
+COUNTERS = ('calls', 'prompt_tokens', 'response_tokens', 'errors', 'cost_usd')
+
+_path = contextvars.ContextVar('metering_path', default='other')
+_prefix = contextvars.ContextVar('metering_prefix', default='')
+
+
+def parse_budgets(text):
+    """Parses "user=tokens,user=tokens" into {user: tokens}."""
+    budgets = {}
+    for item in (text or '').split(','):
+        user, _, tokens = item.partition('=')
+        if user.strip() and tokens.strip().isdigit():
+            budgets[user.strip()] = int(tokens)
+    return budgets
+
+
+USER_BUDGETS = parse_budgets(os.environ.get('COMMANDIFY_USER_BUDGETS'))
+
+
+def current_user():
+    try:
+        return getpass.getuser()
+    except (KeyError, OSError):
+        return str(os.getuid())
+
+
+@contextlib.contextmanager
+def path(name):
+    """Attributes the model calls, cache hits and errors inside the block to code path name."""
+    token = _path.set(name)
+    try:
+        yield
+    finally:
+        _path.reset(token)
+
+
+def metered(name):
+    """Decorator: runs the function inside path(name)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with path(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextlib.contextmanager
+def speculative(name):
+    """
+    Attributes everything inside the block to "name:<path>" (e.g. prefetch:suggest.fallback),
+    so requests made ahead of time are told apart from the ones the user asked for.
+    """
+    token = _prefix.set(f"{name}:")
+    try:
+        yield
+    finally:
+        _prefix.reset(token)
+
+
+def current_path():
+    return _prefix.get() + _path.get()
+
+
+class Meter:
+    """In-process counters waiting to be flushed, plus the budget check."""
+
+    def __init__(self, store_path=None, user=None):
+        self.store_path = store_path
+        self.user = user or current_user()
+        self._series = {}  # (path, model) -> {counter: value}
+        self._cache_hits = {}  # (path, source) -> count
+        self._tokens = 0  # tokens recorded since the last flush
+        self._lock = threading.Lock()
+        self._stored = {'mtime': None, 'today': 0}
+        self._registered = False
+
+    def _register(self):
+        if not self._registered:
+            self._registered = True
+            atexit.register(self.flush)
+
+    def _add(self, model, **counts):
+        key = (current_path(), model or '')
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = dict.fromkeys(COUNTERS, 0)
+            for name, value in counts.items():
+                series[name] += value
+            self._register()
+
+    def record_usage(self, model, prompt_tokens, response_tokens):
+        """Counts one model response and its tokens."""
+        prompt_tokens, response_tokens = int(prompt_tokens or 0), int(response_tokens or 0)
+        price_in, price_out = PRICES.get(model, (0.0, 0.0))
+        cost = (prompt_tokens * price_in + response_tokens * price_out) / 1e6
+        self._add(model, calls=1, prompt_tokens=prompt_tokens, response_tokens=response_tokens, cost_usd=cost)
+        with self._lock:
+            self._tokens += prompt_tokens + response_tokens
+
+    def record_error(self, model):
+        self._add(model, errors=1)
+
+    def record_cache_hit(self, source, count=1, code_path=None):
+        """Counts answers served without a model call (source: exact, similar, local, history)."""
+        key = (_prefix.get() + code_path if code_path else current_path(), source)
+        with self._lock:
+            self._cache_hits[key] = self._cache_hits.get(key, 0) + count
+            self._register()
+
+    # --- Budget ---------------------------------------------------------------
+
+    def budget(self):
+        """Today's token budget for this user (0 if none)."""
+        return USER_BUDGETS.get(self.user, DAILY_TOKENS)
+
+    def tokens_today(self):
+        """Tokens used today: flushed by every process of this user, plus this process' unflushed ones."""
+        stored = 0
+        if self.store_path:
+            try:
+                mtime = os.stat(self.store_path).st_mtime_ns
+            except OSError:
+                mtime = None
+            day = time.strftime('%Y-%m-%d')
+            if mtime != self._stored['mtime'] or self._stored.get('day') != day:
+                data = _read(self.store_path)
+                self._stored = {'mtime': mtime, 'day': day,
+                                'today': data.get('daily', {}).get(self.user, {}).get(day, 0)}
+            stored = self._stored['today']
+        with self._lock:
+            return stored + self._tokens
+
+    def budget_exceeded(self):
+        limit = self.budget()
+        return bool(limit) and self.tokens_today() >= limit
+
+    def budget_message(self):
+        return (f"Daily token budget reached ({self.tokens_today():,} of {self.budget():,} tokens used today); "
+                "answering from local data only until tomorrow.")
+
+    # --- Flushing ---------------------------------------------------------------
+
+    def flush(self):
+        """Merges the unflushed counters into the shared metrics file and writes the export."""
+        with self._lock:
+            series, self._series = self._series, {}
+            cache_hits, self._cache_hits = self._cache_hits, {}
+            tokens, self._tokens = self._tokens, 0
+        if not (series or cache_hits) or not self.store_path:
+            return
+        import fcntl
+        try:
+            with open(self.store_path + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                data = _read(self.store_path)
+                totals = data.setdefault('series', {})
+                for (code_path, model), counts in series.items():
+                    entry = totals.setdefault(f"{code_path}\t{model}", dict.fromkeys(COUNTERS, 0))
+                    for name, value in counts.items():
+                        entry[name] = entry.get(name, 0) + value
+                hits = data.setdefault('cache_hits', {})
+                for (code_path, source), count in cache_hits.items():
+                    key = f"{code_path}\t{source}"
+                    hits[key] = hits.get(key, 0) + count
+                days = data.setdefault('daily', {}).setdefault(self.user, {})
+                today = time.strftime('%Y-%m-%d')
+                days[today] = days.get(today, 0) + tokens
+                for day in sorted(days)[:-KEEP_DAYS]:
+                    del days[day]
+                data['updated'] = time.time()
+                _write(self.store_path, data)
+        except OSError:
+            return
+        if METRICS_FILE:
+            export(data, METRICS_FILE, self.user, self.budget())
+
+    def start_flusher(self, interval=FLUSH_INTERVAL):
+        """Flushes every interval seconds from a background thread (for the daemon)."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.flush()
+        threading.Thread(target=loop, name='metering-flush', daemon=True).start()
+
+
+def _read(store_path):
+    try:
+        with open(store_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(file_path, data, text=None):
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        if text is None:
+            json.dump(data, f)
+        else:
+            f.write(text)
+    os.replace(tmp_path, file_path)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(data, user, budget=0):
+    """Renders metrics.json totals in the Prometheus text exposition format."""
+    today = time.strftime('%Y-%m-%d')
+    lines = []
+    metrics = [
+        ('calls', 'commandify_model_calls_total', 'counter', 'Model responses received'),
+        ('prompt_tokens', 'commandify_prompt_tokens_total', 'counter', 'Prompt tokens sent to the model'),
+        ('response_tokens', 'commandify_response_tokens_total', 'counter', 'Response tokens received from the model'),
+        ('errors', 'commandify_model_errors_total', 'counter', 'Failed model requests'),
+        ('cost_usd', 'commandify_cost_usd_total', 'counter', 'Estimated model cost in USD'),
+    ]
+    for counter, name, kind, help_text in metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for key, counts in sorted(data.get('series', {}).items()):
+            code_path, model = key.split('\t', 1)
+            value = counts.get(counter, 0)
+            lines.append(f'{name}{{user="{_label(user)}",path="{_label(code_path)}",model="{_label(model)}"}} '
+                         f'{round(value, 6) if counter == "cost_usd" else value}')
+    lines += ["# HELP commandify_cache_hits_total Answers served without a model call",
+              "# TYPE commandify_cache_hits_total counter"]
+    for key, count in sorted(data.get('cache_hits', {}).items()):
+        code_path, source = key.split('\t', 1)
+        lines.append(f'commandify_cache_hits_total{{user="{_label(user)}",path="{_label(code_path)}",'
+                     f'source="{_label(source)}"}} {count}')
+    lines += ["# HELP commandify_tokens_today Tokens used today", "# TYPE commandify_tokens_today gauge",
+              f'commandify_tokens_today{{user="{_label(user)}"}} {data.get("daily", {}).get(user, {}).get(today, 0)}']
+    if budget:
+        lines += ["# HELP commandify_daily_token_budget Daily token budget", "# TYPE commandify_daily_token_budget gauge",
+                  f'commandify_daily_token_budget{{user="{_label(user)}"}} {budget}']
+    return '\n'.join(lines) + '\n'
+
+
+def export(data, file_path, user, budget=0):
+    """Writes the totals to file_path: Prometheus textfile format for *.prom, JSON otherwise."""
+    try:
+        if file_path.endswith('.prom'):
+            # Written to a temp file and renamed, as the textfile collector requires
+            _write(file_path, None, prometheus_text(data, user, budget))
+        else:
+            _write(file_path, dict(data, user=user, budget=budget))
+    except OSError:
+        pass
+
+
+_METER = None
+_METER_LOCK = threading.Lock()
+
+
+def get_meter():
+    """Returns the shared meter, creating it on first use."""
+    global _METER
+    with _METER_LOCK:
+        if _METER is None:
+            try:
+                store_path = os.path.join(get_cache_dir(), 'metrics.json')
+            except OSError:
+                store_path = None
+            _METER = Meter(store_path)
+    return _METER
+
+
+def load_totals():
+    """Returns the flushed totals (metrics.json) including this process' pending counters."""
+    meter = get_meter()
+    meter.flush()
+    return _read(meter.store_path) if meter.store_path else {}
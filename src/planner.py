@@ -0,0 +1,206 @@
+import os
+import subprocess
+import threading
+import time
+
+from executor import run_command
+
+# Multi-step plans: the model breaks a task into a small DAG of shell steps
+# ("download these files, then extract them"). Steps whose dependencies have
+# all succeeded run concurrently on up to PLAN_WORKERS threads; when a step
+# fails, everything that depends on it (directly or not) is skipped.
+
+PLAN_WORKERS = int(os.environ.get('COMMANDIFY_PLAN_WORKERS', '4'))
+MAX_STEPS = 20
+
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "steps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "cmd": {"type": "string"},
+                    "desc": {"type": "string"},
+                    "after": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["id", "cmd", "after"],
+            },
+        },
+    },
+    "required": ["steps"],
+}
+
+
+class PlanStep:
+    """One shell command of a plan and the ids of the steps it must wait for."""
+
+    def __init__(self, step_id, cmd, desc='', after=()):
+        self.id = step_id
+        self.cmd = cmd
+        self.desc = desc
+        self.after = list(after)
+        self.status = 'pending'  # pending, queued, running, ok, failed, skipped
+        self.result = None  # executor.ExecutionResult once it ran
+        self.error = None  # why the step could not be run at all
+
+    def to_dict(self):
+        return {'id': self.id, 'cmd': self.cmd, 'desc': self.desc, 'after': self.after}
+
+
+def parse_plan(value):
+    """
+    Validates a decoded plan ({"steps": [...]}) and returns its PlanSteps in
+    dependency order. Raises ValueError for missing fields, duplicate or
+    unknown ids, and cycles.
+    """
+    steps_data = value.get('steps') if isinstance(value, dict) else None
+    if not isinstance(steps_data, list) or not steps_data:
+        raise ValueError("plan has no steps")
+    if len(steps_data) > MAX_STEPS:
+        raise ValueError(f"plan has {len(steps_data)} steps (at most {MAX_STEPS})")
+    steps = {}
+    for i, data in enumerate(steps_data):
+        if not isinstance(data, dict) or not isinstance(data.get('cmd'), str) or not data['cmd'].strip():
+            raise ValueError(f"step {i} has no \"cmd\" string")
+        step_id = str(data.get('id') or i + 1)
+        if step_id in steps:
+            raise ValueError(f"duplicate step id {step_id!r}")
+        after = data.get('after') or []
+        if not isinstance(after, list):
+            raise ValueError(f"step {step_id!r}: \"after\" must be a list")
+        steps[step_id] = PlanStep(step_id, data['cmd'].strip(), str(data.get('desc') or '').strip(),
+                                  [str(dep) for dep in after])
+    for step in steps.values():
+        for dep in step.after:
+            if dep not in steps:
+                raise ValueError(f"step {step.id!r} depends on unknown step {dep!r}")
+            if dep == step.id:
+                raise ValueError(f"step {step.id!r} depends on itself")
+
+    # Kahn's algorithm: dependency order, and any leftover steps form a cycle
+    remaining = {step_id: len(set(step.after)) for step_id, step in steps.items()}
+    dependents = {step_id: [] for step_id in steps}
+    for step in steps.values():
+        for dep in set(step.after):
+            dependents[dep].append(step.id)
+    ready = [step_id for step_id, count in remaining.items() if count == 0]
+    ordered = []
+    while ready:
+        step_id = ready.pop(0)
+        ordered.append(steps[step_id])
+        for child in dependents[step_id]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                ready.append(child)
+    if len(ordered) != len(steps):
+        raise ValueError("plan dependencies contain a cycle")
+    return ordered
+
+
+class PlanResult:
+    """Outcome of run_plan: the steps (with status and result), wall time and serial time."""
+
+    def __init__(self, steps, wall_time):
+        self.steps = steps
+        self.wall_time = wall_time
+        # What running the executed steps one after another would have taken
+        self.serial_time = sum(step.result.duration for step in steps if step.result is not None)
+
+    @property
+    def success(self):
+        return all(step.status == 'ok' for step in self.steps)
+
+    @property
+    def speedup(self):
+        return self.serial_time / self.wall_time if self.wall_time > 0 else None
+
+
+def run_plan(steps, workers=PLAN_WORKERS, on_output=None, on_status=None):
+    """
+    Runs steps (as returned by parse_plan) with at most workers in parallel.
+
+    on_output(step, text, is_stderr) receives each step's output one complete
+    line at a time, so concurrent steps never interleave mid-line.
+    on_status(step) is called when a step starts (once a worker actually runs
+    it), finishes or is skipped. A step that raises is marked
+    failed with step.error set, and its dependents are skipped.
+    Steps run without a terminal on stdin. Returns a PlanResult.
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    by_id = {step.id: step for step in steps}
+    lock = threading.Lock()
+
+    def notify(step):
+        # Workers report their own start, so status lines are serialized like output lines
+        if on_status is not None:
+            with lock:
+                on_status(step)
+
+    def line_writer(step, is_stderr):
+        pending = ['']
+
+        def write(text=None):
+            if text is None:  # flush the last unterminated line
+                if pending[0]:
+                    on_output(step, pending[0] + '\n', is_stderr)
+                    pending[0] = ''
+                return
+            *lines, pending[0] = (pending[0] + text).split('\n')
+            if lines:
+                with lock:
+                    on_output(step, '\n'.join(lines) + '\n', is_stderr)
+        return write
+
+    def execute(step):
+        if on_output is None:
+            return run_command(step.cmd, pty_mode=False, stdin=subprocess.DEVNULL)
+        out, err = line_writer(step, False), line_writer(step, True)
+        result = run_command(step.cmd, out, err, pty_mode=False, stdin=subprocess.DEVNULL)
+        with lock:
+            out()
+            err()
+        return result
+
+    def run_step(step):
+        # Queued steps wait for a free worker; they only count as running from here,
+        # and report their outcome before the worker takes the next step
+        step.status = 'running'
+        notify(step)
+        try:
+            step.result = execute(step)
+            step.status = 'ok' if step.result.success else 'failed'
+        except Exception as e:
+            step.status = 'failed'
+            step.error = str(e) or type(e).__name__
+        notify(step)
+
+    def skip_dependents(failed):
+        for step in steps:
+            if step.status == 'pending' and failed.id in step.after:
+                step.status = 'skipped'
+                notify(step)
+                skip_dependents(step)
+
+    def ready_steps():
+        return [step for step in steps if step.status == 'pending'
+                and all(by_id[dep].status == 'ok' for dep in step.after)]
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        running = {}
+        while True:
+            for step in ready_steps():
+                step.status = 'queued'
+                running[pool.submit(run_step, step)] = step
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                if step.status == 'failed':
+                    skip_dependents(step)
+    return PlanResult(steps, time.monotonic() - start)
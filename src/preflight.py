@@ -0,0 +1,373 @@
+import os
+import re
+import shlex
+import shutil
+
+# Pre-flight analysis of a shell command before it runs: the command is split
+# into pipeline/list stages with shlex, each stage's binary is resolved against
+# the cached $PATH index, and one compiled pattern flags every privileged or
+# destructive rule that applies to the stage. A command handed to a shell
+# ("bash -c '...'", eval) is analyzed the same way. Everything is local; a
+# typical command is analyzed in tens of microseconds.
+
+SHELL_BUILTINS = frozenset([
+    '.', ':', '[', '[[', 'alias', 'bg', 'break', 'builtin', 'cd', 'command', 'continue', 'declare', 'dirs',
+    'disown', 'echo', 'eval', 'exec', 'exit', 'export', 'false', 'fg', 'getopts', 'hash', 'help', 'history',
+    'jobs', 'kill', 'let', 'local', 'popd', 'printf', 'pushd', 'pwd', 'read', 'readonly', 'return', 'set',
+    'shift', 'source', 'test', 'times', 'trap', 'true', 'type', 'typeset', 'ulimit', 'umask', 'unalias',
+    'unset', 'wait',
+])
+# Keywords that start a stage and are followed by a command ("then rm x", "! grep ...")
+PREFIX_KEYWORDS = frozenset(['if', 'then', 'else', 'elif', 'while', 'until', 'do', '!', '{'])
+# Stages starting with these have no command to check ("for f in *", "done")
+SKIP_KEYWORDS = frozenset(['for', 'case', 'select', 'function', 'done', 'fi', 'esac', '}', 'in'])
+# Commands that run another command: {wrapper: options that take a value}
+WRAPPERS = {
+    'sudo': {'-u', '-g', '-h', '-p', '-C', '-D', '-U', '-r', '-t'},
+    'doas': {'-u', '-C'},
+    'env': {'-u', '-C', '-S'},
+    'nohup': set(),
+    'time': {'-f', '-o'},
+    'nice': {'-n'},
+    'ionice': {'-c', '-n', '-p'},
+    'stdbuf': {'-i', '-o', '-e'},
+    'timeout': {'-s', '-k'},
+    'watch': {'-n', '-d'},
+    'xargs': {'-I', '-n', '-P', '-d', '-L', '-s', '-E', '-a'},
+    'exec': set(),
+    'command': set(),
+    'builtin': set(),
+}
+# Shells whose -c argument is itself a command ("bash -c 'rm -rf /'"); eval runs its arguments
+SHELLS = frozenset(['sh', 'bash', 'dash', 'zsh', 'ksh', 'ash'])
+SHELL_VALUE_OPTIONS = frozenset(['-o', '+o', '-O', '+O'])
+SEPARATORS = frozenset(['|', '||', '&&', ';', '&', '|&', ';;', '(', ')', '\n'])
+_SEPARATOR_CHARS = frozenset('|&;()')
+_OPERATOR_CHARS = frozenset('<>&|;()')
+_ASSIGNMENT_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*=')
+_PAREN_SPLIT_RE = re.compile(r'\(\(|[()]|[^()]+')
+_BACKTICK_RE = re.compile(r'`([^`]*)`')
+
+# (rule name, kind, message, pattern). Patterns are matched against a stage
+# written as "<binary> <args...> <redirection><target>...", binary first.
+RULES = [
+    ('system_tools', 'privileged', "administers the system",
+     r'(?:dmidecode|fdisk|sfdisk|parted|mkswap|swapon|swapoff|modprobe|insmod|rmmod|visudo|chroot|iptables'
+     r'|ip6tables|nft|ufw|useradd|userdel|usermod|groupadd|groupdel|chpasswd|shutdown|reboot|poweroff|halt'
+     r'|chown|lvcreate|lvremove|vgcreate|pvcreate)(?:\s|$)'),
+    ('mount', 'privileged', "changes mounts", r'u?mount\s+\S'),
+    ('apt', 'privileged', "changes installed packages",
+     r'(?:apt|apt-get|aptitude)\s+(?:-\S+\s+)*(?:install|remove|purge|update|upgrade|full-upgrade|dist-upgrade'
+     r'|autoremove|autoclean|clean|reinstall)\b'),
+    ('dpkg', 'privileged', "changes installed packages",
+     r'dpkg\s+(?:.*\s)?(?:-\w*[iPr]\w*|--(?:install|remove|purge|configure|unpack))(?:\s|$)'),
+    ('packages', 'privileged', "changes installed packages",
+     r'(?:(?:yum|dnf|zypper|snap|flatpak\s+--system)\s+(?:-\S+\s+)*(?:install|remove|erase|update|upgrade'
+     r'|refresh)\b|pacman\s+(?:.*\s)?-[SRU])'),
+    ('systemctl', 'privileged', "controls system services",
+     r'systemctl\s+(?!.*--user)(?:-\S+\s+)*(?:start|stop|restart|reload|enable|disable|mask|unmask'
+     r'|daemon-reload|edit|kill|isolate)\b'),
+    ('service', 'privileged', "controls system services", r'service\s+\S+\s+(?:start|stop|restart|reload)\b'),
+    ('system_files', 'privileged', "writes to system directories",
+     r'(?:(?:tee|cp|mv|rm|ln|install|touch|mkdir|rmdir|chmod|sed\s+-i)\s(?:.*\s)?/(?:etc|usr|boot|sys|lib|opt)/'
+     r'|.*>>?/(?:etc|usr|boot|sys|proc)/)'),
+    ('recursive_rm', 'destructive', "recursively deletes a top-level, home or wildcard path",
+     r'rm\s(?=(?:.*\s)?(?:-\w*[rR]\w*|--recursive)(?:\s|$)).*\s(?:/\*?|/\w+/?|~/?\*?|\$HOME/?\*?|\*|\.\.?/?\*?)(?:\s|$)'),
+    ('no_preserve_root', 'destructive', "disables rm's protection of /", r'rm\s(?:.*\s)?--no-preserve-root'),
+    ('filesystem', 'destructive', "erases a disk or filesystem",
+     r'(?:mkfs(?:\.\w+)?|mke2fs|wipefs|shred|blkdiscard|sgdisk\s+(?:.*\s)?--zap-all)(?:\s|$)'),
+    ('dd_device', 'destructive', "writes directly to a device", r'dd\s(?:.*\s)?of=/dev/(?!null\b)'),
+    ('redirect_device', 'destructive', "writes directly to a disk",
+     r'.*>>?/dev/(?:sd|hd|vd|xvd|nvme|mmcblk|disk)'),
+    ('recursive_perms', 'destructive', "recursively changes permissions or owners of /",
+     r'(?:chmod|chown|chgrp)\s(?=(?:.*\s)?-\w*R)(?:.*\s)/(?:\s|$)'),
+    ('git_discard', 'destructive', "discards uncommitted or remote git history",
+     r'git\s+(?:reset\s+(?:.*\s)?--hard|clean\s+(?:.*\s)?-\w*f|push\s+(?:.*\s)?(?:--force|-f)(?:\s|$))'),
+    ('find_delete', 'destructive', "deletes every file find matches", r'find\s(?:.*\s)?-delete(?:\s|$)'),
+]
+
+# One pattern for all rules: an optional lookahead per rule, so a single match
+# at the start of the stage reports every rule that applies (groupdict()).
+MATCHER = re.compile(''.join(f'(?:(?=(?P<{name}>{pattern}))|)' for name, _, _, pattern in RULES))
+_RULE_INFO = {name: (kind, message) for name, kind, message, _ in RULES}
+
+
+class Finding:
+    """One issue found in a stage: kind is privileged, destructive, missing or syntax."""
+
+    __slots__ = ('kind', 'rule', 'message', 'stage')
+
+    def __init__(self, kind, rule, message, stage=None):
+        self.kind = kind
+        self.rule = rule
+        self.message = message
+        self.stage = stage
+
+    def __repr__(self):
+        return f"Finding({self.kind!r}, {self.rule!r}, {self.message!r})"
+
+
+class Stage:
+    """One simple command of a pipeline or list: its binary, arguments and redirections."""
+
+    __slots__ = ('binary', 'args', 'redirects', 'sudo')
+
+    def __init__(self, binary, args, redirects, sudo):
+        self.binary = binary
+        self.args = args
+        self.redirects = redirects
+        self.sudo = sudo
+
+    def normalized(self):
+        name = os.path.basename(self.binary)
+        return ' '.join([name] + self.args + [op + target for op, target in self.redirects])
+
+
+class Analysis:
+    """Result of analyze(): the stages and every finding."""
+
+    def __init__(self, command, stages, findings):
+        self.command = command
+        self.stages = stages
+        self.findings = findings
+
+    def of_kind(self, kind):
+        return [finding for finding in self.findings if finding.kind == kind]
+
+    @property
+    def needs_sudo(self):
+        """True when a stage needs root, isn't already run with sudo, and we aren't root."""
+        return bool(self.of_kind('privileged')) and not _is_root()
+
+    @property
+    def ok(self):
+        return not self.findings
+
+
+def _is_root():
+    return hasattr(os, 'geteuid') and os.geteuid() == 0
+
+
+def tokenize(command):
+    """Splits command into shell words and operators; raises ValueError on unbalanced quotes."""
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    lexer.commenters = ''
+    return list(lexer)
+
+
+def _split_parens(tokens):
+    """Splits operator runs so "((" and every other paren stand alone ("));" -> ")", ")", ";")."""
+    result = []
+    for token in tokens:
+        if len(token) > 1 and set(token) <= _OPERATOR_CHARS and ('(' in token or ')' in token):
+            result.extend(_PAREN_SPLIT_RE.findall(token))
+        else:
+            result.append(token)
+    return result
+
+
+def _group_end(tokens, i):
+    """Index just past the parenthesis that closes the group opened at tokens[i]."""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j] in ('(', '(('):
+            depth += len(tokens[j])
+        elif tokens[j] == ')':
+            depth -= 1
+            if depth <= 0:
+                return j + 1
+    return len(tokens)
+
+
+def split_stages(tokens):
+    """
+    Groups tokens into [(words, redirects)], one per simple command. Subshells and
+    $(...) contribute their own stages; the bodies of $((...)), ((...)) and
+    name=(...) are expressions and array items, so they stay inside their word.
+    """
+    tokens = _split_parens(tokens)
+    stages, words, redirects = [], [], []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == '((' and (not words or words[-1].endswith('$') or words == ['for']):
+            # Arithmetic: $((1+2)), ((i++)) or for ((i=0; i<3; i++))
+            end = _group_end(tokens, i)
+            if words and words[-1].endswith('$'):
+                words[-1] += '((' + ' '.join(tokens[i + 1:end - 2]) + '))'
+            i = end
+            continue
+        if token == '(' and words and _ASSIGNMENT_RE.match(words[-1]) and words[-1].endswith('='):
+            # Array assignment: arr=(a b c)
+            end = _group_end(tokens, i)
+            words[-1] += '(' + ' '.join(tokens[i + 1:end - 1]) + ')'
+            i = end
+            continue
+        if token == '(' and len(words) == 1 and i + 1 < len(tokens) and tokens[i + 1] == ')':
+            # Function definition "name() { ...; }": the body is checked, the name is not a command
+            words = []
+            i += 2
+            continue
+        if token in SEPARATORS or (token and set(token) <= _SEPARATOR_CHARS):
+            stages.append((words, redirects))
+            words, redirects = [], []
+        elif token and set(token) <= _OPERATOR_CHARS:
+            # A redirection such as >, >>, 2>, &>, <; its target is the next word
+            if words and words[-1].isdigit():
+                token = words.pop() + token
+            target = tokens[i + 1] if i + 1 < len(tokens) and tokens[i + 1] not in SEPARATORS else ''
+            redirects.append((token, target))
+            i += 1 if target else 0
+        else:
+            words.append(token)
+        i += 1
+    stages.append((words, redirects))
+    return [(words, redirects) for words, redirects in stages if words or redirects]
+
+
+def substitutions(text):
+    """Commands substituted inside text: `...` and $(...) (not $((...)) arithmetic)."""
+    found = _BACKTICK_RE.findall(text)
+    start = text.find('$(')
+    while start != -1:
+        if text.startswith('$((', start):
+            start = text.find('$(', start + 3)
+            continue
+        depth, end = 0, len(text)
+        for j in range(start + 1, len(text)):
+            if text[j] == '(':
+                depth += 1
+            elif text[j] == ')':
+                depth -= 1
+                if depth == 0:
+                    end = j
+                    break
+        found.append(text[start + 2:end])
+        start = text.find('$(', end)
+    return [body for body in found if body.strip()]
+
+
+def unwrap(words):
+    """Strips keywords, VAR=value assignments and wrappers (sudo, env, nohup, ...). Returns (words, sudo)."""
+    sudo = False
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word in PREFIX_KEYWORDS or _ASSIGNMENT_RE.match(word):
+            i += 1
+            continue
+        takes_value = WRAPPERS.get(word)
+        if takes_value is None:
+            break
+        sudo = sudo or word in ('sudo', 'doas')
+        i += 1
+        if word == 'timeout':
+            # timeout [options] DURATION command
+            while i < len(words) and words[i].startswith('-'):
+                i += 2 if words[i] in takes_value else 1
+            i += 1
+            continue
+        while i < len(words) and (words[i].startswith('-') or (word == 'env' and _ASSIGNMENT_RE.match(words[i]))):
+            if words[i] == '--':
+                i += 1
+                break
+            i += 2 if words[i] in takes_value else 1
+    return words[i:], sudo
+
+
+def shell_payload(stage):
+    """The command string a stage hands to a shell ("bash -lc 'rm -rf /'", "eval ..."), or None."""
+    name = os.path.basename(stage.binary)
+    if name == 'eval':
+        return ' '.join(stage.args) or None
+    if name not in SHELLS:
+        return None
+    command_mode = False
+    args = iter(stage.args)
+    for arg in args:
+        if arg in SHELL_VALUE_OPTIONS:
+            next(args, None)
+        elif arg[:1] in ('-', '+') and arg != '-':
+            # -c may be combined with other short options (-lc, -ec); --long options never mean -c
+            command_mode = command_mode or (not arg.startswith('--') and 'c' in arg[1:])
+        else:
+            return arg if command_mode else None  # without -c the first operand is a script file
+    return None
+
+
+def resolve(binary, executables):
+    """Returns None if binary can be run, else a short reason."""
+    if binary in SHELL_BUILTINS or '$' in binary or '`' in binary or (binary.startswith('!') and binary != '!'):
+        return None  # builtins, names only known at run time and history expansions (!!, !$, !3)
+    if '/' in binary:
+        path = os.path.expanduser(binary)
+        if not os.path.exists(path):
+            return "does not exist"
+        if os.path.isdir(path) or not os.access(path, os.X_OK):
+            return "is not executable"
+        return None
+    if binary in executables or shutil.which(binary):
+        return None  # shutil.which covers programs installed since the $PATH index was built
+    return "is not installed or not on $PATH"
+
+
+def suggest_binary(binary, executables, limit=3):
+    """Close matches for a missing command name ("gti" -> "git")."""
+    import difflib
+    return difflib.get_close_matches(binary, executables, n=limit, cutoff=0.6)
+
+
+def analyze(command, executables=None):
+    """
+    Analyzes a shell command without running it and returns an Analysis.
+    executables is the set of command names on $PATH (default: the cached index).
+    """
+    if executables is None:
+        from command_index import get_path_executables
+        executables = get_path_executables()
+    stages, findings = [], []
+    _analyze(command, executables, stages, findings, False)
+    return Analysis(command, stages, findings)
+
+
+def _analyze(command, executables, stages, findings, outer_sudo):
+    try:
+        tokens = tokenize(command)
+    except ValueError as e:
+        findings.append(Finding('syntax', 'quotes', f"the shell can't parse it ({e})"))
+        return
+    split = _split_parens(tokens)
+    defined = {split[j - 1] for j in range(1, len(split) - 1) if split[j] == '(' and split[j + 1] == ')'}
+    if defined:
+        executables = set(executables) | defined  # shell functions defined by the command itself
+
+    for words, redirects in split_stages(tokens):
+        words, sudo = unwrap(words)
+        sudo = sudo or outer_sudo
+        if words and words[0] in SKIP_KEYWORDS or not (words or redirects):
+            continue
+        # A stage can be redirections only, e.g. after a subshell: "(...) > file"
+        stage = Stage(words[0] if words else '', words[1:], redirects, sudo)
+        stages.append(stage)
+
+        reason = stage.binary and resolve(stage.binary, executables)
+        if reason:
+            findings.append(Finding('missing', 'binary', f"{stage.binary} {reason}", stage))
+        match = MATCHER.match(stage.normalized())
+        for rule, text in match.groupdict().items():
+            if text is None:
+                continue
+            kind, message = _RULE_INFO[rule]
+            if kind == 'privileged' and sudo:
+                continue
+            findings.append(Finding(kind, rule, f"{os.path.basename(stage.binary)} {message}", stage))
+        payload = shell_payload(stage)
+        text = ' '.join(words)
+        if payload:
+            # The payload runs as a command of its own (with the outer sudo), so check its stages too
+            _analyze(payload, executables, stages, findings, sudo)
+        elif '`' in text or '$(' in text:
+            # Quoted substitutions ("$(cmd)", `cmd args`) stay inside words; they run too
+            for body in substitutions(text):
+                _analyze(body, executables, stages, findings, False)
@@ -0,0 +1,100 @@
+import os
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# Client-side rate limiting shared by every thread that talks to a model backend.
+# A token bucket enforces the requests-per-minute budget; when the server still
+# answers 429 the bucket halves its rate and then recovers gradually (AIMD), so
+# batch and multi-threaded workloads settle at the highest sustainable rate.
+
+REQUESTS_PER_MINUTE = float(os.environ.get('COMMANDIFY_RPM', '60'))  # 0 disables limiting
+MAX_RETRIES = int(os.environ.get('COMMANDIFY_MAX_RETRIES', '3'))
+BACKOFF_BASE = 0.5
+MAX_BACKOFF = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_RETRY_DELAY_RE = re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"')
+
+
+class TokenBucket:
+    """Thread-safe token bucket with adaptive (AIMD) rate."""
+
+    def __init__(self, requests_per_minute, burst=None):
+        self.max_rate = requests_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = burst or max(1.0, requests_per_minute / 6.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """Takes one token, waiting as needed. Returns False if that would take longer than timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def penalize(self):
+        """The server said we are too fast: halve the refill rate (down to 1/16 of the budget)."""
+        with self._lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def reward(self):
+        """A request succeeded: recover the rate by 5% of the budget."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def retry_after_seconds(headers, body=''):
+    """Returns the server-requested delay from Retry-After (or Gemini's retryDelay), or None."""
+    value = headers.get('Retry-After') if headers else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    match = _RETRY_DELAY_RE.search(body or '')
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Delay before retry number attempt (0-based): the server's hint if any, else full-jitter exponential."""
+    if retry_after is not None:
+        return min(MAX_BACKOFF, retry_after + random.uniform(0, BACKOFF_BASE))
+    return random.uniform(0, min(MAX_BACKOFF, BACKOFF_BASE * (2 ** attempt)))
+
+
+_LIMITER = None
+_LIMITER_LOCK = threading.Lock()
+
+
+def get_rate_limiter():
+    """Returns the process-wide token bucket, or None when limiting is disabled."""
+    global _LIMITER
+    if REQUESTS_PER_MINUTE <= 0:
+        return None
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = TokenBucket(REQUESTS_PER_MINUTE)
+    return _LIMITER
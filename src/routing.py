@@ -0,0 +1,255 @@
+import atexit
+import collections
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+
+import tracing
+from backends import Backend
+
+# Tail-latency control for model requests. Every request's latency is recorded
+# per model in a rolling window. When a request is still unanswered after the
+# hedge budget (by default the model's rolling p95), an identical request is
+# sent and whichever answers first wins; the slower one is abandoned. Streams
+# are hedged on the time to their first chunk. Hedges are capped at a fraction
+# of all requests so a slow server is not hit with twice the traffic.
+
+HEDGE_ENABLED = os.environ.get('COMMANDIFY_HEDGE', '1') != '0'
+HEDGE_BUDGET = os.environ.get('COMMANDIFY_HEDGE_BUDGET')  # seconds; unset: rolling p95 of the model
+HEDGE_MAX_RATIO = 0.1  # at most ~10% of requests are duplicated
+LATENCY_WINDOW = 200  # samples kept per model
+MIN_SAMPLES = 10  # below this the p95 is not trusted and DEFAULT_BUDGET is used
+DEFAULT_BUDGET = 2.0
+MIN_BUDGET = 0.05
+MAX_BUDGET = 10.0
+
+
+class LatencyTracker:
+    """
+    Thread-safe rolling latency window per key (model, or model:first_chunk for
+    streams). With a path (a JSON file of its own, see latency_path()) the
+    windows are loaded on first use and merged back by save(), so short-lived
+    processes start with the p95 measured by earlier runs.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW, path=None):
+        self.window = window
+        self.path = path
+        self._saved = None
+        self._samples = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _window(self, key):
+        samples = self._samples.get(key)
+        if samples is None:
+            if self._saved is None:
+                self._saved = read_windows(self.path) if self.path else {}
+            samples = self._samples[key] = collections.deque(self._saved.get(key) or (), maxlen=self.window)
+        return samples
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._window(key).append(round(seconds, 4))
+            self._dirty.add(key)
+
+    def percentile(self, key, fraction):
+        """Returns the percentile (0 < fraction <= 1) in seconds, or None with fewer than MIN_SAMPLES samples."""
+        with self._lock:
+            samples = list(self._window(key))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return tracing.percentile(samples, fraction)
+
+    def summary(self):
+        """{key: {count, total, p50, p95, p99, max}} in milliseconds."""
+        with self._lock:
+            samples = {key: [seconds * 1000 for seconds in values] for key, values in self._samples.items()}
+        return tracing.summarize(samples)
+
+    def save(self):
+        """Writes the windows that changed since the last save into the file, keeping the other keys."""
+        with self._lock:
+            changed = {key: list(self._samples[key]) for key in self._dirty}
+            self._dirty.clear()
+        if not (self.path and changed):
+            return
+        windows = read_windows(self.path)
+        windows.update(changed)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(windows, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+def latency_path():
+    """The latency windows file in the cache directory (kept apart from the LRU translation cache)."""
+    from cache_store import get_cache_dir
+    return os.path.join(get_cache_dir(), 'latency.json')
+
+
+def read_windows(path):
+    """Returns {key: [seconds, ...]} from a latency windows file ({} if missing or unreadable)."""
+    try:
+        with open(path) as f:
+            windows = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return windows if isinstance(windows, dict) else {}
+
+
+_TRACKER = LatencyTracker()
+
+
+def get_latency_tracker():
+    return _TRACKER
+
+
+class HedgedBackend(Backend):
+    """
+    Wraps a backend: records its latency and, past the hedge budget, races a
+    duplicate request against the first one. budget is a fixed number of
+    seconds, or None to use the rolling p95 of the model.
+    """
+
+    def __init__(self, backend, budget=None, tracker=None, max_ratio=HEDGE_MAX_RATIO):
+        self.backend = backend
+        self.budget = budget
+        self.tracker = tracker or _TRACKER
+        self.max_ratio = max_ratio
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    @property
+    def model(self):
+        return self.backend.model
+
+    @property
+    def requires_api_key(self):
+        return self.backend.requires_api_key
+
+    def _key(self, stream):
+        key = self.backend.model or self.backend.name
+        return f"{key}:first_chunk" if stream else key
+
+    def hedge_delay(self, stream=False):
+        """Seconds to wait for the first request before sending the duplicate."""
+        if self.budget is not None:
+            return self.budget
+        p95 = self.tracker.percentile(self._key(stream), 0.95)
+        return DEFAULT_BUDGET if p95 is None else min(MAX_BUDGET, max(MIN_BUDGET, p95))
+
+    def _may_hedge(self):
+        with self._lock:
+            if self.hedges >= self.max_ratio * self.requests + 1:
+                return False
+            self.hedges += 1
+            return True
+
+    def _race(self, start_request, stream):
+        """
+        Runs start_request() (which returns (result, close)) in a thread, and a
+        second one if the first is slower than the hedge delay. Returns the
+        first successful result; raises the first error if both fail.
+        """
+        with self._lock:
+            self.requests += 1
+        key = self._key(stream)
+        answers = queue.Queue()
+        won = []
+
+        def attempt(number):
+            start = time.monotonic()
+            try:
+                result, close = start_request()
+            except Exception as e:
+                answers.put((number, False, e))
+                return
+            self.tracker.record(key, time.monotonic() - start)
+            with self._lock:
+                first = not won
+                won.append(number)
+            if first:
+                answers.put((number, True, result))
+            elif close is not None:
+                close()  # the other request already won
+
+        def launch(number):
+            # Each request thread runs in a copy of the caller's context (metering.path)
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(attempt, number), name='model-request', daemon=True).start()
+
+        launch(0)
+        launched = 1
+        errors = []
+        delay = self.hedge_delay(stream)
+        with tracing.span('model.race', key=key, budget_ms=round(delay * 1000, 1)) as sp:
+            while True:
+                try:
+                    number, ok, value = answers.get(timeout=delay if launched == 1 and not errors else None)
+                except queue.Empty:
+                    delay = None
+                    if self._may_hedge():
+                        sp.mark('hedge_ms')
+                        launch(1)
+                        launched = 2
+                    continue
+                if ok:
+                    sp.set(hedged=launched == 2, winner=number)
+                    if number == 1:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return value
+                errors.append(value)
+                if len(errors) == launched:
+                    raise errors[0]
+
+    def generate(self, prompt, timeout=None, schema=None, deadline=None):
+        return self._race(
+            lambda: (self.backend.generate(prompt, timeout=timeout, schema=schema, deadline=deadline), None), False)
+
+    def stream(self, prompt, timeout=None, schema=None, deadline=None):
+        def start_request():
+            chunks = self.backend.stream(prompt, timeout=timeout, schema=schema, deadline=deadline)
+            first = next(chunks, None)
+            return (first, chunks), getattr(chunks, 'close', None)
+
+        first, chunks = self._race(start_request, True)
+        try:
+            if first is not None:
+                yield first
+                yield from chunks
+        finally:
+            # The winner's stream is closed even if the consumer stops before its first chunk;
+            # the loser is closed by the request thread as soon as it answers
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def stats(self):
+        return {'requests': self.requests, 'hedges': self.hedges, 'hedge_wins': self.hedge_wins}
+
+
+def hedged(backend, path=None):
+    """
+    Wraps backend in a HedgedBackend unless hedging is turned off (COMMANDIFY_HEDGE=0).
+    path, if given, is the file that keeps the shared latency windows between runs.
+    """
+    if not HEDGE_ENABLED:
+        return backend
+    if path is not None and _TRACKER.path is None:
+        _TRACKER.path = path
+        atexit.register(_TRACKER.save)
+    return HedgedBackend(backend, budget=float(HEDGE_BUDGET) if HEDGE_BUDGET else None)
@@ -0,0 +1,239 @@
+import atexit
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+# Finds near-duplicate English prompts ("show disk space" / "check disk space")
+# among previously answered ones using TF-IDF cosine similarity over normalized
+# word tokens and character trigrams. Pure Python; the corpus is small.
+#
+# Similarity only ranks candidates that ask for the same thing: after folding
+# true synonyms and dropping stopwords, both prompts must contain exactly the
+# same key terms (verb, negation, names, paths, numbers). "stop nginx" never
+# matches "start nginx", "uninstall docker" never matches "install docker", and
+# "add user bob" never matches "add user alice".
+
+SIMILARITY_THRESHOLD = float(os.environ.get('COMMANDIFY_SIMILARITY_THRESHOLD', '0.8'))
+MAX_ENTRIES = 2000
+FLUSH_INTERVAL = 1.0  # seconds between background writes of the lookup counters
+
+# Fixed suffixes the UI appends to prompts; they carry no meaning for matching
+PROMPT_SUFFIXES = ['(give me more alternatives and options)']
+
+STOPWORDS = {
+    'a', 'an', 'the', 'of', 'in', 'on', 'at', 'to', 'for', 'from', 'with', 'my', 'me', 'i', 'is', 'are',
+    'all', 'this', 'that', 'it', 'its', 'please', 'can', 'you', 'how', 'do', 'does', 'what', 'which',
+    'much', 'many', 'there', 'current', 'currently', 'some', 'and', 'by', 'get', 'give', 'tell', 'want',
+}
+
+# Words that mean the same thing in a request. Only exact equivalents: folds such
+# as find/list -> show or delete -> remove change which command is right.
+SYNONYMS = {
+    'check': 'show', 'display': 'show', 'view': 'show', 'see': 'show', 'print': 'show',
+    'left': 'free', 'available': 'free', 'remaining': 'free', 'usage': 'used', 'use': 'used',
+    'folder': 'directory', 'dir': 'directory', 'folders': 'directory', 'directories': 'directory',
+    'files': 'file', 'processes': 'process',
+}
+
+# Read-only verbs that a prompt may leave out ("disk space left" / "show disk space left")
+OPTIONAL_TERMS = {'show'}
+
+_TOKEN_RE = re.compile(r"[\w./~*-]+")
+
+
+def normalize(text):
+    """Lowercases text, strips UI suffixes and returns its significant tokens."""
+    text = text.lower().strip()
+    for suffix in PROMPT_SUFFIXES:
+        if text.endswith(suffix):
+            text = text[:-len(suffix)].strip()
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        token = SYNONYMS.get(token, token)
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def key_terms(tokens):
+    """Terms two prompts must share exactly to be considered the same request."""
+    return frozenset(tokens) - OPTIONAL_TERMS
+
+
+def features(tokens):
+    """Word tokens plus character trigrams of each token."""
+    counts = Counter(f"w:{t}" for t in tokens)
+    for token in tokens:
+        padded = f" {token} "
+        counts.update(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return counts
+
+
+class SimilarityIndex:
+    """
+    Remembers answered prompts per kind ('translate', 'suggest') and returns the
+    answer of the most similar previous prompt with the same key terms when it
+    scores above threshold. Entries are stored in SQLite so they survive between runs.
+    """
+
+    def __init__(self, path, threshold=SIMILARITY_THRESHOLD, expiry=24 * 60 * 60):
+        self.threshold = threshold
+        self.expiry = expiry
+        self._lock = threading.Lock()
+        self._entries = []  # (kind, prompt, key terms, features, answer)
+        self._vectors = None  # lazily computed TF-IDF vectors with their norms
+        self._idf = {}
+        self._db = None
+        try:
+            self._db = sqlite3.connect(path, timeout=2, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS prompts ("
+                "kind TEXT NOT NULL, prompt TEXT NOT NULL, answer TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (kind, prompt))"
+            )
+            self._db.execute("DELETE FROM prompts WHERE created < ?", (time.time() - expiry,))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT kind, prompt, answer FROM prompts ORDER BY created DESC LIMIT ?", (MAX_ENTRIES,)
+            ).fetchall()
+        except sqlite3.Error:
+            self._db = None
+            rows = []
+        for kind, prompt, answer in rows:
+            self._append(kind, prompt, answer)
+
+    def _append(self, kind, prompt, answer):
+        tokens = normalize(prompt)
+        if tokens:
+            self._entries.append((kind, prompt, key_terms(tokens), features(tokens), answer))
+            self._vectors = None
+
+    def _build_vectors(self):
+        doc_freq = Counter()
+        for entry in self._entries:
+            doc_freq.update(entry[3].keys())
+        total = len(self._entries)
+        self._idf = {term: math.log((total + 1) / (df + 1)) + 1 for term, df in doc_freq.items()}
+        self._vectors = []
+        for entry in self._entries:
+            vector = {term: count * self._idf[term] for term, count in entry[3].items()}
+            self._vectors.append((vector, math.sqrt(sum(v * v for v in vector.values()))))
+
+    def lookup(self, kind, prompt):
+        """
+        Returns (answer, score, matched prompt) for the best match above threshold,
+        or (None, best score, None).
+        """
+        tokens = normalize(prompt)
+        if not tokens:
+            return None, 0.0, None
+        terms = key_terms(tokens)
+        with self._lock:
+            if self._vectors is None:
+                self._build_vectors()
+            query = {term: count * self._idf.get(term, 1.0) for term, count in features(tokens).items()}
+            query_norm = math.sqrt(sum(v * v for v in query.values()))
+            best, best_score = None, 0.0
+            for entry, (vector, norm) in zip(self._entries, self._vectors):
+                if entry[0] != kind or entry[2] != terms or not norm:
+                    continue
+                score = sum(weight * vector.get(term, 0.0) for term, weight in query.items()) / (query_norm * norm)
+                if score > best_score:
+                    best, best_score = entry, score
+        if best is not None and best_score >= self.threshold:
+            return best[4], best_score, best[1]
+        return None, best_score, None
+
+    def add(self, kind, prompt, answer):
+        """Records an answered prompt (answer must be a string, e.g. JSON)."""
+        with self._lock:
+            self._append(kind, prompt, answer)
+            if len(self._entries) > MAX_ENTRIES:
+                del self._entries[:len(self._entries) - MAX_ENTRIES]
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO prompts (kind, prompt, answer, created) VALUES (?, ?, ?, ?)",
+                    (kind, prompt.lower().strip(), answer, time.time()),
+                )
+                self._db.commit()
+            except sqlite3.Error:
+                pass
+
+
+
+class LookupStats:
+    """
+    Counts cache lookup outcomes ('exact', 'similar', 'miss') per kind for the
+    --cache-stats report. Counting is in memory only, so a cache hit never waits
+    on SQLite; a background thread (and exit) adds the counts to the stats table
+    in one transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._writer = None
+
+    def record(self, kind, outcome):
+        with self._lock:
+            self._counts[(kind, outcome)] += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='lookup-stats-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=2)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS stats (kind TEXT NOT NULL, outcome TEXT NOT NULL, "
+            "count INTEGER NOT NULL, PRIMARY KEY (kind, outcome))"
+        )
+        return db
+
+    def flush(self):
+        """Adds the counts recorded since the last flush to the database."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return
+        try:
+            db = self._connect()
+            try:
+                with db:
+                    db.executemany(
+                        "INSERT INTO stats (kind, outcome, count) VALUES (?, ?, ?) "
+                        "ON CONFLICT(kind, outcome) DO UPDATE SET count = count + excluded.count",
+                        [(kind, outcome, count) for (kind, outcome), count in counts.items()],
+                    )
+            finally:
+                db.close()
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        """Returns {kind: {outcome: count}} accumulated across runs, including unflushed counts."""
+        self.flush()
+        result = {}
+        try:
+            db = self._connect()
+            try:
+                rows = db.execute("SELECT kind, outcome, count FROM stats").fetchall()
+            finally:
+                db.close()
+        except sqlite3.Error:
+            return {}
+        for kind, outcome, count in rows:
+            result.setdefault(kind, {})[outcome] = count
+        return result
@@ -0,0 +1,177 @@
+import math
+import os
+import threading
+import time
+
+# Lightweight per-phase latency tracing. Code wraps phases in
+#     with tracing.span('model.generate') as sp:
+#         ...
+#         sp.set(status=200)
+# When tracing is off span() returns a shared no-op object, so the cost is one
+# global lookup and a function call. When it is on (--profile, or
+# COMMANDIFY_TRACE=1 for unattended collection) spans are kept in memory and
+# written at exit as a Chrome trace (chrome://tracing, Perfetto) that
+# aggregate() can combine across many runs and machines.
+
+TRACE_DIR = os.environ.get('COMMANDIFY_TRACE_DIR')  # default: <cache dir>/traces
+MAX_EVENTS = 100000  # a long-running daemon stops recording past this
+
+_enabled = os.environ.get('COMMANDIFY_TRACE') == '1'
+_events = []  # (name, start, end, thread id, args); list.append is atomic
+_thread_names = {}
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+    def mark(self, key):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """A timed phase; recorded when the with-block exits (with error=... if it raised)."""
+
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        record(self.name, self.start, time.time(), **self.args)
+        return False
+
+    def set(self, **args):
+        """Attaches extra attributes (status codes, sizes, cache outcome, ...)."""
+        self.args.update(args)
+
+    def mark(self, key):
+        """Records the milliseconds elapsed so far as attribute key (e.g. time to first chunk)."""
+        self.args.setdefault(key, round((time.time() - self.start) * 1000, 3))
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def span(name, **args):
+    """Context manager timing the enclosed block as name."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, args)
+
+
+def record(name, start, end, **args):
+    """Records a span measured elsewhere (e.g. interpreter startup, from process start times)."""
+    if not _enabled or len(_events) >= MAX_EVENTS:
+        return
+    thread = threading.current_thread()
+    _thread_names.setdefault(thread.ident, thread.name)
+    _events.append((name, start, end, thread.ident, args))
+
+
+def events():
+    """Returns the spans recorded so far as (name, start, end, thread id, args)."""
+    return list(_events)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values (0 < fraction <= 1)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(durations):
+    """Turns {name: [duration ms]} into {name: {count, total, p50, p95, p99, max}} (ms, rounded)."""
+    summary = {}
+    for name, values in durations.items():
+        summary[name] = {
+            'count': len(values),
+            'total': round(sum(values), 3),
+            'p50': round(percentile(values, 0.5), 3),
+            'p95': round(percentile(values, 0.95), 3),
+            'p99': round(percentile(values, 0.99), 3),
+            'max': round(max(values), 3),
+        }
+    return summary
+
+
+def summary():
+    """Per-span statistics for this process, in order of first occurrence."""
+    durations = {}
+    for name, start, end, _, _ in _events:
+        durations.setdefault(name, []).append((end - start) * 1000)
+    return summarize(durations)
+
+
+def chrome_trace(metadata=None):
+    """Returns this process's spans in Chrome trace-event format."""
+    pid = os.getpid()
+    trace_events = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+        for tid, name in _thread_names.items()
+    ]
+    for name, start, end, tid, args in _events:
+        trace_events.append({
+            'name': name, 'cat': name.split('.', 1)[0], 'ph': 'X', 'pid': pid, 'tid': tid,
+            'ts': round(start * 1e6), 'dur': round((end - start) * 1e6), 'args': args,
+        })
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms', 'metadata': metadata or {}}
+
+
+def trace_dir():
+    if TRACE_DIR:
+        return TRACE_DIR
+    from cache_store import get_cache_dir
+    return os.path.join(get_cache_dir(), 'traces')
+
+
+def write_trace(path=None, metadata=None):
+    """Writes the Chrome trace to path (default: a new file in trace_dir()) and returns the path."""
+    import json
+    if path is None:
+        directory = trace_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json")
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(metadata), f)
+    return path
+
+
+def aggregate(paths):
+    """Combines complete ('X') events from trace files into per-span percentiles (ms)."""
+    import json
+    durations = {}
+    for path in paths:
+        try:
+            with open(path) as f:
+                trace = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for event in trace.get('traceEvents', []):
+            if event.get('ph') == 'X':
+                durations.setdefault(event['name'], []).append(event.get('dur', 0) / 1000)
+    return summarize(durations)
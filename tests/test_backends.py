@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from backends import BackendResponseError, GeminiBackend, LocalServerBackend
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, events):
+        self.lines = [f"data: {json.dumps(event)}" if not isinstance(event, str) else event for event in events]
+        self.closed = False
+
+    def iter_lines(self, chunk_size=None, decode_unicode=False):
+        return iter(self.lines)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.headers = {}
+
+    def post(self, url, json=None, timeout=None, stream=False):
+        return self.response
+
+
+def local_chunks(*texts):
+    return [{'choices': [{'delta': {'content': text}}]} for text in texts] + ['data: [DONE]']
+
+
+def gemini_chunks(*texts):
+    return [{'candidates': [{'content': {'parts': [{'text': text}]}}]} for text in texts]
+
+
+@pytest.fixture(params=['local', 'gemini'])
+def streaming(request):
+    """Returns (backend, response) with the response's events serving 'a', 'b', 'c'."""
+    if request.param == 'local':
+        backend, response = LocalServerBackend(), FakeResponse(local_chunks('a', 'b', 'c'))
+    else:
+        backend, response = GeminiBackend(lambda: 'key'), FakeResponse(gemini_chunks('a', 'b', 'c'))
+    backend.session = FakeSession(response)
+    return backend, response
+
+
+def test_stream_closes_the_response_when_done(streaming):
+    backend, response = streaming
+    assert list(backend.stream('hi')) == ['a', 'b', 'c']
+    assert response.closed
+
+
+def test_stream_closes_the_response_when_abandoned(streaming):
+    backend, response = streaming
+    chunks = backend.stream('hi')
+    assert next(chunks) == 'a'
+    assert not response.closed
+    chunks.close()
+    assert response.closed
+
+
+def test_stream_closes_the_response_on_a_bad_event():
+    backend = LocalServerBackend()
+    response = FakeResponse(local_chunks('a')[:1] + ['data: {not json'])
+    backend.session = FakeSession(response)
+    with pytest.raises(BackendResponseError):
+        list(backend.stream('hi'))
+    assert response.closed
@@ -0,0 +1,66 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+import batch
+
+
+@pytest.fixture
+def translations(monkeypatch):
+    """Fake get_linux_command: "slow ..." answers after 0.2 s, "fail ..." raises; returns the calls."""
+    calls = []
+    lock = threading.Lock()
+
+    def get_linux_command(text):
+        with lock:
+            calls.append(text)
+        if text.startswith('slow'):
+            time.sleep(0.2)
+        if text.startswith('fail'):
+            raise RuntimeError('no command')
+        return f"cmd for {text}"
+
+    monkeypatch.setattr(batch, 'get_linux_command', get_linux_command)
+    return calls
+
+
+def run(lines, **kwargs):
+    output = io.StringIO()
+    summary = batch.run_batch(lines, output, **kwargs)
+    return [json.loads(line) for line in output.getvalue().splitlines()], summary
+
+
+def test_read_items():
+    lines = ['list files\n', '\n', '# comment\n', '{"id": "x", "text": "show disk"}\n',
+             '{"prompt": "count lines"}\n', '{not json\n']
+    assert batch.read_items(lines) == [(1, 'list files'), ('x', 'show disk'), (5, 'count lines'), (6, '{not json')]
+
+
+def test_input_order_is_kept(translations):
+    records, summary = run(['slow one', 'fast two', 'fast three'], jobs=3)
+    assert [r['input'] for r in records] == ['slow one', 'fast two', 'fast three']
+    assert [r['command'] for r in records] == ['cmd for slow one', 'cmd for fast two', 'cmd for fast three']
+    assert summary['items'] == 3 and summary['errors'] == 0
+
+
+def test_completion_order(translations):
+    records, _ = run(['slow one', 'fast two'], jobs=2, order='completion')
+    assert [r['input'] for r in records] == ['fast two', 'slow one']
+
+
+def test_duplicates_are_translated_once(translations):
+    records, summary = run(['List files', 'list   FILES', 'show disk'], jobs=2)
+    assert sorted(translations) == ['List files', 'show disk']
+    assert [r.get('duplicate', False) for r in records] == [False, True, False]
+    assert records[1]['command'] == 'cmd for List files'
+    assert (summary['items'], summary['unique']) == (3, 2)
+
+
+def test_errors_are_reported_per_item(translations):
+    records, summary = run(['fail here', 'list files'], jobs=2)
+    assert records[0] == {'id': 1, 'input': 'fail here', 'error': 'no command'}
+    assert records[1]['command'] == 'cmd for list files'
+    assert summary['errors'] == 1
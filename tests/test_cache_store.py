@@ -0,0 +1,70 @@
+import time
+
+from cache_store import PersistentCache
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = PersistentCache(str(tmp_path / 'cache.db'), max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # a is now more recent than b
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c'), len(cache)) == (1, 3, 2)
+
+
+def test_evicts_by_size(tmp_path):
+    cache = PersistentCache(str(tmp_path / 'cache.db'), max_bytes=25)
+    cache.set('a', 'x' * 10)  # 12 bytes of JSON
+    cache.set('b', 'y' * 10)
+    cache.set('c', 'z' * 10)
+    assert cache.get('a') is None
+    assert cache.get('c') == 'z' * 10
+    cache.set('big', 'w' * 30)  # larger than the whole cache: not stored, nothing evicted
+    assert cache.get('big') is None
+    assert cache.get('b') == 'y' * 10
+
+
+def test_recency_survives_reopening(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = PersistentCache(path, max_entries=2)
+    cache.set('a', 1)
+    time.sleep(0.01)
+    cache.set('b', 2)
+    time.sleep(0.01)
+    cache.get('a')
+    reopened = PersistentCache(path, max_entries=2)
+    reopened.set('c', 3)
+    assert (reopened.get('a'), reopened.get('b'), reopened.get('c')) == (1, None, 3)
+
+
+def test_expiry(tmp_path):
+    cache = PersistentCache(str(tmp_path / 'cache.db'), expiry=0.05)
+    cache.set('a', 1)
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_memory_fallback_evicts_too(tmp_path):
+    cache = PersistentCache(str(tmp_path / 'missing' / 'cache.db'), max_entries=1)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert (cache.get('a'), cache.get('b')) == (None, 2)
+
+
+def test_items_by_prefix_without_touching_recency(tmp_path):
+    cache = PersistentCache(str(tmp_path / 'cache.db'), max_entries=2)
+    cache.set('translate:a', 'ls')
+    cache.set('suggest:b', [['ls', 'list']])
+    assert cache.items('translate:') == [('translate:a', 'ls')]
+    cache.set('translate:c', 'pwd')  # items() did not refresh translate:a, so it is evicted
+    assert cache.get('translate:a') is None
+
+
+def test_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = PersistentCache(path), PersistentCache(path)
+    first.set('k', {'cmd': 'ls'})
+    assert second.get('k') == {'cmd': 'ls'}
+    assert len(second) == 1
@@ -0,0 +1,54 @@
+import json
+import os
+
+from command_index import CommandIndex, load_path_executables
+
+
+def make_executable(directory, name, mode=0o755):
+    path = directory / name
+    path.write_text('#!/bin/sh\n')
+    os.chmod(str(path), mode)
+    return path
+
+
+def test_prefix_lookups():
+    index = CommandIndex(['ls', 'lsblk', 'lsof', 'git', 'grep', 'ls', 'l'])
+    assert index.complete('ls') == ['ls', 'lsblk', 'lsof']
+    assert index.complete('ls', limit=2) == ['ls', 'lsblk']
+    assert index.complete('g') == ['git', 'grep']
+    assert index.complete('x') == []
+    assert index.complete('') == ['git', 'grep', 'l', 'ls', 'lsblk', 'lsof']
+    assert 'lsof' in index and 'lso' not in index
+    assert len(index) == 6
+
+
+def test_scan_only_executables(tmp_path):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    make_executable(bin_dir, 'tool')
+    make_executable(bin_dir, 'notes.txt', mode=0o644)
+    make_executable(bin_dir, '.hidden')
+    (bin_dir / 'subdir').mkdir()
+    names = load_path_executables(str(tmp_path / 'path_index.json'), [str(bin_dir), str(tmp_path / 'missing')])
+    assert names == {'tool'}
+
+
+def test_unchanged_directories_come_from_the_saved_scan(tmp_path):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    make_executable(bin_dir, 'tool')
+    cache_path = str(tmp_path / 'path_index.json')
+    load_path_executables(cache_path, [str(bin_dir)])
+
+    # A saved scan with a matching mtime is trusted without reading the directory
+    with open(cache_path) as f:
+        saved = json.load(f)
+    saved[str(bin_dir)]['names'] = ['from-cache']
+    with open(cache_path, 'w') as f:
+        json.dump(saved, f)
+    assert load_path_executables(cache_path, [str(bin_dir)]) == {'from-cache'}
+
+    # Installing a program changes the directory's mtime, so it is rescanned
+    make_executable(bin_dir, 'newtool')
+    os.utime(str(bin_dir), ns=(0, saved[str(bin_dir)]['mtime'] + 1))
+    assert load_path_executables(cache_path, [str(bin_dir)]) == {'tool', 'newtool'}
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+from prompt_toolkit.document import Document
+
+import completer
+from completer import CommandifyCompleter, LatestOnlyWorker
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_worker_runs_only_the_latest_job():
+    worker = LatestOnlyWorker(delay=0.05)
+    ran = []
+    for name in ('a', 'ab', 'abc'):
+        worker.submit(lambda generation, name=name: ran.append(name))
+    assert wait_for(lambda: ran)
+    time.sleep(0.1)
+    assert ran == ['abc']
+
+
+def test_newer_job_makes_the_running_one_stale():
+    worker = LatestOnlyWorker(delay=0)
+    started, release, seen = threading.Event(), threading.Event(), []
+
+    def slow(generation):
+        started.set()
+        release.wait(2)
+        seen.append(worker.is_current(generation))
+
+    worker.submit(slow)
+    assert started.wait(2)
+    worker.submit(lambda generation: None)
+    release.set()
+    assert wait_for(lambda: seen) and seen == [False]
+
+
+class FakeIndex:
+    def __init__(self, names):
+        self.names = names
+
+    def complete(self, prefix, limit=None):
+        return [name for name in self.names if name.startswith(prefix)][:limit]
+
+
+@pytest.fixture
+def make_completer():
+    def make(local=None, describe=None):
+        refreshed = threading.Event()
+        instance = CommandifyCompleter(FakeIndex(['grep', 'grepdiff', 'grex']),
+                                       lambda names: {name: local[name] for name in names if name in (local or {})},
+                                       describe=describe, on_refresh=refreshed.set)
+        instance._worker.delay = 0
+        instance.refreshed = refreshed
+        return instance
+    return make
+
+
+def complete(instance, text):
+    return list(instance.get_completions(Document(text), None))
+
+
+def test_command_names_never_ask_the_model(make_completer):
+    asked = []
+    instance = make_completer(local={'grep': 'print matching lines'},
+                              describe=lambda names, cancelled: asked.append(names) or {})
+    assert [c.text for c in complete(instance, 'gre')] == ['grep', 'grepdiff', 'grex']
+    assert instance.refreshed.wait(2)
+    assert asked == []
+    assert instance.descriptions == {'grep': 'print matching lines'}
+
+
+def test_arguments_of_a_picked_command_ask_the_model(make_completer):
+    asked = []
+
+    def describe(names, cancelled):
+        asked.append(names)
+        return {name: f"about {name}" for name in names}
+
+    instance = make_completer(local={'ls -a': 'do not ignore entries starting with .'}, describe=describe)
+    assert [c.text for c in complete(instance, 'ls ')] == ['-a', '-l', '-lh', '--help']
+    assert instance.refreshed.wait(2)
+    assert asked == [['ls -l', 'ls -lh', 'ls --help'][:completer.MAX_MODEL_LOOKUPS]]
+    assert instance.descriptions['ls -a'] == 'do not ignore entries starting with .'
+    assert instance.descriptions['ls -l'] == 'about ls -l'
+
+
+def test_newer_keystroke_cancels_model_lookups(make_completer):
+    started, checks = threading.Event(), []
+
+    def describe(names, cancelled):
+        started.set()
+        assert wait_for(cancelled)
+        checks.append(cancelled())
+        return {}
+
+    instance = make_completer(describe=describe)
+    complete(instance, 'ls ')
+    assert started.wait(2)
+    complete(instance, 'ls -')
+    assert wait_for(lambda: checks) and checks == [True]
@@ -0,0 +1,110 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import daemon
+from daemon import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'answer'
+
+    def caller():
+        results.append(flights.do('key', work))
+
+    leader = threading.Thread(target=caller)
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=caller) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.1)  # let the followers reach do() while the leader's call is in flight
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: not r[1]) == [('answer', True)] + [('answer', False)] * 3
+
+
+def test_error_reaches_every_caller_and_key_is_released():
+    flights = SingleFlight()
+
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError, match='boom'):
+        flights.do('key', fail)
+    assert flights.do('key', lambda: 'again') == ('again', True)
+
+
+def test_different_keys_run_separately():
+    flights = SingleFlight()
+    assert flights.do('a', lambda: 1) == (1, True)
+    assert flights.do('b', lambda: 2) == (2, True)
+
+
+@pytest.fixture
+def fake_daemon(tmp_path, monkeypatch):
+    """Serves canned reply lines on the daemon socket; returns the list of requests it received."""
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setenv('COMMANDIFY_CACHE_DIR', str(tmp_path))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(daemon.socket_path())
+    server.listen(1)
+    received, replies = [], {}
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn, conn.makefile('rwb') as stream:
+                message = json.loads(stream.readline())
+                received.append(message)
+                for reply in replies.get(message['op'], []):
+                    stream.write(json.dumps(reply).encode('utf-8') + b'\n')
+                stream.flush()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield replies, received
+    server.close()
+
+
+def test_client_without_daemon_returns_none(tmp_path, monkeypatch):
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setenv('COMMANDIFY_CACHE_DIR', str(tmp_path))
+    assert daemon.request('translate', 'list files') is None
+
+
+def test_client_streams_chunks_then_result(fake_daemon):
+    replies, received = fake_daemon
+    replies['translate'] = [{'chunk': 'l'}, {'chunk': 'ls'}, {'result': 'ls -la'}]
+    chunks = []
+    assert daemon.request('translate', 'list files', on_chunk=chunks.append) == 'ls -la'
+    assert chunks == ['l', 'ls']
+    assert received == [{'op': 'translate', 'text': 'list files', 'stream': True}]
+
+
+def test_client_failed_request_raises(fake_daemon):
+    replies, _ = fake_daemon
+    replies['translate'] = [{'error': 'quota exceeded', 'failed': True}]
+    with pytest.raises(daemon.RemoteError, match='quota exceeded'):
+        daemon.request('translate', 'list files')
+
+
+def test_client_falls_back_when_the_daemon_cannot_handle_it(fake_daemon):
+    replies, _ = fake_daemon
+    replies['history'] = [{'error': 'unknown op'}]
+    assert daemon.request('history', 'list files') is None
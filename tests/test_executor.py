@@ -0,0 +1,82 @@
+import os
+import subprocess
+
+import pytest
+
+import executor
+from executor import OutputSpool, TailBuffer, needs_pty, run_command
+
+
+def test_tail_buffer_keeps_only_the_end():
+    tail = TailBuffer(max_bytes=8)
+    tail.write(b'hello ')
+    tail.write(b'world!')
+    assert tail.text() == 'o world!'
+
+
+def test_spool_moves_large_output_to_a_file():
+    spool = OutputSpool(threshold=10)
+    spool.write(b'12345')
+    assert spool.path is None
+    spool.write(b'67890abc')
+    spool.write(b'def')
+    spool.close()
+    try:
+        with open(spool.path, 'rb') as f:
+            assert f.read() == b'1234567890abcdef'
+    finally:
+        os.unlink(spool.path)
+
+
+def test_small_output_is_not_spooled():
+    spool = OutputSpool(threshold=10)
+    spool.write(b'short')
+    spool.close()
+    assert spool.path is None
+
+
+@pytest.mark.parametrize('cmd, expected', [
+    ('top', True),
+    ('sudo vim /etc/hosts', True),
+    ('ls | less', True),
+    ('EDITOR=nano crontab -e', True),
+    ('ls -la', False),
+    ('grep top file.txt', False),
+])
+def test_needs_pty(cmd, expected):
+    assert needs_pty(cmd) is expected
+
+
+def test_streams_output_and_exit_code():
+    out, err = [], []
+    result = run_command('echo out; echo err >&2; exit 3', on_stdout=out.append, on_stderr=err.append,
+                         pty_mode=False, stdin=subprocess.DEVNULL)
+    assert result.returncode == 3 and not result.success
+    assert ''.join(out) == 'out\n' and ''.join(err) == 'err\n'
+    assert result.error_output == 'err\n'
+    assert result.spool_path is None
+    assert result.duration > 0
+
+
+def test_error_output_falls_back_to_stdout():
+    result = run_command('echo only-stdout; false', pty_mode=False, stdin=subprocess.DEVNULL)
+    assert result.returncode == 1
+    assert result.error_output == 'only-stdout\n'
+
+
+def test_command_not_found_exit_code():
+    result = run_command('surely-not-a-command-xyz', pty_mode=False, stdin=subprocess.DEVNULL)
+    assert result.returncode == 127
+    assert 'not found' in result.stderr_tail
+
+
+def test_large_output_keeps_a_bounded_tail_and_spools():
+    result = run_command('seq 1 300000', pty_mode=False, stdin=subprocess.DEVNULL)  # about 2 MB
+    try:
+        assert result.success
+        assert len(result.stdout_tail) <= executor.TAIL_BYTES
+        assert result.stdout_tail.endswith('299999\n300000\n')
+        with open(result.spool_path) as f:
+            assert f.read().splitlines() == [str(i) for i in range(1, 300001)]
+    finally:
+        os.unlink(result.spool_path)
@@ -0,0 +1,79 @@
+import sqlite3
+import time
+
+import pytest
+
+import history
+from history import HistoryStore, prompt_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / 'history.db'))
+
+
+def record_all(store, *rows):
+    for prompt, command, exit_status in rows:
+        store.record(prompt, command, exit_status, 0.1)
+        time.sleep(0.002)  # distinct creation times
+    store.flush()
+
+
+def test_prompt_key():
+    assert prompt_key('  List   ALL files, please! ') == 'list all files please'
+
+
+def test_lookup_offers_the_latest_successful_run(store):
+    record_all(store, ('list files', 'ls', 0), ('List files!', 'ls -la', 0), ('list files', 'ls -R', 2))
+    found = store.lookup('LIST FILES')
+    assert (found['command'], found['exit_status'], found['runs']) == ('ls -la', 0, 1)
+    assert store.lookup('show disk') is None
+
+
+def test_failed_runs_are_never_offered(store):
+    record_all(store, ('remove tmp', 'rm -r /tmp/x', 1))
+    assert store.lookup('remove tmp') is None
+
+
+def test_runs_count_repeats_of_the_same_command(store):
+    record_all(store, ('list files', 'ls', 0), ('list files', 'ls', 0))
+    assert store.lookup('list files')['runs'] == 2
+
+
+def test_rows_are_written_in_one_flush(store, tmp_path):
+    store.record('list files', 'ls', 0, 0.1)
+    store.record('show disk', 'df -h', 0, 0.2)
+    reader = sqlite3.connect(str(tmp_path / 'history.db'))
+    assert reader.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 0
+    store.flush()
+    assert reader.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 2
+
+
+def test_full_batch_is_written_without_waiting(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(history, 'FLUSH_INTERVAL', 60.0)
+    monkeypatch.setattr(history, 'FLUSH_BATCH', 2)
+    reader = sqlite3.connect(str(tmp_path / 'history.db'))
+    store.record('list files', 'ls', 0, 0.1)
+    store.record('show disk', 'df -h', 0, 0.2)
+    deadline = time.monotonic() + 2
+    while reader.execute("SELECT COUNT(*) FROM history").fetchone()[0] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert reader.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 2
+
+
+def test_search_matches_word_prefixes(store):
+    record_all(store, ('compress the logs', 'tar czf logs.tgz logs', 0),
+               ('show disk usage', 'df -h', 0), ('compress images', 'mogrify -quality 80 *.jpg', 1))
+    assert [row['prompt'] for row in store.search('compr')] == ['compress images', 'compress the logs']
+    assert [row['command'] for row in store.search('tar logs')] == ['tar czf logs.tgz logs']
+
+
+def test_search_without_fts(store):
+    store.fts = False
+    record_all(store, ('show disk usage', 'df -h', 0))
+    assert [row['command'] for row in store.search('disk')] == ['df -h']
+
+
+def test_recent_prompts_are_distinct_newest_first(store):
+    record_all(store, ('list files', 'ls', 0), ('show disk', 'df -h', 0), ('List files', 'ls -la', 0))
+    assert store.recent_prompts() == [('List files', 'ls -la'), ('show disk', 'df -h')]
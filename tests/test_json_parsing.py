@@ -0,0 +1,76 @@
+import pytest
+
+from backends import StubBackend
+from gemini_api import JSONListParser, extract_json, validate_suggestions
+
+
+def test_extract_json_skips_prose_and_fences():
+    text = 'Here you go:\n```json\n[{"cmd": "ls", "desc": "list"}]\n```'
+    assert extract_json(text, '[') == [{'cmd': 'ls', 'desc': 'list'}]
+
+
+def test_extract_json_brackets_inside_strings():
+    text = 'note [not json] then {"steps": [{"cmd": "[ -f x ] && echo {ok}"}]}'
+    assert extract_json(text, '{') == {'steps': [{'cmd': '[ -f x ] && echo {ok}'}]}
+    assert extract_json(text, '[') == [{'cmd': '[ -f x ] && echo {ok}'}]
+
+
+def test_extract_json_without_json():
+    with pytest.raises(ValueError):
+        extract_json('no json here', '[')
+
+
+def test_list_parser_yields_objects_as_they_complete():
+    parser = JSONListParser()
+    assert parser.feed('Sure: [{"cmd": "ls"}, {"cmd": "l') == [{'cmd': 'ls'}]
+    assert parser.feed('s -la"}') == [{'cmd': 'ls -la'}]
+    assert parser.feed(']') == []
+    assert parser.objects == [{'cmd': 'ls'}, {'cmd': 'ls -la'}]
+
+
+def test_list_parser_one_character_at_a_time():
+    text = '[{"cmd": "echo \\"}]\\"", "desc": "braces } and ] in strings"}, {"cmd": "a", "x": {"y": 1}}]'
+    parser = JSONListParser()
+    for ch in text:
+        parser.feed(ch)
+    assert parser.objects == [{'cmd': 'echo "}]"', 'desc': 'braces } and ] in strings'},
+                              {'cmd': 'a', 'x': {'y': 1}}]
+
+
+def test_list_parser_stops_at_end_of_list():
+    parser = JSONListParser()
+    assert parser.feed('[{"cmd": "ls"}] and then {"cmd": "rm"}') == [{'cmd': 'ls'}]
+
+
+def test_validate_suggestions():
+    assert validate_suggestions([{'cmd': ' ls ', 'desc': 'list'}, {'cmd': 'pwd'}]) == [('ls', 'list'), ('pwd', '')]
+    with pytest.raises(ValueError, match='expected a JSON list'):
+        validate_suggestions({'cmd': 'ls'})
+    with pytest.raises(ValueError, match='item 1'):
+        validate_suggestions([{'cmd': 'ls'}, {'desc': 'no command'}])
+
+
+@pytest.fixture
+def gemini_api(tmp_path, monkeypatch):
+    import gemini_api
+    monkeypatch.setenv('COMMANDIFY_CACHE_DIR', str(tmp_path))
+    for name in ('SUGGESTIONS_CACHE', '_SIMILARITY_INDEX', '_LOOKUP_STATS'):
+        monkeypatch.setattr(gemini_api, name, None)
+    monkeypatch.setattr(gemini_api, '_BACKENDS', {})
+    monkeypatch.setattr(gemini_api, 'model_allowed', lambda: True)
+    return gemini_api
+
+
+def test_complete_objects_are_salvaged_without_a_request(gemini_api):
+    backend = StubBackend(lambda prompt: '[{"cmd": "ls", "desc": "list"}, {"cmd": "l')
+    gemini_api.set_backend(backend)
+    assert gemini_api.get_command_suggestions('list my files please') == [('ls', 'list')]
+    assert len(backend.prompts) == 1
+
+
+def test_invalid_answer_is_repaired_once(gemini_api):
+    answers = iter(['[{"command": "ls"}]', '[{"cmd": "ls", "desc": "list"}]'])
+    backend = StubBackend(lambda prompt: next(answers))
+    gemini_api.set_backend(backend)
+    assert gemini_api.get_command_suggestions('list my files please') == [('ls', 'list')]
+    assert len(backend.prompts) == 2 and 'item 0 has no "cmd" string' in backend.prompts[1]
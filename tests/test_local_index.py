@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+import time
+
+from local_index import DescriptionIndex, write_index
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def test_index_round_trip(tmp_path):
+    path = str(tmp_path / 'descriptions.idx')
+    entries = {'ls': 'list directory contents', 'ls -l': 'use a long listing format', 'grep': 'print lines'}
+    write_index(path, entries, 42)
+    index = DescriptionIndex(path)
+    assert (index.signature, index.count) == (42, 3)
+    assert {name: index.get(name) for name in entries} == entries
+    assert index.get('l') is None and index.get('zzz') is None
+
+
+def test_missing_or_foreign_file_is_empty(tmp_path):
+    assert DescriptionIndex(str(tmp_path / 'missing.idx')).get('ls') is None
+    other = tmp_path / 'other.idx'
+    other.write_bytes(b'x' * 64)
+    assert DescriptionIndex(str(other)).count == 0
+
+
+def test_background_rebuild_does_not_delay_exit(tmp_path):
+    # Every command takes 30 s to describe; the process must still exit right away
+    script = (
+        "import time, local_index\n"
+        "local_index.collect_descriptions = lambda cmd: time.sleep(30) or {}\n"
+        "local_index.get_index()\n"
+        "time.sleep(0.2)\n"
+    )
+    env = dict(os.environ, COMMANDIFY_CACHE_DIR=str(tmp_path), PYTHONPATH=SRC)
+    start = time.monotonic()
+    subprocess.run([sys.executable, '-c', script], env=env, timeout=20, check=True)
+    assert time.monotonic() - start < 5
@@ -0,0 +1,92 @@
+import json
+import time
+
+import pytest
+
+import metering
+from metering import Meter, parse_budgets, prometheus_text
+
+
+@pytest.fixture
+def store(tmp_path):
+    return str(tmp_path / 'metrics.json')
+
+
+def test_parse_budgets():
+    assert parse_budgets('alice=200000, bob=50000,bad,carol=x,=5') == {'alice': 200000, 'bob': 50000}
+    assert parse_budgets(None) == {}
+
+
+def test_usage_is_recorded_per_path_and_model(store, monkeypatch):
+    monkeypatch.setitem(metering.PRICES, 'm', (1.0, 2.0))
+    meter = Meter(store, user='alice')
+    with metering.path('translate'):
+        meter.record_usage('m', 1000, 500)
+        meter.record_error('m')
+    meter.record_cache_hit('exact', code_path='translate')
+    meter.record_usage('m', 10, 0)
+    meter.flush()
+    data = json.load(open(store))
+    assert data['series']['translate\tm'] == {'calls': 1, 'prompt_tokens': 1000, 'response_tokens': 500,
+                                              'errors': 1, 'cost_usd': pytest.approx(0.002)}
+    assert data['series']['other\tm']['prompt_tokens'] == 10
+    assert data['cache_hits'] == {'translate\texact': 1}
+    assert data['daily']['alice'][time.strftime('%Y-%m-%d')] == 1510
+
+
+def test_processes_add_up(store):
+    first, second = Meter(store, user='alice'), Meter(store, user='alice')
+    with metering.path('plan'):
+        first.record_usage('m', 100, 10)
+        second.record_usage('m', 200, 20)
+    first.flush()
+    second.flush()
+    first.flush()  # nothing new: must not count twice
+    data = json.load(open(store))
+    assert data['series']['plan\tm']['calls'] == 2
+    assert data['series']['plan\tm']['prompt_tokens'] == 300
+    assert data['daily']['alice'][time.strftime('%Y-%m-%d')] == 330
+
+
+def test_old_days_are_dropped(store, monkeypatch):
+    monkeypatch.setattr(metering, 'KEEP_DAYS', 2)
+    with open(store, 'w') as f:
+        json.dump({'daily': {'alice': {'2000-01-01': 5, '2000-01-02': 7}}}, f)
+    meter = Meter(store, user='alice')
+    meter.record_usage('m', 1, 1)
+    meter.flush()
+    assert sorted(json.load(open(store))['daily']['alice']) == ['2000-01-02', time.strftime('%Y-%m-%d')]
+
+
+def test_budget_counts_flushed_and_pending_tokens(store, monkeypatch):
+    monkeypatch.setattr(metering, 'USER_BUDGETS', {'alice': 1000})
+    monkeypatch.setattr(metering, 'DAILY_TOKENS', 0)
+    other = Meter(store, user='alice')
+    other.record_usage('m', 600, 0)
+    other.flush()
+    meter = Meter(store, user='alice')
+    assert meter.tokens_today() == 600 and not meter.budget_exceeded()
+    meter.record_usage('m', 300, 100)
+    assert meter.tokens_today() == 1000 and meter.budget_exceeded()
+    assert Meter(store, user='bob').budget() == 0
+    assert not Meter(store, user='bob').budget_exceeded()
+
+
+def test_daily_budget_applies_to_everyone_else(store, monkeypatch):
+    monkeypatch.setattr(metering, 'USER_BUDGETS', {'alice': 1000})
+    monkeypatch.setattr(metering, 'DAILY_TOKENS', 50)
+    assert Meter(store, user='bob').budget() == 50
+    assert Meter(store, user='alice').budget() == 1000
+
+
+def test_prometheus_text():
+    data = {'series': {'translate\tm': {'calls': 2, 'prompt_tokens': 10, 'response_tokens': 5, 'errors': 0,
+                                        'cost_usd': 0.1234567}},
+            'cache_hits': {'suggest\texact': 3},
+            'daily': {'al"ice': {time.strftime('%Y-%m-%d'): 15}}}
+    text = prometheus_text(data, 'al"ice', budget=100)
+    assert 'commandify_model_calls_total{user="al\\"ice",path="translate",model="m"} 2' in text
+    assert 'commandify_cost_usd_total{user="al\\"ice",path="translate",model="m"} 0.123457' in text
+    assert 'commandify_cache_hits_total{user="al\\"ice",path="suggest",source="exact"} 3' in text
+    assert 'commandify_tokens_today{user="al\\"ice"} 15' in text
+    assert 'commandify_daily_token_budget{user="al\\"ice"} 100' in text
@@ -0,0 +1,101 @@
+import pytest
+
+from planner import MAX_STEPS, parse_plan, run_plan
+
+
+def step(step_id, after=(), cmd='true'):
+    return {'id': step_id, 'cmd': cmd, 'desc': '', 'after': list(after)}
+
+
+def test_dependency_order():
+    steps = parse_plan({'steps': [step('c', ['a', 'b']), step('b', ['a']), step('a')]})
+    assert [s.id for s in steps] == ['a', 'b', 'c']
+    assert steps[2].after == ['a', 'b']
+
+
+def test_default_ids_and_stripped_fields():
+    steps = parse_plan({'steps': [{'cmd': ' ls '}, {'cmd': 'pwd', 'desc': ' where ', 'after': [1]}]})
+    assert [(s.id, s.cmd, s.desc, s.after) for s in steps] == [('1', 'ls', '', []), ('2', 'pwd', 'where', ['1'])]
+
+
+@pytest.mark.parametrize('plan, message', [
+    ({}, 'no steps'),
+    ({'steps': []}, 'no steps'),
+    ({'steps': [step(str(i)) for i in range(MAX_STEPS + 1)]}, 'at most'),
+    ({'steps': [{'id': 'a'}]}, 'no "cmd"'),
+    ({'steps': [step('a'), step('a')]}, 'duplicate'),
+    ({'steps': [step('a', ['b'])]}, 'unknown step'),
+    ({'steps': [step('a', ['a'])]}, 'itself'),
+    ({'steps': [step('a', ['b']), step('b', ['a'])]}, 'cycle'),
+    ({'steps': [{'id': 'a', 'cmd': 'ls', 'after': 'b'}]}, 'must be a list'),
+])
+def test_invalid_plans(plan, message):
+    with pytest.raises(ValueError, match=message):
+        parse_plan(plan)
+
+
+def plan(*steps):
+    return parse_plan({'steps': list(steps)})
+
+
+def events(steps, workers=4, **kwargs):
+    seen = []
+    result = run_plan(steps, workers, on_status=lambda s: seen.append((s.id, s.status)), **kwargs)
+    return result, seen
+
+
+def test_failure_skips_dependents_only():
+    steps = plan(step('a', cmd='false'), step('b', ['a']), step('c', ['b']), step('d'))
+    result, _ = events(steps)
+    assert {s.id: s.status for s in result.steps} == {'a': 'failed', 'b': 'skipped', 'c': 'skipped', 'd': 'ok'}
+    assert not result.success
+
+
+def test_steps_are_running_only_once_a_worker_takes_them():
+    steps = plan(step('a', cmd='sleep 0.2'), step('b', cmd='sleep 0.2'))
+    result, seen = events(steps, workers=1)
+    assert result.success
+    assert seen == [('a', 'running'), ('a', 'ok'), ('b', 'running'), ('b', 'ok')]
+
+
+def test_step_that_raises_is_failed_and_its_dependents_skipped(monkeypatch):
+    import planner
+
+    def run_command(cmd, *args, **kwargs):
+        if cmd == 'boom':
+            raise ValueError('cannot run boom')
+        return real_run_command(cmd, *args, **kwargs)
+
+    real_run_command = planner.run_command
+    monkeypatch.setattr(planner, 'run_command', run_command)
+    steps = plan(step('a', cmd='boom'), step('b', ['a']), step('c'))
+    result, seen = events(steps)
+    assert {s.id: s.status for s in result.steps} == {'a': 'failed', 'b': 'skipped', 'c': 'ok'}
+    assert steps[0].error == 'cannot run boom' and steps[0].result is None
+    assert ('b', 'skipped') in seen
+
+
+def test_output_arrives_in_whole_lines():
+    steps = plan(step('a', cmd="printf 'one\\ntw'; printf 'o\\nthree'"))
+    lines = []
+    run_plan(steps, on_output=lambda s, text, is_stderr: lines.append((s.id, text, is_stderr)))
+    assert ''.join(text for _, text, _ in lines) == 'one\ntwo\nthree\n'
+    assert all(text.endswith('\n') for _, text, _ in lines)
+
+
+@pytest.mark.parametrize('args', [[], ['--workers', 'x', 'copy files'], ['--workers', '0', 'copy files']])
+def test_plan_arguments_are_checked(args, capsys):
+    import main
+    with pytest.raises(SystemExit) as exit_info:
+        main.plan_main(args)
+    assert exit_info.value.code == 2
+    assert 'usage: commandify --plan' in capsys.readouterr().err
+
+
+def test_plan_arguments(monkeypatch):
+    import main
+    calls = []
+    monkeypatch.setattr(main, 'plan_mode', lambda text, workers: calls.append((text, workers)) or True)
+    assert main.plan_main(['back', 'up', '--workers', '3', 'my', 'files']) == 0
+    assert main.plan_main(['list', 'files']) == 0
+    assert calls == [('back up my files', 3), ('list files', None)]
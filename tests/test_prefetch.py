@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+import metering
+from backends import StubBackend
+
+
+@pytest.fixture
+def main(monkeypatch):
+    import main
+    monkeypatch.setattr(main, 'USE_DAEMON', False)
+    return main
+
+
+def test_cancel_within_the_delay_sends_nothing(main):
+    calls = []
+    prefetch = main.Prefetch(lambda *args, **kwargs: calls.append(args), 'x', delay=0.2)
+    prefetch.cancel()
+    assert prefetch.result(timeout=2) is None
+    assert prefetch.done() and calls == []
+
+
+def test_func_sees_cancellation(main):
+    started, seen = threading.Event(), []
+    release = threading.Event()
+
+    def func(text, cancelled):
+        started.set()
+        release.wait(2)
+        seen.append(cancelled())
+        return [('ls', 'list')]
+
+    prefetch = main.Prefetch(func, 'x', delay=0)
+    assert started.wait(2)
+    prefetch.cancel()
+    release.set()
+    assert prefetch.result(timeout=2) is None
+    assert seen == [True]
+
+
+def test_result_is_metered_as_prefetch(main):
+    paths = []
+    prefetch = main.Prefetch(lambda cancelled: paths.append(metering.current_path()) or 'done', delay=0)
+    assert prefetch.result(timeout=2) == 'done'
+    assert paths == ['prefetch:other']
+
+
+def test_speculative_prefixes_cache_hits():
+    meter = metering.Meter(user='test')
+    with metering.speculative('prefetch'), metering.path('suggest.fallback'):
+        assert metering.current_path() == 'prefetch:suggest.fallback'
+        meter.record_cache_hit('exact', code_path='suggest')
+    assert metering.current_path() == 'other'
+    assert meter._cache_hits == {('prefetch:suggest', 'exact'): 1}
+
+
+class StreamingStub(StubBackend):
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = chunks
+        self.closed = False
+
+    def stream(self, prompt, timeout=None, schema=None, deadline=None):
+        try:
+            for chunk in self.chunks:
+                yield chunk
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def gemini_api(tmp_path, monkeypatch):
+    import gemini_api
+    monkeypatch.setenv('COMMANDIFY_CACHE_DIR', str(tmp_path))
+    for name in ('SUGGESTIONS_CACHE', '_SIMILARITY_INDEX', '_LOOKUP_STATS'):
+        monkeypatch.setattr(gemini_api, name, None)
+    monkeypatch.setattr(gemini_api, '_BACKENDS', {})
+    monkeypatch.setattr(gemini_api, 'model_allowed', lambda: True)
+    return gemini_api
+
+
+def test_cancelled_stream_is_closed_and_not_cached(gemini_api):
+    backend = StreamingStub(['[{"cmd": "ls", "desc": "list"},', ' {"cmd": "ls -a", "desc": "all"}]'])
+    gemini_api.set_backend(backend)
+    updates = []
+    result = gemini_api.get_command_suggestions('list my files please', on_update=updates.append,
+                                                cancelled=lambda: bool(updates))
+    assert result == [] and backend.closed
+    assert gemini_api.get_cache().get('suggest:list my files please') is None
+
+
+def test_cancelled_before_the_request_sends_nothing(gemini_api):
+    backend = StubBackend(lambda prompt: '[{"cmd": "ls", "desc": "list"}]')
+    gemini_api.set_backend(backend)
+    assert gemini_api.get_command_suggestions('list my files please', cancelled=lambda: True) == []
+    assert backend.prompts == []
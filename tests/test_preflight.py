@@ -0,0 +1,121 @@
+import pytest
+
+from preflight import analyze, suggest_binary
+
+EXECUTABLES = {'ls', 'rm', 'bash', 'sh', 'apt', 'echo', 'git', 'dd', 'mkfs.ext4', 'find', 'systemctl', 'grep'}
+
+
+def kinds(command):
+    return [finding.kind for finding in analyze(command, EXECUTABLES).findings]
+
+
+@pytest.mark.parametrize('command', [
+    'rm -rf /',
+    'rm -rf ~',
+    'sudo rm -rf /*',
+    'rm -r --no-preserve-root /',
+    'dd if=/dev/zero of=/dev/sda',
+    'mkfs.ext4 /dev/sdb1',
+    'git reset --hard HEAD~3',
+    'find . -name "*.log" -delete',
+    'ls && rm -rf ~/*',
+    'bash -c "rm -rf /"',
+    "sh -c 'rm -rf /'",
+    'sudo sh -c "rm -rf /"',
+    'env FOO=1 bash -lc "rm -rf /"',
+    'bash -c "sh -c \'rm -rf /\'"',
+    'eval "rm -rf /"',
+])
+def test_destructive(command):
+    assert 'destructive' in kinds(command)
+
+
+@pytest.mark.parametrize('command', [
+    'rm -rf build',
+    'ls -la',
+    'git status',
+    'echo "rm -rf /"',
+    'grep -r "rm -rf /" .',
+    'bash script.sh',
+    'bash -c "ls -la"',
+    'dd if=/dev/zero of=/dev/null',
+])
+def test_safe(command):
+    assert kinds(command) == []
+
+
+@pytest.mark.parametrize('command', [
+    'apt install vim',
+    'systemctl restart nginx',
+    'bash -c "apt install vim"',
+    'echo 1 > /etc/motd',
+])
+def test_privileged(command):
+    assert 'privileged' in kinds(command)
+
+
+@pytest.mark.parametrize('command', [
+    'sudo apt install vim',
+    'systemctl --user restart syncthing',
+    'sudo bash -c "apt install vim"',
+])
+def test_not_privileged(command):
+    assert 'privileged' not in kinds(command)
+
+
+def test_missing_tool():
+    analysis = analyze('gti status | grep main', EXECUTABLES)
+    assert [(finding.kind, finding.stage.binary) for finding in analysis.findings] == [('missing', 'gti')]
+    assert suggest_binary('gti', EXECUTABLES) == ['git']
+
+
+def test_missing_tool_inside_shell_payload():
+    assert kinds('bash -c "gti status"') == ['missing']
+
+
+def test_missing_path(tmp_path):
+    assert kinds(str(tmp_path / 'nope')) == ['missing']
+
+
+def test_builtins_and_assignments_are_not_missing():
+    assert kinds('cd /tmp && FOO=1 ls') == []
+
+
+def test_unbalanced_quotes():
+    assert kinds("echo 'unterminated") == ['syntax']
+
+
+@pytest.mark.parametrize('command', [
+    'echo $((1+2))',
+    'x=$((5*3)); echo $x',
+    'echo $(( (1+2)*3 ))',
+    '((i++))',
+    '(( x > 2 )) && echo y',
+    'for ((i=0; i<3; i++)); do echo $i; done',
+    'arr=(a b c); echo ${arr[@]}',
+    'f() { ls; }; f',
+    'sudo !!',
+    'echo !$',
+    '!-2',
+])
+def test_shell_syntax_is_not_a_missing_tool(command):
+    assert kinds(command) == []
+
+
+@pytest.mark.parametrize('command, binaries', [
+    ('echo $(ls /tmp)', ['echo', 'ls']),
+    ('(cd /tmp && ls)', ['cd', 'ls']),
+    ('echo `grep x y`', ['echo', 'grep']),
+    ('echo "$((2*3)) $(ls)"', ['echo', 'ls']),
+])
+def test_substitutions_and_subshells_are_checked(command, binaries):
+    assert [stage.binary for stage in analyze(command, EXECUTABLES).stages] == binaries
+
+
+@pytest.mark.parametrize('command', ['echo $(gti)', 'echo "$(gti)"', 'echo `gti`', '(gti status)'])
+def test_missing_tool_inside_substitution(command):
+    assert kinds(command) == ['missing']
+
+
+def test_destructive_inside_substitution():
+    assert 'destructive' in kinds('echo "`rm -rf /`"')
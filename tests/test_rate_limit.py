@@ -0,0 +1,72 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+import rate_limit
+from rate_limit import TokenBucket, backoff_delay, retry_after_seconds
+
+
+def test_bucket_allows_a_burst_then_waits():
+    bucket = TokenBucket(600, burst=2)  # 10 requests per second
+    assert bucket.acquire(0) and bucket.acquire(0)
+    assert not bucket.acquire(0)
+    start = time.monotonic()
+    assert bucket.acquire(1)
+    assert 0.05 < time.monotonic() - start < 0.5
+
+
+def test_bucket_gives_up_past_the_timeout():
+    bucket = TokenBucket(6, burst=1)  # one request every 10 seconds
+    assert bucket.acquire(0)
+    start = time.monotonic()
+    assert not bucket.acquire(0.1)
+    assert time.monotonic() - start < 0.1  # fails at once instead of sleeping first
+
+
+def test_penalize_halves_the_rate_down_to_a_floor():
+    bucket = TokenBucket(60)
+    bucket.penalize()
+    assert bucket.rate == pytest.approx(0.5)
+    for _ in range(10):
+        bucket.penalize()
+    assert bucket.rate == pytest.approx(1 / 16)
+
+
+def test_reward_recovers_up_to_the_budget():
+    bucket = TokenBucket(60)
+    bucket.penalize()
+    bucket.reward()
+    assert bucket.rate == pytest.approx(0.55)
+    for _ in range(20):
+        bucket.reward()
+    assert bucket.rate == 1.0
+
+
+@pytest.mark.parametrize('headers, body, expected', [
+    ({'Retry-After': '7'}, '', 7.0),
+    ({'Retry-After': '-3'}, '', 0.0),
+    ({}, '{"error": {"details": [{"retryDelay": "12.5s"}]}}', 12.5),
+    ({'Retry-After': 'soon'}, '', None),
+    (None, '', None),
+])
+def test_retry_after_seconds(headers, body, expected):
+    assert retry_after_seconds(headers, body) == expected
+
+
+def test_retry_after_http_date():
+    delay = retry_after_seconds({'Retry-After': formatdate(time.time() + 30, usegmt=True)})
+    assert 25 < delay <= 30
+
+
+def test_backoff_is_jittered_and_capped():
+    for attempt in range(8):
+        delays = [backoff_delay(attempt) for _ in range(50)]
+        limit = min(rate_limit.MAX_BACKOFF, rate_limit.BACKOFF_BASE * 2 ** attempt)
+        assert all(0 <= delay <= limit for delay in delays)
+    assert len({backoff_delay(3) for _ in range(20)}) > 1
+
+
+def test_backoff_follows_the_server_hint():
+    assert 4.0 <= backoff_delay(0, retry_after=4.0) <= 4.0 + rate_limit.BACKOFF_BASE
+    assert backoff_delay(0, retry_after=3600) == rate_limit.MAX_BACKOFF
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+import routing
+from backends import Backend, BackendError
+from routing import HedgedBackend, LatencyTracker
+
+
+def test_percentile_needs_enough_samples():
+    tracker = LatencyTracker()
+    for _ in range(routing.MIN_SAMPLES - 1):
+        tracker.record('m', 0.1)
+    assert tracker.percentile('m', 0.95) is None
+    tracker.record('m', 1.0)
+    assert tracker.percentile('m', 0.95) == 1.0
+    assert tracker.percentile('m', 0.5) == 0.1
+
+
+def test_window_keeps_the_latest_samples():
+    tracker = LatencyTracker(window=routing.MIN_SAMPLES)
+    for seconds in [5.0] * routing.MIN_SAMPLES + [0.2] * routing.MIN_SAMPLES:
+        tracker.record('m', seconds)
+    assert tracker.percentile('m', 1.0) == 0.2
+
+
+def test_save_merges_with_other_processes(tmp_path):
+    path = str(tmp_path / 'latency.json')
+    first, second = LatencyTracker(path=path), LatencyTracker(path=path)
+    first.record('a', 0.5)
+    second.record('b', 0.25)
+    first.save()
+    second.save()
+    assert routing.read_windows(path) == {'a': [0.5], 'b': [0.25]}
+    assert list(LatencyTracker(path=path)._window('a')) == [0.5]
+
+
+class SlowFirst(Backend):
+    """Answers the first request after first_delay seconds and later ones at once."""
+
+    name = 'Slow'
+    model = 'slow'
+
+    def __init__(self, first_delay=0.5, fail=False):
+        self.first_delay = first_delay
+        self.fail = fail
+        self.calls = 0
+        self.closed = []
+        self.streams = []
+        self._lock = threading.Lock()
+
+    def _number(self):
+        with self._lock:
+            self.calls += 1
+            return self.calls
+
+    def generate(self, prompt, timeout=None, schema=None, deadline=None):
+        number = self._number()
+        if number == 1:
+            time.sleep(self.first_delay)
+        if self.fail:
+            raise BackendError(f"failure {number}")
+        return f"answer {number}"
+
+    def stream(self, prompt, timeout=None, schema=None, deadline=None):
+        chunks = self._chunks(self._number())
+        self.streams.append(chunks)  # kept alive, so only an explicit close() closes them
+        return chunks
+
+    def _chunks(self, number):
+        try:
+            if number == 1:
+                time.sleep(self.first_delay)
+            yield f"answer {number}"
+            yield "more"
+        finally:
+            self.closed.append(number)
+
+
+def test_fast_request_is_not_hedged():
+    backend = HedgedBackend(SlowFirst(first_delay=0), budget=1.0, tracker=LatencyTracker())
+    assert backend.generate('hi') == 'answer 1'
+    assert backend.stats() == {'requests': 1, 'hedges': 0, 'hedge_wins': 0}
+
+
+def test_slow_request_is_hedged_and_the_duplicate_wins():
+    backend = HedgedBackend(SlowFirst(), budget=0.05, tracker=LatencyTracker())
+    assert backend.generate('hi') == 'answer 2'
+    assert backend.stats() == {'requests': 1, 'hedges': 1, 'hedge_wins': 1}
+
+
+def test_both_failing_raises_the_first_error():
+    backend = HedgedBackend(SlowFirst(first_delay=0.2, fail=True), budget=0.05, tracker=LatencyTracker())
+    with pytest.raises(BackendError, match='failure 2'):
+        backend.generate('hi')
+
+
+def test_hedges_are_capped():
+    backend = HedgedBackend(SlowFirst(first_delay=0), budget=0.0, tracker=LatencyTracker(), max_ratio=0.0)
+    backend.hedges = 1  # the one hedge allowed with max_ratio 0 is used up
+    assert backend.generate('hi') == 'answer 1'
+    assert backend.hedges == 1
+
+
+def test_losing_stream_is_closed():
+    inner = SlowFirst(first_delay=0.2)
+    backend = HedgedBackend(inner, budget=0.05, tracker=LatencyTracker())
+    assert list(backend.stream('hi')) == ['answer 2', 'more']
+    deadline = time.monotonic() + 2
+    while len(inner.closed) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(inner.closed) == [1, 2]
+
+
+def test_abandoned_stream_is_closed():
+    inner = SlowFirst(first_delay=0)
+    backend = HedgedBackend(inner, budget=1.0, tracker=LatencyTracker())
+    chunks = backend.stream('hi')
+    assert next(chunks) == 'answer 1'
+    chunks.close()
+    assert inner.closed == [1]
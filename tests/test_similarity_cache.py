@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from similarity_cache import LookupStats, SimilarityIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SimilarityIndex(str(tmp_path / 'similar.db'), threshold=0.8)
+
+
+def test_rewording_matches(index):
+    index.add('translate', 'check disk space', 'df -h')
+    answer, score, prompt = index.lookup('translate', 'show the disk space')
+    assert (answer, prompt) == ('df -h', 'check disk space')
+    assert score >= 0.8
+
+
+def test_kinds_are_separate(index):
+    index.add('suggest', 'check disk space', '[]')
+    assert index.lookup('translate', 'check disk space')[0] is None
+
+
+@pytest.mark.parametrize('earlier, now', [
+    ('stop nginx', 'start nginx'),
+    ('uninstall docker', 'install docker'),
+    ('enable the firewall', 'disable the firewall'),
+    ('add user bob', 'add user alice'),
+    ('delete files older than 7 days', 'delete files older than 30 days'),
+    ('show hidden files', 'do not show hidden files'),
+    ('find large files', 'delete large files'),
+    ('list files', 'remove files'),
+])
+def test_different_requests_never_match(index, earlier, now):
+    index.add('translate', earlier, 'cmd')
+    answer, _, prompt = index.lookup('translate', now)
+    assert (answer, prompt) == (None, None)
+
+
+def test_threshold(tmp_path):
+    strict = SimilarityIndex(str(tmp_path / 'similar.db'), threshold=1.01)
+    strict.add('translate', 'check disk space', 'df -h')
+    answer, score, _ = strict.lookup('translate', 'disk space')
+    assert answer is None and 0.8 < score <= 1.0 + 1e-9
+
+
+def test_entries_persist(tmp_path):
+    path = str(tmp_path / 'similar.db')
+    SimilarityIndex(path).add('translate', 'check disk space', 'df -h')
+    assert SimilarityIndex(path).lookup('translate', 'display disk space')[0] == 'df -h'
+
+
+def test_lookup_counts_stay_in_memory_until_flushed(tmp_path):
+    path = str(tmp_path / 'similar.db')
+    counts = LookupStats(path)
+    counts.record('translate', 'exact')
+    counts.record('translate', 'exact')
+    counts.record('suggest', 'miss')
+    assert not os.path.exists(path)
+    counts.flush()
+    assert LookupStats(path).stats() == {'translate': {'exact': 2}, 'suggest': {'miss': 1}}
+
+
+def test_lookup_counts_add_up_across_processes(tmp_path):
+    path = str(tmp_path / 'similar.db')
+    first, second = LookupStats(path), LookupStats(path)
+    first.record('translate', 'miss')
+    first.flush()
+    second.record('translate', 'miss')
+    second.record('translate', 'similar')
+    assert second.stats() == {'translate': {'miss': 2, 'similar': 1}}  # stats() includes unflushed counts
+
+
+@pytest.fixture
+def gemini_api(tmp_path, monkeypatch):
+    import gemini_api
+    monkeypatch.setenv('COMMANDIFY_CACHE_DIR', str(tmp_path))
+    for name in ('SUGGESTIONS_CACHE', '_SIMILARITY_INDEX', '_LOOKUP_STATS'):
+        monkeypatch.setattr(gemini_api, name, None)
+    return gemini_api
+
+
+def test_exact_hit_does_not_open_the_similarity_index(gemini_api, tmp_path):
+    gemini_api.get_cache().set('translate:list files', 'ls')
+    assert gemini_api.get_linux_command('list files') == 'ls'
+    assert gemini_api._SIMILARITY_INDEX is None
+    assert not (tmp_path / 'similarity.db').exists()
+    assert gemini_api.get_lookup_stats().stats() == {'translate': {'exact': 1}}